@@ -3,17 +3,20 @@ import os
 
 import click
 
-from panto.config import (ANTHROPIC_API_KEY, ANTHROPIC_MODEL, DB_URI, GPT_MAX_TOKENS,
-                          OPENAI_API_KEY, OPENAI_MODEL)
+from panto.config import DB_URI
 from panto.logging import log
 from panto.ops.pr_review_actions import PRActions
 from panto.services.config_storage.config_storage import create_config_storage_service
+from panto.services.git.git_cat_file import GitCatFileReader
 from panto.services.git.git_service import GitService, create_git_service
 from panto.services.git.git_service_types import GitServiceType
-from panto.services.llm.llm_service import LLMService, LLMServiceType, create_llm_service
+from panto.services.llm.cassette import RecordingLLMService, ReplayLLMService
+from panto.services.llm.llm_service import LLMService, LLMServiceType
+from panto.services.llm.registry import LLMServiceRegistry
 from panto.services.metrics.metrics import MetricsCollectionType, create_metrics_service
 from panto.services.notification import create_notification_service
 from panto.services.notification.notification import NotificationServiceType
+from panto.utils.http import SharedClientSession, SharedLLMHttpClient
 from panto.utils.misc import ssh_to_http_url
 
 # sample config
@@ -29,7 +32,16 @@ def make_sync(func):
   @functools.wraps(func)
   def wrapper(*args, **kwargs):
     import asyncio
-    return asyncio.run(func(*args, **kwargs))
+
+    async def run():
+      try:
+        return await func(*args, **kwargs)
+      finally:
+        await SharedClientSession.close()
+        await SharedLLMHttpClient.close()
+        await GitCatFileReader.close_all()
+
+    return asyncio.run(run())
 
   return wrapper
 
@@ -54,37 +66,24 @@ async def _init_gitsrv(gitsrv_type: GitServiceType,
   return gitsrv
 
 
-async def _init_llmsrv(llm_type: LLMServiceType) -> LLMService:
-  if llm_type == LLMServiceType.NOOP:
-    llmsrv = await create_llm_service(service_name=llm_type)
-  elif llm_type == LLMServiceType.OPENAI:
-    llmsrv = await create_llm_service(
-      service_name=llm_type,
-      max_tokens=GPT_MAX_TOKENS,
-      api_key=OPENAI_API_KEY,
-      model=OPENAI_MODEL,
-    )
-  elif llm_type == LLMServiceType.ANTHROPIC:
-    llmsrv = await create_llm_service(
-      service_name=llm_type,
-      api_key=ANTHROPIC_API_KEY,
-      model=ANTHROPIC_MODEL,
-    )
-  else:
-    raise NotImplementedError(f"Unsupported llm_type: {llm_type}")
-
-  return llmsrv
-
-
 async def run_review(repo_ssh_url,
                      pr_no,
                      feature_branch,
                      base_branch,
                      llm_type=LLMServiceType.NOOP,
-                     gitsrv_type=GitServiceType.LOCAL):
+                     gitsrv_type=GitServiceType.LOCAL,
+                     record_cassette: str | None = None,
+                     replay_cassette: str | None = None,
+                     replay_latency: float = 0.0):
   notification_srv = create_notification_service(NotificationServiceType.NOOP)
   gitsrv = await _init_gitsrv(gitsrv_type, repo_ssh_url, feature_branch, base_branch)
-  llmsrv = await _init_llmsrv(llm_type)
+  llmsrv: LLMService
+  if replay_cassette:
+    llmsrv = ReplayLLMService(replay_cassette, latency_scale=replay_latency)
+  else:
+    llmsrv = await LLMServiceRegistry.get(llm_type)
+    if record_cassette:
+      llmsrv = RecordingLLMService(llmsrv, record_cassette)
   repo_http_url = ssh_to_http_url(repo_ssh_url)
   repo_ssh_url = repo_ssh_url
   comment_body = "review"
@@ -132,9 +131,19 @@ def cli():
   type=click.Choice(GitServiceType),  # type: ignore
   default=GitServiceType.LOCAL,
   help='Git Service Type')
+@click.option('--record-cassette', default=None, help='Record the LLM calls to this file')
+@click.option('--replay-cassette',
+              default=None,
+              help='Answer the LLM calls from this recorded file, offline')
+@click.option('--replay-latency',
+              default=0.0,
+              type=float,
+              help='Replay the recorded LLM latency scaled by this factor (0 = instant)')
 @make_sync
-async def review(repo, pr_no, feature_branch, base_branch, llmsrv_type, gitsrv_type):
-  await run_review(repo, pr_no, feature_branch, base_branch, llmsrv_type, gitsrv_type)
+async def review(repo, pr_no, feature_branch, base_branch, llmsrv_type, gitsrv_type,
+                 record_cassette, replay_cassette, replay_latency):
+  await run_review(repo, pr_no, feature_branch, base_branch, llmsrv_type, gitsrv_type,
+                   record_cassette, replay_cassette, replay_latency)
 
 
 @cli.command()
@@ -50,6 +50,63 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
 DEFAULT_REVIEW_LLM_SRV = os.getenv('DEFAULT_REVIEW_LLM_SRV') or 'OPENAI'
 
+# LLM routing Configs (e.g. OPENAI,ANTHROPIC, in order of preference; empty = only the default)
+LLM_ROUTING_BACKENDS = [
+  b.strip().upper() for b in (os.getenv('LLM_ROUTING_BACKENDS') or '').split(',') if b.strip()
+]
+LLM_ROUTING_ERROR_THRESHOLD = float(os.getenv('LLM_ROUTING_ERROR_THRESHOLD') or 0.5)
+LLM_ROUTING_MIN_SAMPLES = int(os.getenv('LLM_ROUTING_MIN_SAMPLES') or 5)
+LLM_ROUTING_COOLDOWN = int(os.getenv('LLM_ROUTING_COOLDOWN') or 30)  # seconds
+
+# LLM client Configs (shared pooled httpx client for LLM APIs)
+LLM_HTTP_POOL_LIMIT = int(os.getenv('LLM_HTTP_POOL_LIMIT') or 50)
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT') or 10)
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT') or 120)  # max gap between streamed chunks
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES') or 2)
+LLM_HTTP2 = (os.getenv('LLM_HTTP2') or 'true').lower() in TRUTH_VALUES  # needs the h2 package
+# usage comes from the provider, tokenize prompts locally only to split system/user tokens exactly
+LLM_EXACT_TOKEN_SPLIT = (os.getenv('LLM_EXACT_TOKEN_SPLIT') or 'false').lower() in TRUTH_VALUES
+
+# LLM scheduler Configs (per minute budgets of the configured model, 0 = unlimited)
+OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT') or 0)
+OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT') or 0)
+ANTHROPIC_RPM_LIMIT = int(os.getenv('ANTHROPIC_RPM_LIMIT') or 0)
+ANTHROPIC_TPM_LIMIT = int(os.getenv('ANTHROPIC_TPM_LIMIT') or 0)
+LLM_BUDGET_WORKERS = max(int(os.getenv('LLM_BUDGET_WORKERS') or 1), 1)  # processes sharing them
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv('LLM_EXPECTED_OUTPUT_TOKENS') or 1024)
+
+# LLM batch Configs (auto reviews through the providers' batch apis: cheaper, answers in hours)
+LLM_BATCH_AUTO_REVIEW = (os.getenv('LLM_BATCH_AUTO_REVIEW') or 'false').lower() in TRUTH_VALUES
+LLM_BATCH_BACKEND = (os.getenv('LLM_BATCH_BACKEND') or 'provider').lower()  # provider or local
+LLM_BATCH_WINDOW = float(os.getenv('LLM_BATCH_WINDOW') or 5)  # seconds requests are collected
+LLM_BATCH_MAX_REQUESTS = int(os.getenv('LLM_BATCH_MAX_REQUESTS') or 1000)  # per batch
+LLM_BATCH_POLL_INTERVAL = float(os.getenv('LLM_BATCH_POLL_INTERVAL') or 60)  # seconds
+# seconds since submission, the 24h completion window of the providers plus a margin
+LLM_BATCH_MAX_AGE = float(os.getenv('LLM_BATCH_MAX_AGE') or 26 * 3600)
+LLM_BATCH_MAX_POLL_ERRORS = int(os.getenv('LLM_BATCH_MAX_POLL_ERRORS') or 10)  # in a row
+
+# LLM retry Configs (transient provider errors, on top of the SDK retries of a single request)
+LLM_RETRY_MAX_ATTEMPTS = max(int(os.getenv('LLM_RETRY_MAX_ATTEMPTS') or 3), 1)  # per call
+LLM_RETRY_BUDGET = int(os.getenv('LLM_RETRY_BUDGET')
+                       or 6)  # extra calls (retries, hedges) per review
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY') or 1)  # seconds
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY') or 30)  # seconds
+# duplicate a call still running past the p95 latency of its prompt size, first answer wins
+LLM_HEDGE_ENABLED = (os.getenv('LLM_HEDGE_ENABLED') or 'false').lower() in TRUTH_VALUES
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES') or 20)
+
+# Noop LLM simulator Configs (production like answers, latency and errors for load tests)
+LLM_SIM_ENABLED = (os.getenv('LLM_SIM_ENABLED') or 'false').lower() in TRUTH_VALUES
+LLM_SIM_ENCODING = os.getenv('LLM_SIM_ENCODING') or 'o200k_base'  # tiktoken encoding
+LLM_SIM_MAX_TOKENS = int(os.getenv('LLM_SIM_MAX_TOKENS') or 128000)
+LLM_SIM_TTFT_MS = float(os.getenv('LLM_SIM_TTFT_MS') or 600)  # mean, before prefill
+LLM_SIM_PREFILL_MS_PER_1K = float(os.getenv('LLM_SIM_PREFILL_MS_PER_1K') or 40)  # input tokens
+LLM_SIM_TOKEN_MS = float(os.getenv('LLM_SIM_TOKEN_MS') or 15)  # mean per output token
+LLM_SIM_JITTER = float(os.getenv('LLM_SIM_JITTER') or 0.4)  # sigma of the lognormal timings
+LLM_SIM_ERROR_RATE = float(os.getenv('LLM_SIM_ERROR_RATE') or 0)  # 500s
+LLM_SIM_RATE_LIMIT_RATE = float(os.getenv('LLM_SIM_RATE_LIMIT_RATE') or 0)  # 429s
+LLM_SIM_MAX_SUGGESTIONS = int(os.getenv('LLM_SIM_MAX_SUGGESTIONS') or 4)  # per call
+
 # GitHub Configs
 GH_APP_ID = os.getenv('GH_APP_ID')
 GH_APP_PRIVATE_KEY = _load_base64_key('GH_APP_PRIVATE_KEY_BASE64', required=False)
@@ -66,6 +123,33 @@ BITBUCKET_APP_KEY = os.getenv('BITBUCKET_APP_KEY')
 MY_GL_WEBHOOK_SECRET = os.getenv('MY_GL_WEBHOOK_SECRET')
 MY_GL_ACCESS_TOKEN = os.getenv('MY_GL_ACCESS_TOKEN')
 
+# HTTP client Configs (shared pooled session for provider APIs)
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT') or 100)
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST') or 20)
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL') or 300)
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv('HTTP_KEEPALIVE_TIMEOUT') or 30)
+HTTP_REQUEST_TIMEOUT = int(os.getenv('HTTP_REQUEST_TIMEOUT') or 60)
+HTTP_CACHE_SIZE = int(os.getenv('HTTP_CACHE_SIZE') or 2048)  # responses
+HTTP_CACHE_MAX_BODY_BYTES = int(os.getenv('HTTP_CACHE_MAX_BODY_BYTES') or 1024 * 1024)
+
+# Comment posting Configs (max inline comments in flight per provider)
+GH_COMMENT_POSTING_CONCURRENCY = int(os.getenv('GH_COMMENT_POSTING_CONCURRENCY') or 2)
+GL_COMMENT_POSTING_CONCURRENCY = int(os.getenv('GL_COMMENT_POSTING_CONCURRENCY') or 5)
+BITBUCKET_COMMENT_POSTING_CONCURRENCY = int(
+  os.getenv('BITBUCKET_COMMENT_POSTING_CONCURRENCY') or 5)
+COMMENT_POSTING_MAX_RETRIES = int(os.getenv('COMMENT_POSTING_MAX_RETRIES') or 3)
+COMMENT_POSTING_MAX_RETRY_WAIT = int(os.getenv('COMMENT_POSTING_MAX_RETRY_WAIT') or 60)
+
+# Rate limit Configs (share of the provider quota kept back for higher priority calls)
+RATE_LIMIT_NORMAL_RESERVE = float(os.getenv('RATE_LIMIT_NORMAL_RESERVE') or 0.05)
+RATE_LIMIT_OPTIONAL_RESERVE = float(os.getenv('RATE_LIMIT_OPTIONAL_RESERVE') or 0.2)
+RATE_LIMIT_MAX_WAIT = int(os.getenv('RATE_LIMIT_MAX_WAIT') or 60)  # seconds
+
+# Local git Configs (bare mirror per remote used by local/ci reviews)
+GIT_MIRROR_CACHE_DIR = os.getenv('GIT_MIRROR_CACHE_DIR') or os.path.join('tmp', 'mirrors')
+GIT_CAT_FILE_CACHE_SIZE = int(os.getenv('GIT_CAT_FILE_CACHE_SIZE') or 1024)  # files
+LOCAL_GIT_CLONE_STRATEGY = (os.getenv('LOCAL_GIT_CLONE_STRATEGY') or 'full').lower()
+
 # Optional Configs
 EXPANDED_DIFF_LINES = int(os.getenv('EXPANDED_DIFF_LINES') or 10)
 FF_ENABLE_AST_DIFF = os.getenv('FF_ENABLE_AST_DIFF', 'false').lower() in TRUTH_VALUES
@@ -74,6 +158,15 @@ LLM_TWO_WAY_CORRECTION_ENABLED = (os.getenv('LLM_TWO_WAY_CORRECTION_ENABLED')
 LLM_TWO_WAY_CORRECTION_THRESHOLD = int(os.getenv('LLM_TWO_WAY_CORRECTION_THRESHOLD') or 90)
 LLM_TWO_WAY_CORRECTION_SOFT_THRESHOLD = int(
   os.getenv('LLM_TWO_WAY_CORRECTION_SOFT_THRESHOLD') or 80)
+# cascade: files triaged as trivial (by heuristics, or a cheap model for the rest) skip the review
+LLM_TRIAGE_MODE = (os.getenv('LLM_TRIAGE_MODE') or 'off').lower()  # off, heuristic or llm
+LLM_TRIAGE_SRV = os.getenv('LLM_TRIAGE_SRV') or DEFAULT_REVIEW_LLM_SRV
+# a cheap model of the triage provider
+LLM_TRIAGE_MODEL = os.getenv('LLM_TRIAGE_MODEL') or {
+  'OPENAI': 'gpt-4o-mini',
+  'ANTHROPIC': 'claude-3-5-haiku-latest',
+}.get(LLM_TRIAGE_SRV.upper())
+LLM_TRIAGE_MAX_DIFF_LINES = int(os.getenv('LLM_TRIAGE_MAX_DIFF_LINES') or 40)  # per file
 LLM_LOG_INPUT_OUTPUT = (os.getenv('LLM_LOG_INPUT_OUTPUT') or 'false').lower() in TRUTH_VALUES
 LLM_LOG_USAGES = (os.getenv('LLM_LOG_USAGES') or 'false').lower() in TRUTH_VALUES
 LLM_LOG_PATH = os.getenv('LLM_LOG_PATH') or ''
@@ -108,6 +201,20 @@ PGPASSWORD = os.getenv("PGPASSWORD")
 DB_URI = f"postgresql+asyncpg://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}" \
             if PGHOST and PGPORT and PGDATABASE and PGUSER and PGPASSWORD else None
 
+# Review queue Configs (webhooks enqueue reviews, lease based workers run them)
+# e.g. sqlite+aiosqlite:///tmp/review_jobs.db on a single node; no store = run in process
+REVIEW_QUEUE_DB_URI = os.getenv('REVIEW_QUEUE_DB_URI') or DB_URI
+REVIEW_QUEUE_WORKERS = max(int(os.getenv('REVIEW_QUEUE_WORKERS') or 4), 1)  # jobs per process
+REVIEW_QUEUE_LEASE = int(os.getenv('REVIEW_QUEUE_LEASE') or 300)  # seconds, renewed while running
+REVIEW_QUEUE_MAX_ATTEMPTS = max(int(os.getenv('REVIEW_QUEUE_MAX_ATTEMPTS') or 3), 1)
+REVIEW_QUEUE_RETRY_DELAY = float(os.getenv('REVIEW_QUEUE_RETRY_DELAY')
+                                 or 30)  # doubled per attempt
+REVIEW_QUEUE_POLL_INTERVAL = float(os.getenv('REVIEW_QUEUE_POLL_INTERVAL') or 2)  # seconds
+# seconds, time waiting for llm batch answers excluded
+REVIEW_QUEUE_MAX_RUN_TIME = float(os.getenv('REVIEW_QUEUE_MAX_RUN_TIME') or 1800)
+# seconds done and failed jobs are kept for
+REVIEW_QUEUE_RETENTION = float(os.getenv('REVIEW_QUEUE_RETENTION') or 7 * 24 * 3600)
+
 DEFAULT_NOTIFICATION_SRV = os.getenv('DEFAULT_NOTIFICATION_SRV') or 'NOOP'
 DEFAULT_METRICS_COLLECTION_SRV = os.getenv('DEFAULT_METRICS_COLLECTION_SRV') or 'NOOP'
 DEFAULT_CONFIG_STORAGE_SRV = os.getenv('DEFAULT_CONFIG_STORAGE_SRV') or 'NOOP'
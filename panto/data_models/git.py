@@ -57,6 +57,12 @@ class CommentType(str, enum.Enum):
   GENERAL = "GENERAL"
 
 
+class GitFetchStats(BaseModel):
+  strategy: str
+  duration_ms: int
+  bytes: int  # growth of the object store, i.e. what the fetch transferred
+
+
 class PostedComment(BaseModel):
   id: str
   type: CommentType
@@ -13,3 +13,9 @@ class PRSuggestions(BaseModel):
   suggestions: list[Suggestion]
   level2_suggestions: list[Suggestion] | None = None
   review_comment: str
+
+
+class ReviewCheckpoint(BaseModel):
+  review_id: str
+  reviewed_to: str
+  pr_commits: list[str] | None = None
@@ -1,13 +1,17 @@
 from .base import Base
+from .llm_batch import LLMBatchRequestModel
 from .pr import PRModel, PRReviewModel, PRReviewStats
+from .review_job import ReviewJobModel
 from .token import TokenConsumption
 from .whitelistedaccount import WhitelistedAccount
 
 __all__ = [
   'Base',
+  'LLMBatchRequestModel',
   'PRModel',
   'PRReviewModel',
   'PRReviewStats',
+  'ReviewJobModel',
   'TokenConsumption',
   'WhitelistedAccount',
 ]
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped
+
+from .base import AuditMixin, Base
+
+
+class LLMBatchRequestModel(Base, AuditMixin):
+  __tablename__ = 'llm_batch_requests'
+  id: Mapped[str] = Column(String, primary_key=True, nullable=False)  # custom_id, prompt hash
+  provider = Column(String, nullable=False)
+  model = Column(String, nullable=False)
+  batch_id = Column(String, nullable=True)  # batch of the provider
+  status = Column(String, nullable=False)  # SUBMITTED, COMPLETED, FAILED
+  response = Column(Text, nullable=True)
+  input_tokens = Column(Integer, nullable=True)
+  output_tokens = Column(Integer, nullable=True)
+  error = Column(String, nullable=True)
+
+
+Index("idx_llm_batch_requests_batch_id", LLMBatchRequestModel.batch_id)
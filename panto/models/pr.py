@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Index, Integer, String
+from sqlalchemy import BigInteger, Column, Float, Index, Integer, String
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped
 
@@ -32,6 +32,7 @@ class PRReviewModel(Base, AuditMixin):
   review_type = Column(String, nullable=True)  # full, incremental
   reviewed_from = Column(String, nullable=True)  # sha
   reviewed_to = Column(String, nullable=True)  # sha
+  pr_commits = Column(JSONB, nullable=True)  # shas of the PR at reviewed_to
   unfiltered_review_count = Column(Integer, nullable=True)
   final_review_count = Column(Integer, nullable=True)
   lvl2_review_count = Column(Integer, nullable=True)
@@ -39,10 +40,23 @@ class PRReviewModel(Base, AuditMixin):
   review_user_token = Column(Integer, nullable=True)
   review_output_token = Column(Integer, nullable=True)
   review_latency = Column(Integer, nullable=True)
+  review_latency_ms = Column(Integer, nullable=True)  # summed over the calls
+  review_ttft_ms = Column(Integer, nullable=True)  # mean per call
+  review_queue_ms = Column(Integer, nullable=True)
+  review_overhead_ms = Column(Integer, nullable=True)
+  review_output_tps = Column(Float, nullable=True)
   correction_system_token = Column(Integer, nullable=True)
   correction_user_token = Column(Integer, nullable=True)
   correction_output_token = Column(Integer, nullable=True)
   correction_latency = Column(Integer, nullable=True)
+  correction_latency_ms = Column(Integer, nullable=True)
+  correction_ttft_ms = Column(Integer, nullable=True)
+  correction_queue_ms = Column(Integer, nullable=True)
+  correction_overhead_ms = Column(Integer, nullable=True)
+  correction_output_tps = Column(Float, nullable=True)
+  git_fetch_strategy = Column(String, nullable=True)  # local reviews only
+  git_fetch_ms = Column(Integer, nullable=True)
+  git_fetch_bytes = Column(BigInteger, nullable=True)
 
 
 class PRReviewDataModel(Base, AuditMixin):
@@ -0,0 +1,22 @@
+from sqlalchemy import JSON, Boolean, Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped
+
+from .base import AuditMixin, Base
+
+
+class ReviewJobModel(Base, AuditMixin):
+  __tablename__ = 'review_jobs'
+  id: Mapped[str] = Column(String, primary_key=True, nullable=False)
+  kind = Column(String, nullable=False)  # registered handler, e.g. github.pr_comment
+  # handler args (plain JSON, also stored in sqlite), dropped once the job is done or failed
+  payload = Column(JSON, nullable=True)
+  status = Column(String, nullable=False)  # QUEUED, RUNNING, DONE, FAILED
+  attempts = Column(Integer, nullable=False, default=0)
+  run_after = Column(DateTime(timezone=True), nullable=False)  # not picked up before
+  leased_by = Column(String, nullable=True)  # worker running it
+  lease_until = Column(DateTime(timezone=True), nullable=True)  # picked up again after
+  error = Column(Text, nullable=True)
+  posted = Column(Boolean, nullable=False, default=False)  # the review is on the PR, never rerun
+
+
+Index("idx_review_jobs_status_run_after", ReviewJobModel.status, ReviewJobModel.run_after)
@@ -1,21 +1,25 @@
+import asyncio
 import importlib
+import itertools
 import re
 import uuid
+from collections.abc import AsyncIterator
 from datetime import datetime
-from typing import TypedDict
 
 from openai import APIError as OpenAIAPIError
 
-from panto.config import (FF_ENABLE_AST_DIFF, LLM_TWO_WAY_CORRECTION_ENABLED,
+from panto.config import (FF_ENABLE_AST_DIFF, LLM_TRIAGE_MODE, LLM_TWO_WAY_CORRECTION_ENABLED,
                           LLM_TWO_WAY_CORRECTION_SOFT_THRESHOLD, LLM_TWO_WAY_CORRECTION_THRESHOLD,
                           jinja_env)
 from panto.data_models.git import GitPatchFile, GitPatchStatus, PRPatches
-from panto.data_models.pr_review import PRSuggestions, Suggestion
+from panto.data_models.pr_review import PRSuggestions, ReviewCheckpoint, Suggestion
 from panto.data_models.review_config import ConfigRule, ReviewConfig
 from panto.logging import log
 from panto.ops.misc import GitReviewFile, PantoReviewTool
+from panto.ops.review_triage import TriageDecision, heuristic_triage, llm_triage, record_triage
 from panto.services.git.git_service import GitService
 from panto.services.llm.llm_service import LLMService, LLMUsage
+from panto.services.llm.token_estimator import TokenEstimate
 from panto.services.notification import NotificationService
 from panto.utils.git import drop_empty_patches, omit_no_endlines_from_patch, parsed_hunk_to_string
 from panto.utils.misc import is_file_include, log_llm_io, log_llm_usage, restricted_extensions
@@ -43,6 +47,7 @@ class PRReview():
     expanded_diff_lines: int = 10,
     max_budget_token: int | None = None,
     review_tools: list[str] | None = None,
+    triage_llmsrv: LLMService | None = None,
   ) -> None:
     self.repo_name = repo_name
     self.pr_no = pr_no
@@ -56,17 +61,23 @@ class PRReview():
     self.pr_patches: PRPatches = None  # type: ignore
     self.max_budget_token = max_budget_token
     self.review_tools = review_tools
+    self.triage_llmsrv = triage_llmsrv
+    self._correction_calls = itertools.count()  # chunks are corrected concurrently
     n_repo = self.repo_name.replace("/", "__")
     self.req_id = f"{int(datetime.now().timestamp())}.{n_repo}.{self.pr_no}.{str(uuid.uuid4().hex)[-6:]}"  # noqa: E501
 
-  async def incremental_prepare(self):
-    base_commit = await self._get_last_reviewed_commit()
+  async def incremental_prepare(self, checkpoint: ReviewCheckpoint | None = None):
+    pr_head = await self.gitsrv.get_pr_head(self.pr_no)
+    if checkpoint:
+      base_commit = await self._resolve_checkpoint(checkpoint, pr_head)
+    else:
+      base_commit = await self._get_last_reviewed_commit()
+
     if not base_commit:
       log.info("No previous review found. Preparing from scratch")
-      self.prepare()
+      await self.prepare()
       return
 
-    pr_head = await self.gitsrv.get_pr_head(self.pr_no)
     if base_commit == pr_head:
       log.info("No new commits found. Skipping review")
       return
@@ -128,14 +139,106 @@ class PRReview():
 
   async def get_suggetions(
       self) -> tuple[PRSuggestions, list[Suggestion], list[LLMUsage], list[LLMUsage] | None]:
-    review_files = self.review_files
+    """
+      Runs the review tools and the correction of each chunk while the LLM still generates the
+      answers of the next chunks, so only the correction of the last chunk is left once the
+      review stream ends. Suggestions are deduplicated line by line as they stream in; tool
+      suggestions join the correction of the chunk of their file, so each file is still
+      corrected in one prompt.
+    """
+    unfiltered_suggestions: list[Suggestion] = []
+    review_usages: list[LLMUsage] = []
+    seen: set[str] = set()
+    tools_task = asyncio.create_task(self._timed_suggestions_from_tools())
+    corrections: list[asyncio.Task] = []
+    chunk_suggestions: list[Suggestion] = []
+    reviewed_files: set[str | None] = set()
+
+    async def correct(suggestions: list[Suggestion], files: set[str | None] | None):
+      tools_suggestions = (await asyncio.shield(tools_task))[0] or []
+      if files is None:
+        # the files no chunk reviewed, once the stream is over
+        files = {s.file_path for s in tools_suggestions} - reviewed_files
+      suggestions = suggestions + self._drop_duplicate_suggestions(
+        [s for s in tools_suggestions if s.file_path in files], seen)
+      if not suggestions:
+        return ([], [], []), None
+      return await self._refine_suggestions(suggestions)
+
+    try:
+      async for suggestions, chunk_files in self.stream_suggestions(review_usages):
+        unfiltered_suggestions.extend(suggestions)
+        chunk_suggestions += self._drop_duplicate_suggestions(suggestions, seen)
+        if chunk_files is not None:
+          # the chunk's answer is complete, files are in one chunk only
+          reviewed_files |= chunk_files
+          corrections.append(asyncio.create_task(correct(chunk_suggestions, chunk_files)))
+          chunk_suggestions = []
+
+      corrections.append(asyncio.create_task(correct([], None)))
+      tools_suggestions, tools_latency = await tools_task
+      unfiltered_suggestions.extend(tools_suggestions or [])
+      refined = await asyncio.gather(*corrections)
+    finally:
+      for task in [tools_task, *corrections]:
+        if not task.done():
+          task.cancel()
+
+    last_reviewed_commit = self.pr_patches.head
+
+    level1_refined_suggestions: list[Suggestion] = []
+    level2_refined_suggestions: list[Suggestion] = []
+    discarded_suggestions: list[Suggestion] = []
+    correction_llm_usages: list[LLMUsage] | None = None
+    for (level1, level2, discarded), usages in refined:
+      level1_refined_suggestions.extend(level1)
+      level2_refined_suggestions.extend(level2)
+      discarded_suggestions.extend(discarded)
+      if usages is not None:
+        correction_llm_usages = (correction_llm_usages or []) + usages
+
+    level1_count = len(level1_refined_suggestions)
+    level2_count = len(level2_refined_suggestions)
+    removed_count = len(discarded_suggestions)
+    tools_suggestions_count = len(tools_suggestions) if tools_suggestions else 0
+
+    log.info(f"Total: {len(unfiltered_suggestions)}"
+             f" -> Level1: {level1_count},"
+             f" Level2: {level2_count}, Removed: {removed_count}..."
+             f" Tools: {tools_suggestions_count}")
+
+    await self.notification_srv.emit_suggestions_generated(
+      repo_url=self.repo_name,
+      inital_count=len(unfiltered_suggestions),
+      final_count=level1_count,
+      level2_count=level2_count,
+      tools_count=tools_suggestions_count,
+      tools_latency=tools_latency,
+      request_id=self.req_id,
+    )
+
+    review_comment = f"Reviewed up to commit:{last_reviewed_commit}"
+
+    return PRSuggestions(
+      suggestions=level1_refined_suggestions,
+      level2_suggestions=level2_refined_suggestions,
+      review_comment=review_comment,
+    ), unfiltered_suggestions, review_usages, correction_llm_usages
+
+  async def stream_suggestions(
+    self, review_usages: list[LLMUsage]
+  ) -> AsyncIterator[tuple[list[Suggestion], set[str | None] | None]]:
+    """
+      Suggestions of the LLM, yielded as soon as their line of the answer is complete, with the
+      files of the chunk once its answer is complete (None before). Usages of the chunks are
+      appended to `review_usages`.
+    """
+    review_files = await self._triage_review_files(self.review_files)
     splited_files, tokens = await self._split_review_files(review_files)
 
     log.info(f"Total files chunk: {len(splited_files)}")
-    unfiltered_suggestions: list[Suggestion] = []
 
     i = -1
-    review_usages: list[LLMUsage] = []
     for chunk in splited_files:
       i += 1
       tokens_used = tokens[i]
@@ -152,20 +255,25 @@ class PRReview():
       )
 
       log.info("reviewing chunk files with LLM")
+      parser = SuggestionStreamParser()
+      stream = self.llmsrv.stream(system_prompt, user_prompt, temperature=0.2)
       try:
-        answer_str, review_usage = await self.llmsrv.ask(system_prompt,
-                                                         user_prompt,
-                                                         temperature=0.2)
+        async for text in stream:
+          if suggestions := parser.feed(text):
+            yield suggestions, None
+        assert stream.usage is not None
+        review_usage = stream.usage
         review_usages.append(review_usage)
       except OpenAIAPIError as e:
         log.error(f"Error while asking LLM: {e}")
         await self.notification_srv.emit_consumtion_limit_reached(e.message)
         raise
+      last_suggestions = parser.close()
 
       log_llm_io(
         req_id=self.req_id,
         name=f'answer.{i}',
-        msg=answer_str,
+        msg=stream.text,
       )
 
       log_llm_usage(
@@ -174,55 +282,50 @@ class PRReview():
       )
 
       await self.notification_srv.emit_usages(self.repo_name, review_usage, self.req_id, "review")
+      yield last_suggestions, {file.filename for file in chunk}
+
+  async def _triage_review_files(self, review_files: list[GitReviewFile]) -> list[GitReviewFile]:
+    """
+      Cascade (`LLM_TRIAGE_MODE`): drops the files triaged as trivial from the review, by
+      heuristics first, then by the triage model for the undecided ones when there is one.
+    """
+    if LLM_TRIAGE_MODE == 'off' or not review_files:
+      return review_files
+
+    decisions: dict[str, tuple[TriageDecision, str]] = {}
+    undecided: list[GitReviewFile] = []
+    for review_file in review_files:
+      heuristic = heuristic_triage(review_file)
+      if heuristic is None:
+        undecided.append(review_file)
+      else:
+        decisions[review_file.filename] = heuristic
 
-      suggestions = self._parse_llm_review_response(answer_str)
-      if suggestions:
-        unfiltered_suggestions.extend(suggestions)
+    if undecided and LLM_TRIAGE_MODE == 'llm' and self.triage_llmsrv is not None:
+      try:
+        llm_decisions, triage_usage = await llm_triage(self.triage_llmsrv, undecided,
+                                                       self.pr_title)
+        decisions.update({filename: (d, 'llm') for filename, d in llm_decisions.items()})
+        log_llm_usage(txn_id=f'{self.req_id}.triage', review_usage=triage_usage)
+        await self.notification_srv.emit_usages(self.repo_name, triage_usage, self.req_id,
+                                                "triage")
+      except Exception as e:
+        log.error(f"Error while triaging review files with LLM: {e}")
 
-    last_reviewed_commit = self.pr_patches.head
+    deep_files: list[GitReviewFile] = []
+    for review_file in review_files:
+      decision, reason = decisions.get(review_file.filename, (TriageDecision.DEEP, 'undecided'))
+      record_triage(review_file.filename, decision, reason)
+      if decision == TriageDecision.DEEP:
+        deep_files.append(review_file)
+
+    log.info(f"Triage: {len(deep_files)} of {len(review_files)} files need the review")
+    return deep_files
 
+  async def _timed_suggestions_from_tools(self) -> tuple[list[Suggestion] | None, float]:
     tools_start_t = datetime.now()
     tools_suggestions = await self.get_suggetions_from_tools()
-    tools_end_t = datetime.now()
-    tools_latency = (tools_end_t - tools_start_t).total_seconds()
-
-    if tools_suggestions:
-      unfiltered_suggestions.extend(tools_suggestions)
-
-    refined = await self._refine_suggestions(unfiltered_suggestions)
-    [
-      level1_refined_suggestions,
-      level2_refined_suggestions,
-      discarded_suggestions,
-    ], correction_llm_usages = refined
-
-    level1_count = len(level1_refined_suggestions)
-    level2_count = len(level2_refined_suggestions)
-    removed_count = len(discarded_suggestions)
-    tools_suggestions_count = len(tools_suggestions) if tools_suggestions else 0
-
-    log.info(f"Total: {len(unfiltered_suggestions)}"
-             f" -> Level1: {level1_count},"
-             f" Level2: {level2_count}, Removed: {removed_count}..."
-             f" Tools: {tools_suggestions_count}")
-
-    await self.notification_srv.emit_suggestions_generated(
-      repo_url=self.repo_name,
-      inital_count=len(unfiltered_suggestions),
-      final_count=level1_count,
-      level2_count=level2_count,
-      tools_count=tools_suggestions_count,
-      tools_latency=tools_latency,
-      request_id=self.req_id,
-    )
-
-    review_comment = f"Reviewed up to commit:{last_reviewed_commit}"
-
-    return PRSuggestions(
-      suggestions=level1_refined_suggestions,
-      level2_suggestions=level2_refined_suggestions,
-      review_comment=review_comment,
-    ), unfiltered_suggestions, review_usages, correction_llm_usages
+    return tools_suggestions, (datetime.now() - tools_start_t).total_seconds()
 
   async def get_suggetions_from_tools(self, silent_err=True) -> list[Suggestion] | None:
     if not self.review_tools:
@@ -252,16 +355,12 @@ class PRReview():
   async def _refine_suggestions(
     self, suggestions: list[Suggestion]
   ) -> tuple[tuple[list[Suggestion], list[Suggestion], list[Suggestion]], (list[LLMUsage] | None)]:
-    #
-    unique_suggestions = self._drop_duplicate_suggestions(suggestions)
-
     if not LLM_TWO_WAY_CORRECTION_ENABLED:
-      return (unique_suggestions, [], []), None
+      return (suggestions, [], []), None
 
     correction_llm_usages: list[LLMUsage] = []
     try:
-      refined_suggestions, correction_llm_usage = await self._drop_suggestion_by_llm(
-        unique_suggestions)
+      refined_suggestions, correction_llm_usage = await self._drop_suggestion_by_llm(suggestions)
       correction_llm_usages.append(correction_llm_usage)
       [
         level1_refined_suggestions,
@@ -280,7 +379,24 @@ class PRReview():
     except Exception as e:
       log.error(f"Error while asking LLM for correction: {e}")
       await self.notification_srv.emit(f"Error while asking LLM for correction.\nid={self.req_id}")
-      return (unique_suggestions, [], []), correction_llm_usages
+      return (suggestions, [], []), correction_llm_usages
+
+  async def _resolve_checkpoint(self, checkpoint: ReviewCheckpoint, pr_head: str) -> str | None:
+    reviewed_to = checkpoint.reviewed_to
+    if reviewed_to == pr_head:
+      return reviewed_to
+
+    if checkpoint.pr_commits and pr_head in checkpoint.pr_commits:
+      # head moved back to an already reviewed commit
+      log.info(f"PR head {pr_head} was covered by review {checkpoint.review_id}")
+      return pr_head
+
+    if not await self.gitsrv.is_ancestor_commit(reviewed_to, pr_head):
+      log.warning(f"Checkpoint {reviewed_to} is not an ancestor of {pr_head} (history rewritten?)")
+      return None
+
+    log.info(f"Last reviewed commit from checkpoint: {reviewed_to}")
+    return reviewed_to
 
   async def _get_last_reviewed_commit(self) -> str | None:
     async for comment in self.gitsrv.get_comments(self.pr_no):
@@ -300,115 +416,94 @@ class PRReview():
 
   async def _split_review_files(
       self, review_files: list[GitReviewFile]) -> tuple[list[list[GitReviewFile]], list[int]]:
+    """
+      Packs review files into prompts that fit the model. Decisions run on token estimates,
+      prompts are only tokenized when an estimate is too close to a limit to decide, or before
+      the PR is rejected or a file skipped (the bands aren't calibrated for every kind of text).
+    """
     if not review_files:
       return [], []
 
+    adjustment = TokenEstimate.exactly(TOKEN_ADJUSTMENT)
     system_prompt, user_prompt = self._build_review_prompt(review_files, self.review_config)
-    full_len = await self.llmsrv.get_encode_length(system_prompt + user_prompt) + TOKEN_ADJUSTMENT
-
-    if self.max_budget_token and full_len > self.max_budget_token:
-      raise LargeTokenException(required_token=full_len, max_budget_token=self.max_budget_token)
+    full = self.llmsrv.estimate_tokens(system_prompt + user_prompt) + adjustment
 
     max_token_len = self.llmsrv.max_tokens
+    limits = [max_token_len] + ([self.max_budget_token + 1] if self.max_budget_token else [])
+    undecided = any(full.below(limit) is None for limit in limits)
+    over_budget = bool(self.max_budget_token) and full.below(self.max_budget_token + 1) is False
+    if undecided or over_budget:
+      full = await self._exact_tokens(system_prompt + user_prompt) + adjustment
+
+    if self.max_budget_token and full.below(self.max_budget_token + 1) is False:
+      raise LargeTokenException(required_token=full.tokens, max_budget_token=self.max_budget_token)
+
     # happy path
-    if full_len < max_token_len:
-      log.info(f"Token length: Happy path : {full_len} < {max_token_len}")
-      return [review_files], [full_len]
+    if full.below(max_token_len):
+      log.info(f"Token length: Happy path : {full.tokens} < {max_token_len}")
+      return [review_files], [full.tokens]
 
-    log.info(f"Token length : need splitting : {full_len} > {max_token_len}")
+    log.info(f"Token length : need splitting : {full.tokens} > {max_token_len}")
 
     # If the prompt is too long, we split the user prompt into smaller chunks
-    system_prompt_token = await self.llmsrv.get_encode_length(system_prompt)
-
-    class ReviewFileWiseTokens(TypedDict):
-      review_file: GitReviewFile
-      tokens: int
+    base = await self._exact_tokens(system_prompt) + adjustment
 
-    review_file_wise_tokens: list[ReviewFileWiseTokens] = [{
-      "review_file": review_file,
-      "tokens": await self.llmsrv.get_encode_length(
-        self._build_review_prompt([review_file], self.review_config)[1]),
-    } for review_file in review_files]
+    async def file_tokens(review_file: GitReviewFile, exact: bool) -> TokenEstimate:
+      prompt = self._build_review_prompt([review_file], self.review_config)[1]
+      return await self._exact_tokens(prompt) if exact else self.llmsrv.estimate_tokens(prompt)
 
     greedy_split: list[list[GitReviewFile]] = []
     greedy_selections: list[GitReviewFile] = []
+    selection_tokens: list[TokenEstimate] = []
     tokens_used: list[int] = []
-    consumed_token = system_prompt_token + TOKEN_ADJUSTMENT
+    consumed = base
 
-    for review_file_info in review_file_wise_tokens:
-      review_file: GitReviewFile = review_file_info['review_file']
-      review_file_token: int = review_file_info['tokens']
+    for review_file in review_files:
+      review_file_token = await file_tokens(review_file, exact=False)
 
-      if system_prompt_token + review_file_token + TOKEN_ADJUSTMENT >= max_token_len:
+      fits_alone = (base + review_file_token).below(max_token_len)
+      if not fits_alone:
+        review_file_token = await file_tokens(review_file, exact=True)
+        fits_alone = (base + review_file_token).below(max_token_len)
+      if not fits_alone:
         log.info(
-          f"Skipping file: {review_file.filename} as it exceeds token limit for a single prompt. {review_file_token}+{system_prompt_token}"  # noqa: E501
+          f"Skipping file: {review_file.filename} as it exceeds token limit for a single prompt. {review_file_token.tokens}+{base.tokens}"  # noqa: E501
         )
         continue
 
-      if consumed_token + review_file_token >= max_token_len:
-        log.info(f"Beanpack tokens: {consumed_token}")
-        tokens_used.append(consumed_token)
+      fits = (consumed + review_file_token).below(max_token_len)
+      if fits is None:
+        # too close to call, count the chunk so far and this file exactly
+        selection_tokens = [
+          t if t.is_exact else await file_tokens(f, exact=True)
+          for f, t in zip(greedy_selections, selection_tokens)
+        ]
+        consumed = sum(selection_tokens, base)
+        if not review_file_token.is_exact:
+          review_file_token = await file_tokens(review_file, exact=True)
+        fits = (consumed + review_file_token).below(max_token_len)
+
+      if not fits:
+        log.info(f"Beanpack tokens: {consumed.tokens}")
+        tokens_used.append(consumed.tokens)
         greedy_split.append(greedy_selections)
         greedy_selections = []
-        consumed_token = system_prompt_token + TOKEN_ADJUSTMENT
+        selection_tokens = []
+        consumed = base
 
       greedy_selections.append(review_file)
-      consumed_token += review_file_token
+      selection_tokens.append(review_file_token)
+      consumed += review_file_token
 
     if greedy_selections:
-      log.info(f"Beanpack token: {consumed_token}")
-      tokens_used.append(consumed_token)
+      log.info(f"Beanpack token: {consumed.tokens}")
+      tokens_used.append(consumed.tokens)
       greedy_split.append(greedy_selections)
 
     return greedy_split, tokens_used
 
-  def _parse_llm_review_response(self, answer_str: str) -> list[Suggestion]:
-    answers = answer_str.split('\n')
-    suggestions: list[Suggestion] = []
-    for answer in answers:
-      answer = answer.strip()
-      if answer == _no_issues_msg or not answer:
-        continue
-      log.info(f"Answer: \"{answer}\"")
-      try:
-        splitted = answer.split(' : ')
-        file_path = splitted[0]
-        line_number = splitted[1]
-        suggestion_txt = " : ".join(splitted[2:]).strip()
-        if suggestion_txt == _no_issues_msg:
-          continue
-        line_no_str = line_number.strip()
-        start_line_no = -1
-        end_line_no = None
-      except Exception:
-        log.error(f"Error parsing answer: {answer}")
-        continue
-
-      if line_no_str.isdigit():
-        start_line_no = int(line_no_str)
-      elif line_no_str == '-1' or line_no_str == '-':
-        start_line_no = -1
-      elif '-' in line_no_str:
-        splitted_lines = line_no_str.split('-')
-        if len(splitted_lines) != 2:
-          log.info(f"Invalid line number: {line_no_str}")
-          continue
-        start_line_no = int(splitted_lines[0].strip())
-        end_line_no = int(splitted_lines[1].strip())
-      else:
-        log.info(f"Invalid line number: {line_no_str}")
-        continue
-
-      suggestion = Suggestion(
-        id=str(uuid.uuid4()),
-        file_path=file_path.strip(),
-        start_line_number=start_line_no,
-        end_line_number=end_line_no if end_line_no is not None else start_line_no,
-        suggestion=suggestion_txt,
-      )
-      suggestions.append(suggestion)
-
-    return suggestions
+  async def _exact_tokens(self, text: str) -> TokenEstimate:
+    return TokenEstimate.exactly(await self.llmsrv.get_encode_length(text))
 
   def _generate_diff_content(self, review_file: GitReviewFile) -> list[str]:
     diff_contents = []
@@ -512,16 +607,21 @@ class PRReview():
     new_filted_patches = drop_empty_patches(filted_patches)
     return new_filted_patches
 
-  def _drop_duplicate_suggestions(self, suggestions: list[Suggestion]) -> list[Suggestion]:
+  def _drop_duplicate_suggestions(self,
+                                  suggestions: list[Suggestion],
+                                  seen: set[str] | None = None) -> list[Suggestion]:
+    """
+      `seen` carries the suggestion texts kept by earlier calls, when suggestions come in parts.
+    """
     refined_suggestions: list[Suggestion] = []
 
-    older_suggestions = {}
+    older_suggestions = seen if seen is not None else set()
 
     for suggestion in suggestions:
       if suggestion.suggestion in older_suggestions:
         continue
       refined_suggestions.append(suggestion)
-      older_suggestions[suggestion.suggestion] = True
+      older_suggestions.add(suggestion.suggestion)
 
     return refined_suggestions
 
@@ -539,6 +639,7 @@ class PRReview():
       total_token=0,
       latency=0,
       total_input_token=0,
+      calls=0,
       llm=self.llmsrv.get_type(),
     )
     for suggestion in suggestions:
@@ -547,8 +648,6 @@ class PRReview():
         filewise_suggestions[file_path] = []
       filewise_suggestions[file_path].append(suggestion)
 
-    loop_index = 0
-
     for file_path, suggestions in filewise_suggestions.items():
       if file_path == "$$NO_FILE$$":
         for s in suggestions:
@@ -594,17 +693,11 @@ class PRReview():
       log_msg += f"\n\nOutput:\n\n\n{output_str}"
       log_llm_io(
         req_id=self.req_id,
-        name=f'correction.{loop_index}',
+        name=f'correction.{next(self._correction_calls)}',
         msg=log_msg,
       )
 
-      loop_index += 1
-      llm_usages.system_token += usages.system_token
-      llm_usages.user_token += usages.user_token
-      llm_usages.output_token += usages.output_token
-      llm_usages.total_token += usages.total_token
-      llm_usages.total_input_token += usages.total_input_token
-      llm_usages.latency += usages.latency
+      llm_usages.add(usages)
 
       try:
         corrections_list = self._parse_llm_corrections_response(output_str)
@@ -677,3 +770,66 @@ class LargeTokenException(Exception):
     super().__init__(
       f"PR is too large to review. Required tokens: {required_token}, Max budget: {max_budget_token}"  # noqa
     )
+
+
+class SuggestionStreamParser:
+  """
+    Parses a review answer while it is generated: each `feed` returns the suggestions of the
+    lines completed by the chunk, `close` the one of the last line.
+  """
+
+  def __init__(self):
+    self._pending = ''
+
+  def feed(self, chunk: str) -> list[Suggestion]:
+    lines = (self._pending + chunk).split('\n')
+    self._pending = lines.pop()
+    return [s for s in map(parse_review_line, lines) if s is not None]
+
+  def close(self) -> list[Suggestion]:
+    line, self._pending = self._pending, ''
+    suggestion = parse_review_line(line)
+    return [suggestion] if suggestion is not None else []
+
+
+def parse_review_line(answer: str) -> Suggestion | None:
+  answer = answer.strip()
+  if answer == _no_issues_msg or not answer:
+    return None
+  log.info(f"Answer: \"{answer}\"")
+  try:
+    splitted = answer.split(' : ')
+    file_path = splitted[0]
+    line_number = splitted[1]
+    suggestion_txt = " : ".join(splitted[2:]).strip()
+    if suggestion_txt == _no_issues_msg:
+      return None
+    line_no_str = line_number.strip()
+    start_line_no = -1
+    end_line_no = None
+  except Exception:
+    log.error(f"Error parsing answer: {answer}")
+    return None
+
+  if line_no_str.isdigit():
+    start_line_no = int(line_no_str)
+  elif line_no_str == '-1' or line_no_str == '-':
+    start_line_no = -1
+  elif '-' in line_no_str:
+    splitted_lines = line_no_str.split('-')
+    if len(splitted_lines) != 2:
+      log.info(f"Invalid line number: {line_no_str}")
+      return None
+    start_line_no = int(splitted_lines[0].strip())
+    end_line_no = int(splitted_lines[1].strip())
+  else:
+    log.info(f"Invalid line number: {line_no_str}")
+    return None
+
+  return Suggestion(
+    id=str(uuid.uuid4()),
+    file_path=file_path.strip(),
+    start_line_number=start_line_no,
+    end_line_number=end_line_no if end_line_no is not None else start_line_no,
+    suggestion=suggestion_txt,
+  )
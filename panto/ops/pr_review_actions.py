@@ -1,16 +1,22 @@
-from panto.config import (ANTHROPIC_API_KEY, ANTHROPIC_MODEL, DEFAULT_REVIEW_LLM_SRV,
-                          EXPANDED_DIFF_LINES, GPT_MAX_TOKENS, IS_PROD,
-                          MAX_TOKEN_BUDGET_FOR_AUTO_REVIEW, MAX_TOKEN_BUDGET_FOR_REVIEW,
-                          OPENAI_API_KEY, OPENAI_MODEL, REVIEW_TOOLS)
+from panto.config import (DEFAULT_REVIEW_LLM_SRV, EXPANDED_DIFF_LINES, IS_PROD,
+                          LLM_BATCH_AUTO_REVIEW, LLM_ROUTING_BACKENDS, LLM_TRIAGE_MODE,
+                          LLM_TRIAGE_MODEL, LLM_TRIAGE_SRV, MAX_TOKEN_BUDGET_FOR_AUTO_REVIEW,
+                          MAX_TOKEN_BUDGET_FOR_REVIEW, REVIEW_TOOLS)
 from panto.data_models.git import PRStatus
-from panto.data_models.pr_review import PRSuggestions
+from panto.data_models.pr_review import PRSuggestions, ReviewCheckpoint
 from panto.logging import log
 from panto.ops.pr_review import LargeTokenException, PRReview
+from panto.ops.review_queue import review_job_queue
 from panto.repository.pr_review import PRReviewRepository
 from panto.services.config_storage.config_storage import ConfigStorageService
 from panto.services.git.git_service import GitService
 from panto.services.git.git_service_types import GitServiceType
-from panto.services.llm.llm_service import LLMService, LLMServiceType, LLMUsage, create_llm_service
+from panto.services.llm.batch import BatchLLMService, LLMBatchCoordinator, llm_batch_store
+from panto.services.llm.llm_service import LLMService, LLMServiceType, LLMUsage
+from panto.services.llm.registry import LLMServiceRegistry
+from panto.services.llm.resilient import ResilientLLMService
+from panto.services.llm.routing import RoutingLLMService
+from panto.services.llm.scheduler import LLMRequestPriority, ScheduledLLMService
 from panto.services.metrics.metrics import MetricsCollectionService
 from panto.services.notification.notification import NotificationService
 from panto.utils.misc import Branding, is_whitelisted_repo, repo_url_to_repo_name
@@ -72,6 +78,7 @@ class PRActions:
         max_budget_token=MAX_TOKEN_BUDGET_FOR_AUTO_REVIEW,
         metric_srv=metrics_srv,
         config_storage_srv=config_storage_srv,
+        priority=LLMRequestPriority.AUTO,
       )
     except LargeTokenException:
       msg = "Auto review disabled due to large PR. If you still want me to review this PR? Please comment `/review `"  # noqa
@@ -98,8 +105,14 @@ class PRActions:
     )
 
   @staticmethod
-  async def delete_all_comments(gitsrv: GitService, pr_no: int, comment_id: int):
+  async def delete_all_comments(gitsrv: GitService,
+                                pr_no: int,
+                                comment_id: int,
+                                repo_id: str | None = None):
     await gitsrv.add_reaction(pr_no, 'eyes', comment_id)
+    if repo_id:
+      await _delete_recorded_comments(gitsrv, repo_id, pr_no)
+    # not every bot comment is recorded (no review files, review disabled, replies, ...)
     await gitsrv.clear_all_my_comment(pr_no)
 
   @staticmethod
@@ -117,7 +130,8 @@ class PRActions:
                               llmsrv: LLMService | None = None,
                               skip_whitelist_check: bool = False,
                               skip_empty_review_suggestion: bool = False,
-                              max_budget_token: int = MAX_TOKEN_BUDGET_FOR_REVIEW):
+                              max_budget_token: int = MAX_TOKEN_BUDGET_FOR_REVIEW,
+                              priority: LLMRequestPriority = LLMRequestPriority.MANUAL):
     gitsrv_type = gitsrv.get_provider()
     branding = Branding(gitsrv_type=gitsrv_type)
 
@@ -139,13 +153,38 @@ class PRActions:
 
     await notification_srv.emit_new_pr_review_request(repo_url, pr_no)
 
+    llmsrvs = [llmsrv] if llmsrv is not None else []
     if llmsrv is None:
       is_noop = not IS_PROD and 'noop' in comment_body
       if is_noop:
-        llm_srv_name = LLMServiceType.NOOP
+        llm_srv_names = [LLMServiceType.NOOP]
       else:
-        llm_srv_name = LLMServiceType(DEFAULT_REVIEW_LLM_SRV)
-      llmsrv = await _init_llmsrv(llm_srv_name)
+        llm_srv_names = _review_llm_types()
+      llmsrvs = [await LLMServiceRegistry.get(name) for name in llm_srv_names]
+    # LLM calls of all reviews in the process share the providers' rate limits, retries of
+    # transient errors go through the scheduler again
+    scheduled: list[LLMService] = [ScheduledLLMService(s, priority=priority) for s in llmsrvs]
+    llmsrv = scheduled[0] if len(scheduled) == 1 else RoutingLLMService(scheduled)
+    llmsrv = ResilientLLMService(llmsrv)
+    batch_mode = priority == LLMRequestPriority.AUTO and LLM_BATCH_AUTO_REVIEW
+    if batch_mode:
+      # nobody is waiting for an auto review, trade latency for the batch api price. Batches
+      # belong to one provider: the first backend gets them all, without routing or failover
+      llmsrv = BatchLLMService(llmsrvs[0])
+
+    triage_llmsrv: LLMService | None = None
+    if LLM_TRIAGE_MODE == 'llm' and llmsrvs[0].get_type() != LLMServiceType.NOOP:
+      try:
+        triage_llmsrv = await LLMServiceRegistry.get(LLMServiceType(LLM_TRIAGE_SRV),
+                                                     model=LLM_TRIAGE_MODEL)
+        if batch_mode:
+          triage_llmsrv = BatchLLMService(triage_llmsrv)
+        else:
+          triage_llmsrv = ResilientLLMService(ScheduledLLMService(triage_llmsrv,
+                                                                  priority=priority))
+      except Exception as e:
+        # a misconfigured triage model costs the cascade, not the review
+        log.error(f"Can't create triage LLM service, triaging by heuristics only: {e}")
 
     review_config = await get_review_config(gitsrv, config_storage_srv, pr_no, repo_url)
     if not review_config.enabled:
@@ -187,6 +226,7 @@ class PRActions:
       pr_title=pr_title,
       max_budget_token=max_budget_token,
       review_tools=review_tools,
+      triage_llmsrv=triage_llmsrv,
     )
     req_id = pr_review.req_id
 
@@ -204,7 +244,14 @@ class PRActions:
         await notification_srv.emit(f"Review already done for {repo_name} PR {pr_no}."
                                     f"\n\nReusing from: {last_id} \n\n{req_id}")
         pr_suggestions_with_branding = _add_banding(prsuggestions, branding)
-        await gitsrv.add_review(pr_no, pr_suggestions_with_branding)
+        posted_comments = await gitsrv.add_review(pr_no, pr_suggestions_with_branding)
+        await review_job_queue.mark_posted()
+        await metric_srv.review_commented(pr_no=pr_no,
+                                          repo_id=repo_id,
+                                          provider=gitsrv_type,
+                                          posted_comments=posted_comments,
+                                          reviewed_id=last_id,
+                                          append=True)
         return
 
     await metric_srv.review_started(
@@ -215,7 +262,12 @@ class PRActions:
     )
 
     if is_incremental_review:
-      await pr_review.incremental_prepare()
+      checkpoint = await _get_review_checkpoint(
+        provider=gitsrv_type,
+        repo_id=repo_id,
+        pr_no=pr_no,
+      )
+      await pr_review.incremental_prepare(checkpoint)
       log.info("Incremental Review files prepared")
     else:
       await pr_review.prepare()
@@ -292,6 +344,7 @@ class PRActions:
 
     reviewed_from = pr_review.pr_patches.base
     reviewed_to = pr_review.pr_patches.head
+    pr_commits = await _get_pr_commits(gitsrv, pr_no)
     pr_suggestions_with_branding = _add_banding(prsuggestions, branding)
 
     await metric_srv.review_completed(pr_no=pr_no,
@@ -306,8 +359,12 @@ class PRActions:
                                       correction_llm_usages=net_correction_llm_usages,
                                       reviewed_from=reviewed_from,
                                       reviewed_to=reviewed_to,
-                                      is_soft_review=False)
+                                      is_soft_review=False,
+                                      pr_commits=pr_commits,
+                                      git_fetch=gitsrv.get_fetch_stats())
     posted_comments = await gitsrv.add_review(pr_no, pr_suggestions_with_branding)
+    # a failure from here on doesn't get the review posted twice by a rerun of the job
+    await review_job_queue.mark_posted()
     await metric_srv.review_commented(pr_no=pr_no,
                                       repo_id=repo_id,
                                       provider=gitsrv_type,
@@ -355,14 +412,10 @@ def sum_llm_usages(llm_usages: list[LLMUsage]) -> LLMUsage:
     output_token=0,
     total_token=0,
     latency=0,
+    calls=0,
   )
   for usage in llm_usages:
-    net_usage.system_token += usage.system_token
-    net_usage.user_token += usage.user_token
-    net_usage.total_input_token += usage.total_input_token
-    net_usage.output_token += usage.output_token
-    net_usage.total_token += usage.total_token
-    net_usage.latency += usage.latency
+    net_usage.add(usage)
     net_usage.llm = usage.llm
 
   return net_usage
@@ -409,6 +462,68 @@ async def _get_last_reviewed_data(
     return prsuggestions, last_review_session.id
 
 
+async def _delete_recorded_comments(gitsrv: GitService, repo_id: str, pr_no: int) -> None:
+  """
+    Deletes the comments recorded at review time by id, before the scan of the PR for the bot
+    comments that weren't recorded.
+  """
+  from panto.models.db import db_manager
+
+  if not db_manager.scoped_session_factory:
+    return
+  provider = gitsrv.get_provider()
+  async with db_manager.scoped_session_factory() as db_session:
+    pr_review_repo = PRReviewRepository(db_session)
+    posted_comments = await pr_review_repo.get_posted_comments(
+      provider=provider,
+      repo_id=str(repo_id),
+      pr_no=str(pr_no),
+    )
+    if not posted_comments:
+      return
+    log.info(f"Deleting {len(posted_comments)} recorded comments on PR {pr_no}")
+    await gitsrv.delete_comments(pr_no, posted_comments)
+    await pr_review_repo.clear_posted_comments(
+      provider=provider,
+      repo_id=str(repo_id),
+      pr_no=str(pr_no),
+    )
+
+
+async def _get_review_checkpoint(
+  provider: GitServiceType,
+  repo_id: int | str,
+  pr_no: int | str,
+) -> ReviewCheckpoint | None:
+  from panto.models.db import db_manager
+
+  if not db_manager.scoped_session_factory:
+    return None
+  async with db_manager.scoped_session_factory() as db_session:
+    pr_review_repo = PRReviewRepository(db_session)
+    last_review = await pr_review_repo.get_last_checkpoint(
+      provider=provider,
+      repo_id=str(repo_id),
+      pr_no=str(pr_no),
+    )
+    if not last_review:
+      return None
+    return ReviewCheckpoint(
+      review_id=last_review.id,
+      reviewed_to=last_review.reviewed_to,
+      pr_commits=last_review.pr_commits,
+    )
+
+
+async def _get_pr_commits(gitsrv: GitService, pr_no: int) -> list[str] | None:
+  try:
+    return await gitsrv.get_pr_commits(pr_no)
+  except Exception as e:
+    # checkpoint still works from reviewed_to alone
+    log.warning(f"Unable to list PR commits: {e}")
+    return None
+
+
 async def _get_review_tools(
   repo_url: str,
   config_storage_srv: ConfigStorageService,
@@ -421,23 +536,37 @@ async def _get_review_tools(
   return account_config.get("review_tools") or REVIEW_TOOLS
 
 
-async def _init_llmsrv(llm_type: LLMServiceType) -> LLMService:
-  if llm_type == LLMServiceType.NOOP:
-    llmsrv = await create_llm_service(service_name=llm_type)
-  elif llm_type == LLMServiceType.OPENAI:
-    llmsrv = await create_llm_service(
-      service_name=llm_type,
-      max_tokens=GPT_MAX_TOKENS,
-      api_key=OPENAI_API_KEY,
-      model=OPENAI_MODEL,
-    )
-  elif llm_type == LLMServiceType.ANTHROPIC:
-    llmsrv = await create_llm_service(
-      service_name=llm_type,
-      api_key=ANTHROPIC_API_KEY,
-      model=ANTHROPIC_MODEL,
-    )
-  else:
-    raise NotImplementedError(f"Unsupported llm_type: {llm_type}")
-
-  return llmsrv
+async def resume_llm_batches() -> None:
+  """
+    Polls the batches submitted before a restart, so their answers are stored for the reviews
+    asking for them again.
+  """
+  try:
+    submitted_batches = await llm_batch_store.submitted_batches()
+  except Exception as e:
+    log.error(f"Can't load the submitted LLM batches: {e}")
+    return
+  for provider, model, batch_id, submitted_at in submitted_batches:
+    try:
+      llmsrv = await LLMServiceRegistry.get(LLMServiceType(provider), model=model)
+    except Exception as e:
+      log.error(f"Can't resume batch {batch_id} of {provider} {model}: {e}")
+      continue
+    log.info(f"Resuming batch {batch_id} of {provider} {model}")
+    LLMBatchCoordinator.get(llmsrv).watch(batch_id, submitted_at=submitted_at)
+
+
+async def warm_up_llm_services() -> None:
+  """
+    Creates the LLM services reviews will borrow, with their tokenizers and connections.
+  """
+  services: list[tuple[LLMServiceType, str | None]] = [(t, None) for t in _review_llm_types()]
+  if LLM_TRIAGE_MODE == 'llm':
+    services.append((LLMServiceType(LLM_TRIAGE_SRV), LLM_TRIAGE_MODEL))
+  await LLMServiceRegistry.warm_up(services)
+
+
+def _review_llm_types() -> list[LLMServiceType]:
+  if LLM_ROUTING_BACKENDS:
+    return [LLMServiceType(name) for name in LLM_ROUTING_BACKENDS]
+  return [LLMServiceType(DEFAULT_REVIEW_LLM_SRV)]
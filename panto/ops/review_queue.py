@@ -0,0 +1,348 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import aiohttp
+import sqlalchemy.exc
+
+from panto.config import (DB_URI, REVIEW_QUEUE_DB_URI, REVIEW_QUEUE_LEASE,
+                          REVIEW_QUEUE_MAX_ATTEMPTS, REVIEW_QUEUE_MAX_RUN_TIME,
+                          REVIEW_QUEUE_POLL_INTERVAL, REVIEW_QUEUE_RETENTION,
+                          REVIEW_QUEUE_RETRY_DELAY, REVIEW_QUEUE_WORKERS)
+from panto.logging import log
+from panto.models.db import DBManager, db_manager
+from panto.models.review_job import ReviewJobModel
+from panto.repository.review_job import ReviewJobRepository
+from panto.services.llm.batch import batch_wait_listener
+from panto.services.llm.resilient import is_retryable_llm_error
+from panto.services.metrics.runtime_metrics import runtime_metrics
+from panto.utils.http import RateLimitedError
+
+JobHandler = Callable[..., Awaitable[None]]
+
+_PURGE_INTERVAL = 3600  # seconds between deletions of the jobs past their retention
+
+_TRANSIENT_ERRORS = (RateLimitedError, ConnectionError, TimeoutError,
+                     aiohttp.ClientConnectionError, sqlalchemy.exc.OperationalError,
+                     sqlalchemy.exc.InterfaceError)
+
+
+def retry_delay(attempts: int) -> float | None:
+  """
+    Seconds before a job that failed its `attempts`th run is tried again, None when it is out of
+    attempts.
+  """
+  if attempts >= REVIEW_QUEUE_MAX_ATTEMPTS:
+    return None
+  return REVIEW_QUEUE_RETRY_DELAY * 2**(attempts - 1)
+
+
+def is_transient_job_error(error: BaseException) -> bool:
+  """
+    Whether a failed review is worth running again: rate limits, server errors, broken
+    connections and timeouts of the LLM, git provider or database. Anything else (a PR too
+    large for the budget, an auth error, a bug) fails the same way again.
+  """
+  if is_retryable_llm_error(error) or isinstance(error, _TRANSIENT_ERRORS):
+    return True
+  status = _status_code(error)
+  return status is not None and (status in (408, 429) or status >= 500)
+
+
+def _status_code(error: BaseException) -> int | None:
+  # aiohttp and PyGithub errors have `status`, python-gitlab ones `response_code`
+  for attr in ('status', 'response_code', 'status_code'):
+    if isinstance(code := getattr(error, attr, None), int):
+      return code
+  code = getattr(getattr(error, 'response', None), 'status_code', None)
+  return code if isinstance(code, int) else None
+
+
+@dataclass
+class _JobRun:
+  """
+    A job running in this worker. Waits for llm batch answers neither count towards
+    `REVIEW_QUEUE_MAX_RUN_TIME` nor take a worker slot.
+  """
+  job_id: str
+  task: asyncio.Task | None = None
+  started: float = field(default_factory=time.monotonic)
+  batch_waits: int = 0  # calls of the job waiting for their batch
+  waiting_since: float | None = None
+  waited: float = 0.0
+  posted: bool = False
+  stop_reason: str | None = None  # set when the worker cancels the job itself
+
+  @property
+  def waiting(self) -> bool:
+    return self.batch_waits > 0
+
+  def on_batch_wait(self, waiting: bool) -> None:
+    now = time.monotonic()
+    if waiting:
+      if self.batch_waits == 0:
+        self.waiting_since = now
+      self.batch_waits += 1
+      return
+    self.batch_waits -= 1
+    if self.batch_waits == 0 and self.waiting_since is not None:
+      self.waited += now - self.waiting_since
+      self.waiting_since = None
+
+  def run_time(self) -> float:
+    now = time.monotonic()
+    waiting = now - self.waiting_since if self.waiting_since is not None else 0.0
+    return now - self.started - self.waited - waiting
+
+
+_current_run: ContextVar[_JobRun | None] = ContextVar('review_job_run', default=None)
+
+
+class ReviewJobQueue:
+  """
+    Reviews requested by webhooks, stored in the `review_jobs` table before the webhook is
+    answered and run by lease holding workers. A worker renews the lease of its jobs while they
+    run, the jobs of a worker that crashed, was killed or stopped renewing are picked up by
+    another one once their lease expires. A job running for longer than
+    `REVIEW_QUEUE_MAX_RUN_TIME` is cancelled. Jobs failing on transient errors are retried with
+    exponential backoff, up to `REVIEW_QUEUE_MAX_ATTEMPTS` runs, unless they already posted
+    their review. Jobs waiting for llm batch answers leave their slot to others, so more than
+    `REVIEW_QUEUE_WORKERS` jobs can be running once their answers are in. Finished jobs drop
+    their arguments and are deleted after `REVIEW_QUEUE_RETENTION`. Without
+    `REVIEW_QUEUE_DB_URI` (nor `DB_URI`) jobs run in process like before, and are lost on
+    restart.
+  """
+
+  def __init__(self):
+    self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    self._handlers: dict[str, JobHandler] = {}
+    self._db: DBManager | None = None
+    self._poller: asyncio.Task | None = None
+    self._running: dict[str, _JobRun] = {}
+    self._wakeup = asyncio.Event()
+    self._inline_tasks: set[asyncio.Task] = set()
+    self._purged_at: float | None = None
+
+  def job(self, kind: str) -> Callable[[JobHandler], JobHandler]:
+    """
+      Registers the decorated coroutine function as the handler of the `kind` jobs. Its
+      arguments are stored as JSON, so they have to be plain data, and no secrets: pass what the
+      handler needs to look a credential up when it runs instead.
+    """
+
+    def register(handler: JobHandler) -> JobHandler:
+      assert kind not in self._handlers, f"Review job {kind} already registered"
+      self._handlers[kind] = handler
+      handler.review_job_kind = kind  # type: ignore[attr-defined]
+      return handler
+
+    return register
+
+  async def enqueue(self, handler: JobHandler, *args, in_process: bool = False) -> str | None:
+    """
+      Queues a run of the registered `handler` with `args`. Returns the job id, None when there
+      is no store or `in_process` is set (args that mustn't be stored) and the handler was
+      started in process.
+    """
+    kind = getattr(handler, 'review_job_kind', None)
+    assert kind in self._handlers, f"{handler.__name__} is not a registered review job"
+    if self._db is None or in_process:
+      task = asyncio.create_task(self._run_inline(kind, handler, args))
+      # the loop only keeps weak references to its tasks
+      self._inline_tasks.add(task)
+      task.add_done_callback(self._inline_tasks.discard)
+      return None
+
+    async with self._db.scoped_session_factory() as session:  # type: ignore
+      job_id = await ReviewJobRepository(session).enqueue(kind, {'args': list(args)})
+    log.info(f"Queued review job {kind} {job_id}")
+    self._wakeup.set()
+    return job_id
+
+  async def mark_posted(self) -> None:
+    """
+      Records that the running job posted its review on the PR, so that it isn't run again
+      whatever happens next. Does nothing outside a queued job.
+    """
+    run = _current_run.get()
+    if run is None or self._db is None:
+      return
+    run.posted = True
+    await self._repo_call('mark_posted', run.job_id, self.worker_id)
+
+  async def start(self) -> None:
+    if not REVIEW_QUEUE_DB_URI:
+      log.info("No review queue store configured, review jobs run in process")
+      return
+    if REVIEW_QUEUE_DB_URI == DB_URI and db_manager.engine is not None:
+      self._db = db_manager
+    else:
+      self._db = DBManager()
+      self._db.init(REVIEW_QUEUE_DB_URI)
+      if REVIEW_QUEUE_DB_URI.startswith('sqlite'):
+        # a single node store isn't managed by the migrations
+        async with self._db.engine.begin() as conn:  # type: ignore
+          await conn.run_sync(ReviewJobModel.metadata.create_all,
+                              tables=[ReviewJobModel.__table__])
+    self._poller = asyncio.create_task(self._poll())
+    log.info(f"Review queue worker {self.worker_id} started")
+
+  async def stop(self) -> None:
+    if self._poller is None:
+      return
+    self._poller.cancel()
+    running = [run.task for run in self._running.values() if run.task is not None]
+    for task in running:
+      task.cancel()
+    await asyncio.gather(self._poller, *running, return_exceptions=True)
+    self._poller = None
+    if self._db is not db_manager and self._db is not None and self._db.engine is not None:
+      await self._db.engine.dispose()
+    self._db = None
+
+  async def _poll(self) -> None:
+    while True:
+      if self._purged_at is None or time.monotonic() - self._purged_at >= _PURGE_INTERVAL:
+        await self._purge()
+      busy = sum(1 for run in self._running.values() if not run.waiting)
+      free = REVIEW_QUEUE_WORKERS - busy
+      jobs: list[ReviewJobModel] = []
+      if free > 0:
+        try:
+          async with self._db.scoped_session_factory() as session:  # type: ignore
+            jobs = await ReviewJobRepository(session).claim(self.worker_id, free,
+                                                            REVIEW_QUEUE_LEASE,
+                                                            REVIEW_QUEUE_MAX_ATTEMPTS)
+        except Exception as e:
+          log.error(f"Can't claim review jobs: {e}")
+      for job in jobs:
+        run = _JobRun(job.id)
+        self._running[job.id] = run
+        run.task = asyncio.create_task(self._run(job, run))
+      runtime_metrics.set('panto_review_jobs_running',
+                          len(self._running),
+                          help='Review jobs running in this worker')
+      if len(jobs) == free > 0:
+        continue  # there may be more due jobs
+      self._wakeup.clear()
+      try:
+        await asyncio.wait_for(self._wakeup.wait(), REVIEW_QUEUE_POLL_INTERVAL)
+      except asyncio.TimeoutError:
+        pass
+
+  async def _purge(self) -> None:
+    self._purged_at = time.monotonic()
+    try:
+      async with self._db.scoped_session_factory() as session:  # type: ignore
+        purged = await ReviewJobRepository(session).purge_finished(REVIEW_QUEUE_RETENTION)
+    except Exception as e:
+      log.error(f"Can't purge finished review jobs: {e}")
+      return
+    if purged:
+      log.info(f"Purged {purged} finished review jobs")
+
+  async def _run(self, job: ReviewJobModel, run: _JobRun) -> None:
+    kind: str = job.kind  # type: ignore[assignment]
+    _current_run.set(run)
+    batch_wait_listener.set(lambda waiting: self._on_batch_wait(run, waiting))
+    heartbeat = asyncio.create_task(self._heartbeat(run))
+    try:
+      handler = self._handlers.get(kind)
+      if handler is None:
+        raise Exception(f"No handler for review job {kind}")
+      log.info(f"Running review job {kind} {job.id}, attempt {job.attempts}")
+      await handler(*job.payload['args'])
+    except asyncio.CancelledError:
+      if run.stop_reason is None:
+        # shutting down, the next worker runs it again unless it's posted already
+        await self._repo_call('complete' if run.posted else 'release', job.id, self.worker_id)
+        raise
+      if run.stop_reason == 'lease_lost':
+        # the job is another worker's now, its row isn't ours to update
+        _record_job(kind, 'lost')
+      else:
+        error = TimeoutError(f"Ran for more than {REVIEW_QUEUE_MAX_RUN_TIME:.0f}s")
+        await self._fail(job, run, error)
+    except Exception as e:
+      await self._fail(job, run, e)
+    else:
+      await self._repo_call('complete', job.id, self.worker_id)
+      _record_job(kind, 'done')
+    finally:
+      heartbeat.cancel()
+      self._running.pop(job.id, None)
+      self._wakeup.set()
+
+  async def _fail(self, job: ReviewJobModel, run: _JobRun, error: BaseException) -> None:
+    retry_in = None
+    # a rerun would post the review once more
+    if not run.posted and is_transient_job_error(error):
+      retry_in = retry_delay(job.attempts)  # type: ignore[arg-type]
+    log.error(f"Review job {job.kind} {job.id} failed (attempt {job.attempts}): {error!r}",
+              exc_info=error)
+    await self._repo_call('fail', job.id, self.worker_id, repr(error), retry_in)
+    _record_job(job.kind, 'retried' if retry_in is not None else 'failed')  # type: ignore
+
+  def _on_batch_wait(self, run: _JobRun, waiting: bool) -> None:
+    run.on_batch_wait(waiting)
+    if run.waiting:
+      self._wakeup.set()  # its slot is free for another job
+
+  async def _heartbeat(self, run: _JobRun) -> None:
+    while True:
+      tick = REVIEW_QUEUE_LEASE / 3
+      if not run.waiting:
+        tick = min(tick, max(REVIEW_QUEUE_MAX_RUN_TIME - run.run_time(), 0))
+      await asyncio.sleep(tick)
+      if not run.waiting and run.run_time() >= REVIEW_QUEUE_MAX_RUN_TIME:
+        log.error(f"Review job {run.job_id} ran for too long, cancelling it")
+        self._stop(run, 'timeout')
+        return
+      try:
+        async with self._db.scoped_session_factory() as session:  # type: ignore
+          renewed = await ReviewJobRepository(session).extend_lease(run.job_id, self.worker_id,
+                                                                    REVIEW_QUEUE_LEASE)
+      except Exception as e:
+        # the lease outlives a missed renewal or two, tried again on the next tick
+        log.error(f"Can't renew the lease of review job {run.job_id}: {e}")
+        continue
+      if not renewed:
+        log.warning(f"Lost the lease of review job {run.job_id}, cancelling it")
+        self._stop(run, 'lease_lost')
+        return
+
+  def _stop(self, run: _JobRun, reason: str) -> None:
+    run.stop_reason = reason
+    if run.task is not None:
+      run.task.cancel()
+
+  async def _repo_call(self, method: str, *args) -> None:
+    # bookkeeping errors are logged, an unfinished job is picked up again after its lease
+    try:
+      async with self._db.scoped_session_factory() as session:  # type: ignore
+        await getattr(ReviewJobRepository(session), method)(*args)
+    except Exception as e:
+      log.error(f"Review job {method} of {args[0]} failed: {e}")
+
+  async def _run_inline(self, kind: str, handler: JobHandler, args: tuple) -> None:
+    try:
+      await handler(*args)
+      _record_job(kind, 'done')
+    except Exception:
+      log.exception(f"Review job {kind} failed")
+      _record_job(kind, 'failed')
+
+
+def _record_job(kind: str, outcome: str) -> None:
+  runtime_metrics.inc('panto_review_jobs_total',
+                      help='Review job runs by outcome',
+                      kind=kind,
+                      outcome=outcome)
+
+
+review_job_queue = ReviewJobQueue()
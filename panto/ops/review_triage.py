@@ -0,0 +1,206 @@
+import enum
+import re
+
+from panto.config import LLM_TRIAGE_MAX_DIFF_LINES, jinja_env
+from panto.data_models.git import GitPatchStatus
+from panto.logging import log
+from panto.ops.misc import GitReviewFile
+from panto.services.llm.llm_service import LLMService, LLMUsage
+from panto.services.metrics.runtime_metrics import runtime_metrics
+
+_triage_system_template = jinja_env.get_template('review_triage/system.jinja')
+_triage_user_template = jinja_env.get_template('review_triage/user.jinja')
+
+_DOC_EXTENSIONS = ('.md', '.rst', '.adoc')
+# .txt is docs by name only, requirements.txt or CMakeLists.txt are not
+_DOC_FILENAMES = {
+  'readme.txt', 'changelog.txt', 'changes.txt', 'license.txt', 'notice.txt', 'authors.txt',
+  'contributing.txt'
+}
+# where indentation is syntax, whitespace changes are code changes
+_INDENT_EXTENSIONS = ('.py', '.pyi', '.yaml', '.yml', '.mk')
+_INDENT_FILENAMES = {'makefile', 'gnumakefile'}
+_QUOTES = '"\'`'
+# line comments of the common languages, `#include` is code
+_LINE_COMMENT = re.compile(r'^(#(\s|$)|//)')
+_BLOCK_COMMENTS = (('/*', '*/'), ('<!--', '-->'))
+
+
+class TriageDecision(str, enum.Enum):
+  DEEP = "DEEP"
+  TRIVIAL = "TRIVIAL"
+
+
+def heuristic_triage(review_file: GitReviewFile) -> tuple[TriageDecision, str] | None:
+  """
+    Decides about the files that obviously don't need the review model, with the reason.
+    None when the changes have to be looked at.
+  """
+  patchfile = review_file.patchfile
+  if patchfile.status == GitPatchStatus.REMOVED:
+    return TriageDecision.TRIVIAL, 'deleted'
+  filename = patchfile.filename.lower()
+  basename = filename.rsplit('/', 1)[-1]
+  if filename.endswith(_DOC_EXTENSIONS) or basename in _DOC_FILENAMES:
+    return TriageDecision.TRIVIAL, 'docs'
+
+  added, removed = _changed_lines(patchfile.patch)
+  if not added and not removed:
+    return TriageDecision.TRIVIAL, 'no_change'
+  indent_sensitive = filename.endswith(_INDENT_EXTENSIONS) or basename in _INDENT_FILENAMES
+  old, new = _hunk_sides(patchfile.patch)
+  if not indent_sensitive and _without_whitespace(old) == _without_whitespace(new):
+    return TriageDecision.TRIVIAL, 'whitespace'
+  if _comments_only(patchfile.patch):
+    return TriageDecision.TRIVIAL, 'comments'
+  return None
+
+
+async def llm_triage(llmsrv: LLMService, review_files: list[GitReviewFile],
+                     pr_title: str) -> tuple[dict[str, TriageDecision], LLMUsage]:
+  """
+    Asks a cheap model to triage `review_files` in one compact prompt (diffs without the
+    expanded context, truncated to `LLM_TRIAGE_MAX_DIFF_LINES`). Files it doesn't answer for
+    are DEEP.
+  """
+  files = []
+  for review_file in review_files:
+    diff_lines = review_file.patchfile.patch.split('\n')
+    diff = '\n'.join(diff_lines[:LLM_TRIAGE_MAX_DIFF_LINES])
+    if len(diff_lines) > LLM_TRIAGE_MAX_DIFF_LINES:
+      diff += f"\n... {len(diff_lines) - LLM_TRIAGE_MAX_DIFF_LINES} more lines"
+    files.append({
+      'filename': review_file.filename,
+      'change_type': review_file.patchfile.status.value,
+      'diff': diff,
+    })
+
+  render_args = {'files': files, 'pr_title': pr_title}
+  answer, usage = await llmsrv.ask(_triage_system_template.render(render_args),
+                                   _triage_user_template.render(render_args))
+
+  decisions = {review_file.filename: TriageDecision.DEEP for review_file in review_files}
+  for line in answer.split('\n'):
+    index_str, _, decision = line.partition(':')
+    index_str, decision = index_str.strip(), decision.strip().upper()
+    if not index_str.isdigit() or int(index_str) >= len(review_files):
+      continue
+    if decision == TriageDecision.TRIVIAL.value:
+      decisions[review_files[int(index_str)].filename] = TriageDecision.TRIVIAL
+  return decisions, usage
+
+
+def record_triage(filename: str, decision: TriageDecision, reason: str) -> None:
+  log.info(f"Triage: {filename} -> {decision.value} ({reason})")
+  runtime_metrics.inc('panto_review_triage_total',
+                      help='Review files triaged, by decision and reason',
+                      decision=decision.value.lower(),
+                      reason=reason)
+
+
+def _changed_lines(patch: str) -> tuple[list[str], list[str]]:
+  added, removed = [], []
+  for line in patch.split('\n'):
+    if line.startswith('+'):
+      added.append(line[1:])
+    elif line.startswith('-'):
+      removed.append(line[1:])
+  return added, removed
+
+
+def _hunk_sides(patch: str) -> tuple[list[str], list[str]]:
+  """
+    Old and new lines of the hunks, context included, so moving a line isn't taken for a
+    whitespace change.
+  """
+  old, new = [], []
+  for line in patch.split('\n'):
+    if line.startswith('@@'):
+      old.append('\0')  # hunks are compared one to one
+      new.append('\0')
+    elif line.startswith(' '):
+      old.append(line[1:])
+      new.append(line[1:])
+    elif line.startswith('-'):
+      old.append(line[1:])
+    elif line.startswith('+'):
+      new.append(line[1:])
+  return old, new
+
+
+def _comments_only(patch: str) -> bool:
+  """
+    Whether every changed line is a comment as a whole (or blank). Block comments are followed
+    from the context of each hunk: a change that opens or closes one is code, and so is a `*`
+    line outside a block opened in sight.
+  """
+  for sign in ('-', '+'):
+    closer: str | None = None  # of the block comment the line is in
+    for line in patch.split('\n'):
+      if line.startswith('@@'):
+        closer = None
+        continue
+      if not line.startswith((' ', sign)):
+        continue
+      is_comment, after = _scan_comment(line[1:].strip(), closer)
+      if line.startswith(sign) and (not is_comment or after != closer):
+        return False
+      closer = after
+  return True
+
+
+def _scan_comment(text: str, closer: str | None) -> tuple[bool, str | None]:
+  """
+    Whether `text` is a comment as a whole, and the closer of the block comment open after it.
+    `closer` is the one of the block comment open before it.
+  """
+  if closer is not None:
+    if closer not in text:
+      return True, closer
+    end = text.index(closer) + len(closer)
+    return not text[end:].strip(), None
+  if not text or _LINE_COMMENT.match(text):
+    return True, None
+  for opener, block_closer in _BLOCK_COMMENTS:
+    if text.startswith(opener):
+      end = text.find(block_closer, len(opener))
+      if end < 0:
+        return True, block_closer
+      return not text[end + len(block_closer):].strip(), None
+  return False, None
+
+
+def _without_whitespace(lines: list[str]) -> str:
+  """
+    `lines` in order without the whitespace outside string literals, except a single space
+    between two words (`return x` isn't `returnx`).
+  """
+  text = '\n'.join(lines)
+  out: list[str] = []
+  quote = None
+  space = False
+  i = 0
+  while i < len(text):
+    char = text[i]
+    if quote:
+      out.append(char)
+      if char == '\\' and i + 1 < len(text):
+        out.append(text[i + 1])
+        i += 1
+      elif char == quote:
+        quote = None
+    elif char.isspace():
+      space = True
+    else:
+      if space and out and _is_word(out[-1]) and _is_word(char):
+        out.append(' ')
+      space = False
+      out.append(char)
+      if char in _QUOTES:
+        quote = char
+    i += 1
+  return ''.join(out)
+
+
+def _is_word(char: str) -> bool:
+  return char.isalnum() or char == '_'
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from panto.models.llm_batch import LLMBatchRequestModel
+
+
+class LLMBatchRepository:
+
+  def __init__(self, db_session: AsyncSession):
+    self.db_session = db_session
+
+  def _db_model(self):
+    return LLMBatchRequestModel
+
+  async def get(self, request_id: str) -> LLMBatchRequestModel | None:
+    return await self.db_session.get(self._db_model(), request_id)
+
+  async def mark_submitted(self, request_ids: list[str], batch_id: str, provider: str,
+                           model: str) -> None:
+    for request_id in request_ids:
+      # merge: a request failed before is submitted again under the same id
+      await self.db_session.merge(
+        LLMBatchRequestModel(
+          id=request_id,
+          provider=provider,
+          model=model,
+          batch_id=batch_id,
+          status='SUBMITTED',
+          response=None,
+          input_tokens=None,
+          output_tokens=None,
+          error=None,
+        ))
+    await self.db_session.commit()
+
+  async def mark_finished(
+    self,
+    request_id: str,
+    *,
+    response: str | None,
+    input_tokens: int,
+    output_tokens: int,
+    error: str | None,
+  ) -> None:
+    stmt = update(self._db_model()).where(self._db_model().id == request_id).values(
+      status='FAILED' if error is not None else 'COMPLETED',
+      response=response,
+      input_tokens=input_tokens,
+      output_tokens=output_tokens,
+      error=error,
+    )
+    await self.db_session.execute(stmt)
+    await self.db_session.commit()
+
+  async def fail_submitted(self, batch_id: str, error: str) -> None:
+    """
+      Fails the requests of `batch_id` that are still waited for.
+    """
+    model = self._db_model()
+    stmt = update(model).where(model.batch_id == batch_id,
+                               model.status == 'SUBMITTED').values(status='FAILED', error=error)
+    await self.db_session.execute(stmt)
+    await self.db_session.commit()
+
+  async def get_submitted_batches(self) -> list[tuple[str, str, str, datetime | None]]:
+    """
+      (provider, model, batch_id, submitted at) of the batches still waited for.
+    """
+    model = self._db_model()
+    stmt = select(model.provider, model.model, model.batch_id,
+                  func.min(model.updated_at)).filter(model.status == 'SUBMITTED').group_by(
+                    model.provider, model.model, model.batch_id)
+    result = await self.db_session.execute(stmt)
+    return [tuple(row) for row in result.all()]  # type: ignore[misc]
@@ -1,9 +1,9 @@
 import uuid
 
-from sqlalchemy import or_, select
+from sqlalchemy import or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from panto.data_models.git import ReviewStatus
+from panto.data_models.git import PostedComment, ReviewStatus
 from panto.models.pr import PRReviewDataModel, PRReviewModel
 from panto.services.git.git_service_types import GitServiceType
 
@@ -62,8 +62,64 @@ class PRReviewRepository:
     result = await self.db_session.execute(stmt)
     return result.scalar()
 
+  async def get_last_checkpoint(
+    self,
+    pr_no: str,
+    repo_id: str,
+    provider: GitServiceType | str,
+  ) -> PRReviewModel | None:
+    """
+      Latest completed review (full or incremental) which recorded the commit it reviewed up to.
+    """
+    provider = provider.value if isinstance(provider, GitServiceType) else provider.upper()
+    model = self._db_model()
+    stmt = select(model).filter_by(pr_no=pr_no, repo_id=repo_id, provider=provider)
+    stmt = stmt.filter(
+      or_(model.status == ReviewStatus.SOFT_REVIEWED, model.status == ReviewStatus.REVIEWED))
+    stmt = stmt.filter(model.reviewed_to.is_not(None))
+    stmt = stmt.order_by(model.created_at.desc()).limit(1)
+    result = await self.db_session.execute(stmt)
+    return result.scalar()
+
   async def get_review_data_by_id(self, review_id: str) -> PRReviewDataModel | None:
     stmt = select(PRReviewDataModel).filter_by(pr_review_id=review_id)
     result = await self.db_session.execute(stmt)
     data = result.scalar()
     return data
+
+  async def get_posted_comments(
+    self,
+    pr_no: str,
+    repo_id: str,
+    provider: GitServiceType | str,
+  ) -> list[PostedComment]:
+    """
+      Comments recorded for every review of the PR (see `review_commented`).
+    """
+    provider = provider.value if isinstance(provider, GitServiceType) else provider.upper()
+    stmt = select(PRReviewDataModel.comment_json).join(
+      PRReviewModel, PRReviewModel.id == PRReviewDataModel.pr_review_id).filter(
+        PRReviewModel.pr_no == pr_no,
+        PRReviewModel.repo_id == repo_id,
+        PRReviewModel.provider == provider,
+      )
+    result = await self.db_session.execute(stmt)
+    posted_comments: list[PostedComment] = []
+    for comment_json in result.scalars():
+      posted_comments += [PostedComment.model_validate(c) for c in comment_json or []]
+    return posted_comments
+
+  async def clear_posted_comments(
+    self,
+    pr_no: str,
+    repo_id: str,
+    provider: GitServiceType | str,
+  ) -> None:
+    provider = provider.value if isinstance(provider, GitServiceType) else provider.upper()
+    review_ids = select(PRReviewModel.id).filter_by(pr_no=pr_no,
+                                                    repo_id=repo_id,
+                                                    provider=provider)
+    stmt = update(PRReviewDataModel).where(
+      PRReviewDataModel.pr_review_id.in_(review_ids)).values(comment_json=None)
+    await self.db_session.execute(stmt)
+    await self.db_session.commit()
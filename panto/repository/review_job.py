@@ -0,0 +1,169 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from panto.models.review_job import ReviewJobModel
+
+
+class ReviewJobRepository:
+
+  def __init__(self, db_session: AsyncSession):
+    self.db_session = db_session
+
+  def _db_model(self):
+    return ReviewJobModel
+
+  async def enqueue(self, kind: str, payload: dict) -> str:
+    job_id = uuid.uuid4().hex
+    self.db_session.add(
+      ReviewJobModel(
+        id=job_id,
+        kind=kind,
+        payload=payload,
+        status='QUEUED',
+        attempts=0,
+        run_after=_now(),
+        posted=False,
+      ))
+    await self.db_session.commit()
+    return job_id
+
+  async def claim(self, worker_id: str, limit: int, lease: float,
+                  max_attempts: int) -> list[ReviewJobModel]:
+    """
+      Leases up to `limit` jobs that are due, or whose worker let the lease expire (crashed,
+      killed or stuck), to `worker_id`. An expired job that already posted its review is done,
+      one that ran `max_attempts` times already failed, neither is run again. Finished jobs
+      drop their payload.
+    """
+    model = self._db_model()
+    now = _now()
+    expired = and_(model.status == 'RUNNING', model.lease_until < now)
+    stmt = update(model).where(expired, model.posted.is_(True)).values(status='DONE',
+                                                                       payload=None,
+                                                                       leased_by=None,
+                                                                       lease_until=None)
+    await self.db_session.execute(stmt)
+    stmt = update(model).where(expired, model.attempts >= max_attempts).values(
+      status='FAILED',
+      payload=None,
+      leased_by=None,
+      lease_until=None,
+      error='lease expired',
+    )
+    await self.db_session.execute(stmt)
+    claimable = or_(
+      and_(model.status == 'QUEUED', model.run_after <= now),
+      and_(expired, model.posted.is_(False), model.attempts < max_attempts),
+    )
+    # skip locked keeps postgres workers off each other's rows (sqlite ignores it, its writes
+    # are serialized and the conditional update below sorts out races)
+    stmt = select(model.id).where(claimable).order_by(model.run_after).limit(limit)
+    candidates = (await self.db_session.execute(stmt.with_for_update(skip_locked=True))).scalars()
+
+    claimed_ids = []
+    for job_id in list(candidates):
+      stmt = update(model).where(model.id == job_id, claimable).values(
+        status='RUNNING',
+        leased_by=worker_id,
+        lease_until=now + timedelta(seconds=lease),
+        attempts=model.attempts + 1,
+      )
+      if (await self.db_session.execute(stmt)).rowcount == 1:  # type: ignore[attr-defined]
+        claimed_ids.append(job_id)
+    await self.db_session.commit()
+
+    if not claimed_ids:
+      return []
+    stmt = select(model).where(model.id.in_(claimed_ids)).order_by(model.run_after)
+    return list((await self.db_session.execute(stmt)).scalars())
+
+  async def extend_lease(self, job_id: str, worker_id: str, lease: float) -> bool:
+    """
+      False when the job isn't leased to `worker_id` anymore.
+    """
+    model = self._db_model()
+    stmt = update(model).where(model.id == job_id, model.leased_by == worker_id,
+                               model.status == 'RUNNING').values(lease_until=_now()
+                                                                 + timedelta(seconds=lease))
+    result = await self.db_session.execute(stmt)
+    await self.db_session.commit()
+    return result.rowcount == 1  # type: ignore[attr-defined]
+
+  async def mark_posted(self, job_id: str, worker_id: str) -> None:
+    await self._update_leased(job_id, worker_id, posted=True)
+
+  async def complete(self, job_id: str, worker_id: str) -> None:
+    await self._update_leased(job_id,
+                              worker_id,
+                              status='DONE',
+                              payload=None,
+                              leased_by=None,
+                              lease_until=None,
+                              error=None)
+
+  async def fail(self, job_id: str, worker_id: str, error: str, retry_in: float | None) -> None:
+    """
+      Queues the job again in `retry_in` seconds, or fails it for good when None.
+    """
+    if retry_in is None:
+      await self._update_leased(job_id,
+                                worker_id,
+                                status='FAILED',
+                                payload=None,
+                                leased_by=None,
+                                lease_until=None,
+                                error=error)
+      return
+    await self._update_leased(job_id,
+                              worker_id,
+                              status='QUEUED',
+                              leased_by=None,
+                              lease_until=None,
+                              error=error,
+                              run_after=_now() + timedelta(seconds=retry_in))
+
+  async def release(self, job_id: str, worker_id: str) -> None:
+    """
+      Hands a job interrupted by a shutdown back to the queue, without counting the attempt.
+    """
+    model = self._db_model()
+    stmt = update(model).where(model.id == job_id, model.leased_by == worker_id).values(
+      status='QUEUED',
+      leased_by=None,
+      lease_until=None,
+      run_after=_now(),
+      attempts=model.attempts - 1,
+    )
+    await self.db_session.execute(stmt)
+    await self.db_session.commit()
+
+  async def purge_finished(self, older_than: float) -> int:
+    """
+      Deletes the jobs done or failed more than `older_than` seconds ago, returns how many.
+    """
+    model = self._db_model()
+    stmt = delete(model).where(model.status.in_(('DONE', 'FAILED')), model.updated_at
+                               < _now() - timedelta(seconds=older_than))
+    result = await self.db_session.execute(stmt)
+    await self.db_session.commit()
+    return result.rowcount  # type: ignore[attr-defined]
+
+  async def count_by_status(self) -> dict[str, int]:
+    model = self._db_model()
+    stmt = select(model.status, func.count()).group_by(model.status)
+    return {status: count for status, count in (await self.db_session.execute(stmt)).all()}
+
+  async def _update_leased(self, job_id: str, worker_id: str, **values) -> None:
+    model = self._db_model()
+    # a worker that lost its lease doesn't overwrite the one running the job now
+    stmt = update(model).where(model.id == job_id, model.leased_by == worker_id).values(**values)
+    await self.db_session.execute(stmt)
+    await self.db_session.commit()
+
+
+def _now() -> datetime:
+  return datetime.now(pytz.UTC)
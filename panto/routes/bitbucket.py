@@ -1,21 +1,22 @@
 import hashlib
 import time
 
-import aiohttp
 import jwt
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request
 
 from panto.config import BITBUCKET_APP_BASE_URL, BITBUCKET_APP_KEY, IS_PROD
 from panto.data_models.git import PRStatus
 from panto.logging import log
 from panto.ops.pr_review_actions import PRActions
+from panto.ops.review_queue import review_job_queue
 from panto.services.config_storage.config_storage import (ConfigStorageService,
                                                           create_config_storage_service)
 from panto.services.git.git_service import GitService, create_git_service
 from panto.services.git.git_service_types import GitServiceType
 from panto.services.metrics.metrics import create_metrics_service
 from panto.services.notification.notification import create_notification_service
-from panto.utils.misc import in_next_tick, is_auto_review_enabled, is_whitelisted_repo
+from panto.utils.http import SharedClientSession
+from panto.utils.misc import is_auto_review_enabled, is_whitelisted_repo
 
 router = APIRouter()
 
@@ -23,7 +24,7 @@ _WEBHOOK_ENDPOINT = "/webhook"
 
 
 @router.post("/bitbucket/webhook")
-async def bitbucket_webhook(request: Request, background_tasks: BackgroundTasks):
+async def bitbucket_webhook(request: Request):
   body = await request.json()
   supported_events = [
     "pullrequest:comment_created",
@@ -58,7 +59,8 @@ async def bitbucket_webhook(request: Request, background_tasks: BackgroundTasks)
     return {"message": "processed"}
 
   if event_type in ["pullrequest:created"]:
-    background_tasks.add_task(on_process_pull_request_created, body, jwt_token)
+    client_key = await _verify_webhook_client_key(jwt_token)
+    await review_job_queue.enqueue(on_process_pull_request_created, body, client_key)
     return {"message": "processed"}
 
   if event_type in ["pullrequest:comment_created"]:
@@ -69,7 +71,8 @@ async def bitbucket_webhook(request: Request, background_tasks: BackgroundTasks)
     if PRActions.is_review_pr_command(comment_body) or PRActions.is_delete_review_command(
         comment_body):
       log.info(f"Received comment id: {comment_id}, comment_body: {comment_body}")
-      background_tasks.add_task(on_process_pull_request_comment_created, body, jwt_token)
+      client_key = await _verify_webhook_client_key(jwt_token)
+      await review_job_queue.enqueue(on_process_pull_request_comment_created, body, client_key)
       log.info("processing in background task."
                f"repo: {repo_url}, pr: {pr_id}, comment_id: {comment_id}")
       return {"message": "processed"}
@@ -277,12 +280,12 @@ async def atlassian_connect():
   return manifest
 
 
-@in_next_tick
-async def on_process_pull_request_created(body: dict, jwt_token: str):
+@review_job_queue.job('bitbucket.pr_created')
+async def on_process_pull_request_created(body: dict, client_key: str):
   pr_no = body['data']['pullrequest']['id']
   repo_url = body['data']['repository']['links']['html']['href']
   storage = await create_config_storage_service()
-  auth_tokens = await _bitbucket_verify_jwt_and_get_access_token(jwt_token, storage)
+  auth_tokens = await _get_installation_access_token(client_key, storage)
   access_token = auth_tokens['access_token']
   gitsrv = await _get_bitbucket_service(repo_url, access_token)
   notification_srv = create_notification_service()
@@ -306,8 +309,8 @@ async def on_process_pull_request_created(body: dict, jwt_token: str):
   )
 
 
-@in_next_tick
-async def on_process_pull_request_comment_created(body: dict, jwt_token: str):
+@review_job_queue.job('bitbucket.pr_comment_created')
+async def on_process_pull_request_comment_created(body: dict, client_key: str):
   repo_url = body['data']['repository']['links']['html']['href']
   pr_no = body['data']['pullrequest']['id']
   pr_title = body['data']['pullrequest']['title']
@@ -317,7 +320,7 @@ async def on_process_pull_request_comment_created(body: dict, jwt_token: str):
   if PRActions.is_review_pr_command(comment_body):
     log.info(f"Processing review command for PR: {pr_no}")
     storage = await create_config_storage_service()
-    auth_tokens = await _bitbucket_verify_jwt_and_get_access_token(jwt_token, storage)
+    auth_tokens = await _get_installation_access_token(client_key, storage)
     access_token = auth_tokens['access_token']
     gitsrv = await _get_bitbucket_service(repo_url, access_token)
     notification_srv = create_notification_service()
@@ -341,10 +344,13 @@ async def on_process_pull_request_comment_created(body: dict, jwt_token: str):
   if PRActions.is_delete_review_command(comment_body):
     log.info(f"Bitbucket. Delete review command received. PR: {pr_no}")
     storage = await create_config_storage_service()
-    auth_tokens = await _bitbucket_verify_jwt_and_get_access_token(jwt_token, storage)
+    auth_tokens = await _get_installation_access_token(client_key, storage)
     access_token = auth_tokens['access_token']
     gitsrv = await _get_bitbucket_service(repo_url, access_token)
-    await PRActions.delete_all_comments(gitsrv, pr_no, comment_id)
+    await PRActions.delete_all_comments(gitsrv,
+                                        pr_no,
+                                        comment_id,
+                                        repo_id=str(body['data']['repository']['uuid']))
     return
 
 
@@ -428,28 +434,40 @@ async def _get_bitbucket_access_token(client_key: str, shared_secret: str) -> di
     "Content-Type": "application/x-www-form-urlencoded"
   }
   payload = {"grant_type": grant_type}
-  async with aiohttp.ClientSession() as session:
-    async with session.post(endpoint, headers=req_headers, data=payload) as res:
-      res.raise_for_status()
-      res_data = await res.json()
-      return res_data
+  session = SharedClientSession.get()
+  async with session.post(endpoint, headers=req_headers, data=payload) as res:
+    res.raise_for_status()
+    res_data = await res.json()
+    return res_data
 
 
 async def _get_workspace_access(access_token: str) -> dict:
   endpoint = "https://api.bitbucket.org/2.0/workspaces"
   req_headers = {"Authorization": f"Bearer {access_token}"}
-  async with aiohttp.ClientSession() as session:
-    async with session.get(endpoint, headers=req_headers) as res:
-      res.raise_for_status()
-      res_data = await res.json()
-      workspace = res_data.get('values', [])[0]
-      return workspace
-
-
-async def _bitbucket_verify_jwt_and_get_access_token(jwt_token: str,
-                                                     storage: ConfigStorageService) -> dict:
-  creds = await _verify_bitbucket_webhook_jwt(jwt_token, storage)
-  client_key = creds['client_key']
-  shared_secret = creds['shared_secret']
+  session = SharedClientSession.get()
+  async with session.get(endpoint, headers=req_headers) as res:
+    res.raise_for_status()
+    res_data = await res.json()
+    workspace = res_data.get('values', [])[0]
+    return workspace
+
+
+async def _verify_webhook_client_key(jwt_token: str) -> str:
+  # the review job gets the installation's client key, not the short lived webhook jwt
+  storage = await create_config_storage_service()
+  try:
+    creds = await _verify_bitbucket_webhook_jwt(jwt_token, storage)
+  except jwt.PyJWTError as e:
+    log.error(f"Failed to verify webhook JWT: {e}")
+    raise HTTPException(status_code=401, detail="Unauthorized")
+  return creds['client_key']
+
+
+async def _get_installation_access_token(client_key: str, storage: ConfigStorageService) -> dict:
+  creds = await storage.get_providers_creds(GitServiceType.BITBUCKET.value, client_key)
+  shared_secret = creds.get('shared_secret') if creds else None
+  if not shared_secret:
+    # uninstalled since the webhook came in
+    raise Exception(f"No Bitbucket credentials for client key {client_key}")
   auth_tokens = await _get_bitbucket_access_token(client_key, shared_secret)
   return auth_tokens
@@ -1,24 +1,25 @@
-from fastapi import APIRouter, BackgroundTasks, Request
+from fastapi import APIRouter, Request
 
 from panto.config import (GH_PERSONAL_ACCESS_TOKEN, GH_WEBHOOK_SECRET,
                           SKIP_WHITLISTING_FOR_OSS_REPOS)
 from panto.data_models.git import PRStatus
 from panto.logging import log
 from panto.ops.pr_review_actions import PRActions
+from panto.ops.review_queue import review_job_queue
 from panto.services.config_storage.config_storage import create_config_storage_service
 from panto.services.git.git_service import GitService, create_git_service
 from panto.services.git.git_service_types import GitServiceType
 from panto.services.git.github_service import GitHubService
 from panto.services.metrics.metrics import create_metrics_service
 from panto.services.notification import create_notification_service
-from panto.utils.misc import (Branding, in_next_tick, is_auto_review_enabled, is_whitelisted_repo,
+from panto.utils.misc import (Branding, is_auto_review_enabled, is_whitelisted_repo,
                               verify_github_signature)
 
 router = APIRouter()
 
 
 @router.post('/github/webhook')
-async def github_webhook(request: Request, background_tasks: BackgroundTasks):
+async def github_webhook(request: Request):
   if GH_WEBHOOK_SECRET:
     raw_data = await request.body()
     sig_header = request.headers.get('X-Hub-Signature-256')
@@ -58,13 +59,13 @@ async def github_webhook(request: Request, background_tasks: BackgroundTasks):
 
     if PRActions.is_review_pr_command(comment_body) or PRActions.is_delete_review_command(
         comment_body):
-      background_tasks.add_task(on_pr_comment, data, repo_url, installation_id)
+      await review_job_queue.enqueue(on_pr_comment, data, repo_url, installation_id)
       return {"message": "processed"}
 
     return {"message": "Event not processed"}
 
   if event_type == 'pull_request' and action in ['opened', 'reopened']:
-    background_tasks.add_task(on_pr_open, data, repo_url, installation_id)
+    await review_job_queue.enqueue(on_pr_open, data, repo_url, installation_id)
     return {"message": "processed"}
 
   if event_type == 'pull_request' and action == 'closed':
@@ -128,7 +129,7 @@ async def handle_installation_event(data: dict):
   log.info(f"Unknown installation action: {action}")
 
 
-@in_next_tick
+@review_job_queue.job('github.pr_open')
 async def on_pr_open(data, repo_url, installation_id):
   action = data.get('action')
   pr = data['pull_request']
@@ -161,7 +162,7 @@ async def on_pr_open(data, repo_url, installation_id):
   )
 
 
-@in_next_tick
+@review_job_queue.job('github.pr_comment')
 async def on_pr_comment(data, repo_url, installation_id):
   notification_srv = create_notification_service()
   comment = data['comment']
@@ -219,7 +220,7 @@ async def on_pr_comment(data, repo_url, installation_id):
       repo_url=repo_url,
       installation_id=installation_id,
     )
-    await PRActions.delete_all_comments(gitsrv, pr_no, comment_id)
+    await PRActions.delete_all_comments(gitsrv, pr_no, comment_id, repo_id=str(repository['id']))
     return
 
 
@@ -1,22 +1,23 @@
-from fastapi import APIRouter, BackgroundTasks, Request
+from fastapi import APIRouter, Request
 from gitlab.exceptions import GitlabError
 
 from panto.config import MY_GL_ACCESS_TOKEN, MY_GL_WEBHOOK_SECRET
 from panto.data_models.git import PRStatus
 from panto.logging import log
 from panto.ops.pr_review_actions import PRActions
+from panto.ops.review_queue import review_job_queue
 from panto.services.config_storage.config_storage import create_config_storage_service
 from panto.services.git.git_service import GitService, GitServiceType, create_git_service
 from panto.services.metrics.metrics import create_metrics_service
 from panto.services.notification.notification import (NotificationService,
                                                       create_notification_service)
-from panto.utils.misc import in_next_tick, is_auto_review_enabled
+from panto.utils.misc import is_auto_review_enabled
 
 router = APIRouter()
 
 
 @router.post('/gitlab/webhook')
-async def gitlab_webhook(request: Request, background_tasks: BackgroundTasks):
+async def gitlab_webhook(request: Request):
   # TODO: Move MY_GL_WEBHOOK_SECRET & MY_GL_ACCESS_TOKEN to NOOPConfigStorage
   if MY_GL_WEBHOOK_SECRET:
     gl_secret = request.headers.get('X-Gitlab-Token')
@@ -24,7 +25,10 @@ async def gitlab_webhook(request: Request, background_tasks: BackgroundTasks):
       log.error("Invalid GitLab webhook secret")
       return {"message": "not processed"}
 
-  oauth_token = request.headers.get('X-PANTO-ACCESS-TOKEN') or MY_GL_ACCESS_TOKEN
+  # the configured token is looked up again when the review job runs, one passed with the
+  # request can't be, its jobs run in process rather than storing it
+  request_token = request.headers.get('X-PANTO-ACCESS-TOKEN')
+  oauth_token = request_token or MY_GL_ACCESS_TOKEN
 
   data = await request.json()
 
@@ -70,7 +74,12 @@ async def gitlab_webhook(request: Request, background_tasks: BackgroundTasks):
       return {"message": "processed"}
 
     if object_attributes_action in ['open', 'reopen']:
-      background_tasks.add_task(on_mr_open, data, repo_url, oauth_token, gitlab_ins_url)
+      await review_job_queue.enqueue(on_mr_open,
+                                     data,
+                                     repo_url,
+                                     request_token,
+                                     gitlab_ins_url,
+                                     in_process=request_token is not None)
       print("returning")
       return {"message": "processed"}
 
@@ -88,14 +97,22 @@ async def gitlab_webhook(request: Request, background_tasks: BackgroundTasks):
 
       if PRActions.is_review_pr_command(comment_body) or PRActions.is_delete_review_command(
           comment_body):
-        background_tasks.add_task(on_mr_comment, data, repo_url, oauth_token, gitlab_ins_url)
+        await review_job_queue.enqueue(on_mr_comment,
+                                       data,
+                                       repo_url,
+                                       request_token,
+                                       gitlab_ins_url,
+                                       in_process=request_token is not None)
         return {"message": "processed"}
 
   return {"message": "no action"}
 
 
-@in_next_tick
-async def on_mr_comment(data: dict, repo_url: str, oauth_token: str, gitlab_ins_url: str):
+@review_job_queue.job('gitlab.mr_comment')
+async def on_mr_comment(data: dict, repo_url: str, oauth_token: str | None, gitlab_ins_url: str):
+  # None for a job queued with the configured token
+  oauth_token = oauth_token or MY_GL_ACCESS_TOKEN
+  assert oauth_token, "No GitLab access token configured"
   object_attributes = data.get('object_attributes', {})
   comment_id = object_attributes.get('id')
   comment_body = object_attributes.get('note').strip()
@@ -148,12 +165,18 @@ async def on_mr_comment(data: dict, repo_url: str, oauth_token: str, gitlab_ins_
     except GitlabError as e:
       await handle_gitlab_error(e, repo_url, notification_srv)
       raise
-    await PRActions.delete_all_comments(gitsrv, pr_no, comment_id)
+    await PRActions.delete_all_comments(gitsrv,
+                                        pr_no,
+                                        comment_id,
+                                        repo_id=str(data['project']['id']))
     return
 
 
-@in_next_tick
-async def on_mr_open(data: dict, repo_url: str, oauth_token: str, gitlab_ins_url: str):
+@review_job_queue.job('gitlab.mr_open')
+async def on_mr_open(data: dict, repo_url: str, oauth_token: str | None, gitlab_ins_url: str):
+  # None for a job queued with the configured token
+  oauth_token = oauth_token or MY_GL_ACCESS_TOKEN
+  assert oauth_token, "No GitLab access token configured"
   opject_attributes = data.get('object_attributes', {})
   action = opject_attributes.get('action', '')
   notification_srv = create_notification_service()
@@ -1,9 +1,10 @@
 from fastapi import APIRouter
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse
 
 from panto.config import APP_VERSION, IS_PROD
 from panto.services.config_storage.config_storage import create_config_storage_service
 from panto.services.git.git_service_types import GitServiceType
+from panto.services.metrics.runtime_metrics import runtime_metrics
 
 router = APIRouter()
 
@@ -36,6 +37,12 @@ async def health():
   }
 
 
+@router.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+  return PlainTextResponse(runtime_metrics.render(),
+                           media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @router.get('/jasusi')
 async def jasusi():
   if IS_PROD:
@@ -4,13 +4,14 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.concurrency import asynccontextmanager
 from fastapi.responses import ORJSONResponse
 
-from panto.config import DB_URI
+from panto.config import DB_URI, LLM_BATCH_AUTO_REVIEW
 from panto.logging import log
 from panto.routes.bitbucket import router as bitbucket_router
 from panto.routes.github_webhook import router as github_router
 from panto.routes.gitlab_webhook import router as gitlab_router
 from panto.routes.misc import router as misc_router
 from panto.routes.telegram import router as telegramrouter
+from panto.utils.http import SharedClientSession, SharedLLMHttpClient
 
 
 def create_app():
@@ -21,7 +22,18 @@ def create_app():
       log.info("Initializing db_manager")
       from panto.models.db import db_manager
       db_manager.init(DB_URI)
+      if LLM_BATCH_AUTO_REVIEW:
+        from panto.ops.pr_review_actions import resume_llm_batches
+        await resume_llm_batches()
+    # once per worker: the first review shouldn't pay for tokenizers and TLS handshakes
+    from panto.ops.pr_review_actions import warm_up_llm_services
+    await warm_up_llm_services()
+    from panto.ops.review_queue import review_job_queue
+    await review_job_queue.start()
     yield
+    await review_job_queue.stop()
+    await SharedClientSession.close()
+    await SharedLLMHttpClient.close()
 
   app = FastAPI(lifespan=lifespan)
 
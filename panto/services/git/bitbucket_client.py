@@ -0,0 +1,105 @@
+import json
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from panto.services.git.http_cache import http_cache
+from panto.services.git.rate_limit import RequestPriority, rate_limit_governor, rate_limit_key
+from panto.utils.http import (RateLimitedError, SharedClientSession, get_retry_after,
+                              is_rate_limited)
+
+BITBUCKET_API_BASE_URL = "https://api.bitbucket.org/2.0"
+
+
+class BitBucketClient:
+  """
+    Thin async wrapper over Bitbucket Cloud REST API 2.0 on top of the shared pooled session.
+  """
+
+  def __init__(self, access_token: str, base_url: str = BITBUCKET_API_BASE_URL):
+    self.access_token = access_token
+    self.base_url = base_url
+    self.rate_limit_key = rate_limit_key('bitbucket', access_token)
+
+  async def get_json(self, path: str, params: dict | None = None) -> dict:
+    return json.loads(await self._get(path, params))
+
+  async def get_text(self, path: str, params: dict | None = None) -> str:
+    return (await self._get(path, params)).decode('utf-8', errors='replace')
+
+  async def post_json(self,
+                      path: str,
+                      payload: dict,
+                      priority: RequestPriority = RequestPriority.POSTING) -> dict:
+    return await self._request('POST', path, json=payload, response_type='json', priority=priority)
+
+  async def delete(self, path: str) -> None:
+    await self._request('DELETE', path)
+
+  async def iter_values(self, path: str, params: dict | None = None) -> AsyncGenerator[dict, None]:
+    """
+      Streams `values` of a paginated endpoint page by page by following the `next` links.
+    """
+    page: dict | None = await self.get_json(path, params={'pagelen': 100, **(params or {})})
+    while page:
+      for value in page.get('values', []):
+        yield value
+      next_url = page.get('next')
+      page = await self.get_json(next_url) if next_url else None
+
+  async def _request(self,
+                     method: str,
+                     path: str,
+                     *,
+                     params: dict | None = None,
+                     json: dict | None = None,
+                     response_type: str | None = None,
+                     priority: RequestPriority = RequestPriority.NORMAL) -> Any:
+    await rate_limit_governor.acquire(self.rate_limit_key, priority)
+    session = SharedClientSession.get()
+    async with session.request(method,
+                               self._url(path),
+                               params=params,
+                               json=json,
+                               headers=self._headers()) as res:
+      self._raise_for_status(res)
+      if response_type == 'json':
+        return await res.json()
+      if response_type == 'text':
+        return await res.text()
+      return None
+
+  async def _get(self, path: str, params: dict | None = None) -> bytes:
+    """
+      GET through the conditional request cache.
+    """
+    url = self._url(path)
+    cache_key = http_cache.key(self.rate_limit_key, url, params)
+    session = SharedClientSession.get()
+    for validators in (http_cache.conditional_headers(cache_key), {}):
+      await rate_limit_governor.acquire(self.rate_limit_key)
+      async with session.get(url, params=params, headers={**self._headers(), **validators}) as res:
+        self._raise_for_status(res)
+        body = b'' if res.status == 304 else await res.read()
+        resolved = http_cache.resolve(cache_key, 'bitbucket', res.status, res.headers, body)
+      if resolved is not None:
+        return resolved[1]
+      # a 304 for an entry evicted meanwhile, asked again without validators
+    raise RuntimeError(f"Unexpected 304 from {url}")
+
+  def _raise_for_status(self, res) -> None:
+    rate_limit_governor.observe(self.rate_limit_key, res.headers)
+    if is_rate_limited(res.status, res.headers):
+      retry_after = get_retry_after(res.headers)
+      rate_limit_governor.penalize(self.rate_limit_key, retry_after)
+      raise RateLimitedError(f"Bitbucket rate limit hit on {res.url.path}",
+                             retry_after=retry_after)
+    res.raise_for_status()
+
+  def _url(self, path: str) -> str:
+    return path if path.startswith('http') else f"{self.base_url}{path}"
+
+  def _headers(self) -> dict[str, str]:
+    return {
+      'Authorization': f'Bearer {self.access_token}',
+      'Accept': 'application/json',
+    }
@@ -1,15 +1,17 @@
 from collections.abc import AsyncGenerator
-from functools import cache
 
 import aiohttp
-from atlassian.bitbucket import Cloud as BitbucketCloud
 
 from panto.data_models.git import CommentType, GitPatchFile, PostedComment, PRComment, PRPatches
 from panto.data_models.pr_review import PRSuggestions, Suggestion
 from panto.logging import log
+from panto.services.git.bitbucket_client import BitBucketClient
+from panto.services.git.comment_posting import CommentPostingExecutor
 from panto.services.git.git_service import GitService
 from panto.services.git.git_service_types import GitServiceType
+from panto.services.git.rate_limit import RequestPriority
 from panto.utils.git import diff_str_to_patchfiles
+from panto.utils.http import RateLimitedError
 from panto.utils.misc import repo_url_to_repo_name
 
 
@@ -20,9 +22,10 @@ class BitBucketService(GitService):
     self.workspace = self.repo_name.split('/')[0]
     self.repo_slug = self.repo_name.split('/')[1]
     self.access_token: str = None  # type: ignore
-    self.bitbucket: BitbucketCloud = None  # type: ignore
-    self.bitbucket_base_url = "https://api.bitbucket.org/2.0"
+    self.client: BitBucketClient = None  # type: ignore
+    self.repo_path = f"/repositories/{self.workspace}/{self.repo_slug}"
     self._this_user_id: str | None = None
+    self._prs: dict[int, dict] = {}
 
   def get_provider(self) -> GitServiceType:
     return GitServiceType.BITBUCKET
@@ -30,7 +33,7 @@ class BitBucketService(GitService):
   async def init_service(self, **kvargs):
     assert 'access_token' in kvargs, 'access_token is required'
     self.access_token = kvargs['access_token']
-    self.bitbucket = BitbucketCloud(token=self.access_token)
+    self.client = BitBucketClient(self.access_token)
 
   async def add_reaction(self,
                          pull_request_no: int,
@@ -52,20 +55,19 @@ class BitBucketService(GitService):
         'raw': reaction_map.get(reaction, '👍')
       },
     }
-    url = f'{self.bitbucket_base_url}/repositories/{self.workspace}/{self.repo_slug}/pullrequests/{pull_request_no}/comments'  # noqa
-
-    async with aiohttp.ClientSession() as session:
-      self._attach_auth_header_to_session(session)
-      async with session.post(url, json=data) as res:
-        res.raise_for_status()
+    try:
+      await self.client.post_json(self._pr_path(pull_request_no, 'comments'),
+                                  data,
+                                  priority=RequestPriority.OPTIONAL)
+    except RateLimitedError:
+      log.info(f"Skipped reaction on PR {pull_request_no}, rate limit budget is low")
 
   async def add_review(self, pull_request_no: int,
                        suggestions: PRSuggestions) -> list[PostedComment]:
     return await self.add_review_comment(pull_request_no, suggestions)
 
   async def add_comment(self, pull_request_no: int, comment: str) -> PostedComment:
-    pr = self._get_pr(pull_request_no)
-    res = pr.comment(comment)
+    res = await self._post_comment(pull_request_no, comment)
     return PostedComment(id=str(res['id']), type=CommentType.GENERAL)
 
   async def add_review_comment(self, pull_request_no: int,
@@ -86,10 +88,16 @@ class BitBucketService(GitService):
         overall_msg += "**Overall few points:** \n\n" + "\n".join(
           [f" - {s.suggestion}" for s in overall_comments])
 
-    pr = self._get_pr(pull_request_no)
+    executor = CommentPostingExecutor.get(self.get_provider())
+    results = await executor.map(lambda s: self._create_review_comment(pull_request_no, s),
+                                 comments)
     failed_suggestions: list[Suggestion] = []
-    for s in comments:
-      successful, comment_id = await self._create_review_comment(pull_request_no, s)
+    for s, result in zip(comments, results):
+      if isinstance(result, BaseException):
+        log.error(f"Error while creating comment: {result}")
+        failed_suggestions.append(s)
+        continue
+      successful, comment_id = result
       if successful and comment_id:
         postedcomments_map[s.id] = PostedComment(
           id=comment_id,
@@ -128,7 +136,7 @@ class BitBucketService(GitService):
       overall_msg += "\n".join(level2_msgs)
 
     if overall_msg:
-      commented_res = pr.comment(overall_msg)
+      commented_res = await self._post_comment(pull_request_no, overall_msg)
       comment_id = str(commented_res['id'])
       postedcomments_map['__review_notes'] = PostedComment(
         id=comment_id,
@@ -162,13 +170,12 @@ class BitBucketService(GitService):
 
   async def _comment_on_line_number(self, pull_request_no: int, comment: str, file_name: str,
                                     line_number: int) -> dict:
-    endpoint = f'{self.bitbucket_base_url}/repositories/{self.workspace}/{self.repo_slug}/pullrequests/{pull_request_no}/comments'  # noqa
     payload = {'content': {'raw': comment}, 'inline': {'path': file_name, 'to': line_number}}
-    async with aiohttp.ClientSession() as session:
-      self._attach_auth_header_to_session(session)
-      async with session.post(endpoint, json=payload) as res:
-        res.raise_for_status()
-        return await res.json()
+    return await self.client.post_json(self._pr_path(pull_request_no, 'comments'), payload)
+
+  async def _post_comment(self, pull_request_no: int, comment: str) -> dict:
+    payload = {'content': {'raw': comment}}
+    return await self.client.post_json(self._pr_path(pull_request_no, 'comments'), payload)
 
   async def _create_review_comment(self, pull_request_no: int, suggestion: Suggestion):
     c = suggestion
@@ -180,112 +187,128 @@ class BitBucketService(GitService):
                                                line_number)
       comment_id: str = res['id']
       return True, str(comment_id)
+    except RateLimitedError:
+      raise
     except Exception as e:
       log.error(f"Error while creating comment: {e}")
       return False, None
 
   async def clear_all_my_comment(self, pull_request_no: int) -> None:
     my_user_id = await self._get_own_user_id()
-    pr = self._get_pr(pull_request_no)
-    for comment in pr.comments():
-      if comment.user.uuid == my_user_id:
-        comment.delete()
+    comments_path = self._pr_path(pull_request_no, 'comments')
+    my_comment_ids = [
+      str(comment['id']) async for comment in self.client.iter_values(comments_path)
+      if not comment.get('deleted', False) and comment.get('user', {}).get('uuid') == my_user_id
+    ]
+    await self._delete_comment_ids(pull_request_no, my_comment_ids)
+
+  async def delete_comments(self, pull_request_no: int, comments: list[PostedComment]) -> None:
+    comment_ids = list(dict.fromkeys(c.id for c in comments))
+    await self._delete_comment_ids(pull_request_no, comment_ids)
+
+  async def _delete_comment_ids(self, pull_request_no: int, comment_ids: list[str]) -> None:
+    comments_path = self._pr_path(pull_request_no, 'comments')
+
+    async def delete(comment_id: str):
+      try:
+        await self.client.delete(f"{comments_path}/{comment_id}")
+      except aiohttp.ClientResponseError as e:
+        if e.status != 404:  # already deleted
+          raise
+
+    executor = CommentPostingExecutor.get(self.get_provider())
+    results = await executor.map(delete, comment_ids)
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+      log.error(f"Failed to delete {len(failed)}/{len(comment_ids)} comments: {failed[0]}")
 
   async def get_pr_head(self, pull_request_no: int) -> str:
-    pr = self._get_pr(pull_request_no)
-    return pr.source_commit
+    pr = await self._get_pr(pull_request_no)
+    return pr['source']['commit']['hash']
 
   async def get_pr_description(self, pr_no: int) -> str:
-    pr = self._get_pr(pr_no)
-    return pr.description
+    pr = await self._get_pr(pr_no)
+    return pr.get('description') or ""
 
   async def get_diff_two_commits(self, base: str, head: str) -> list[GitPatchFile]:
-    url = f'{self.bitbucket_base_url}/repositories/{self.workspace}/{self.repo_slug}/diff/{head}..{base}'  # noqa
-    async with aiohttp.ClientSession() as session:
-      self._attach_auth_header_to_session(session)
-      async with session.get(url) as res:
-        res.raise_for_status()
-        diff_str = await res.text()
-        return diff_str_to_patchfiles(diff_str)
+    diff_str = await self.client.get_text(f"{self.repo_path}/diff/{head}..{base}")
+    return diff_str_to_patchfiles(diff_str)
 
   async def get_file_content(self, filename: str, ref: str) -> str:
-    endpoint = f'{self.bitbucket_base_url}/repositories/{self.workspace}/{self.repo_slug}/src/{ref}/{filename}'  # noqa
-    async with aiohttp.ClientSession() as session:
-      self._attach_auth_header_to_session(session)
-      async with session.get(endpoint) as res:
-        res.raise_for_status()
-        return await res.text()
+    return await self.client.get_text(f"{self.repo_path}/src/{ref}/{filename}")
 
   async def get_pr_patches(self, pr_no: int) -> PRPatches:
-    pr = self._get_pr(pr_no)
-    diff_str = pr.diff()
+    pr = await self._get_pr(pr_no)
+    diff_str = await self.client.get_text(self._pr_path(pr_no, 'diff'))
     pathfiles = diff_str_to_patchfiles(diff_str)
     return PRPatches(
-      url=pr.url,
-      number=pr.id,
-      base=pr.destination_commit,
-      head=pr.source_commit,
+      url=pr.get('links', {}).get('html', {}).get('href'),
+      number=pr['id'],
+      base=pr['destination']['commit']['hash'],
+      head=pr['source']['commit']['hash'],
       files=pathfiles,
     )
 
   async def get_comments(self, pull_request_no: int) -> AsyncGenerator[PRComment, None]:
     own_id = await self._get_own_user_id()
-    pr = self._get_pr(pull_request_no)
-    for comment in pr.comments():
-      is_deleted = comment.data.get('deleted', False)
+    # newest first, same as the other providers
+    params = {'sort': '-created_on'}
+    async for comment in self.client.iter_values(self._pr_path(pull_request_no, 'comments'),
+                                                 params=params):
+      is_deleted = comment.get('deleted', False)
       if is_deleted:
         continue
-      comment_id = comment.data.get('id')
-      created_on = comment.data.get('created_on')
+      comment_id = comment.get('id')
+      created_on = comment.get('created_on')
       if not comment_id:
         continue
+      user = comment.get('user', {})
       yield PRComment(
         id=str(comment_id),
-        user=comment.user.nickname,
-        body=comment.raw,
+        user=user.get('nickname') or user.get('display_name') or "",
+        body=comment.get('content', {}).get('raw') or "",
         created_at=created_on,
-        is_our_bot=comment.user.uuid == own_id,
-        updated_at=created_on,
+        is_our_bot=user.get('uuid') == own_id,
+        updated_at=comment.get('updated_on') or created_on,
       )
 
   async def get_pr_title(self, pr_no: int) -> str:
-    pr = self._get_pr(pr_no)
-    return pr.title
+    pr = await self._get_pr(pr_no)
+    return pr['title']
 
   async def is_valid_pr_commit(self, pr_no: int, commit_id: str):
-    pr = self._get_pr(pr_no)
-    for commit in pr.commits:
+    async for commit in self.client.iter_values(self._pr_path(pr_no, 'commits')):
       if commit_id == commit['hash']:
         return True
+    return False
 
-  @cache
-  def _get_pr(self, pr_no: int):
-    repo = self._get_repo()
-    return repo.pullrequests.get(pr_no)
-
-  @cache
-  def _get_repo(self):
-    workspace = self._get_workspace()
-    return workspace.repositories.get(self.repo_slug)
+  async def get_pr_commits(self, pr_no: int) -> list[str]:
+    return [c['hash'] async for c in self.client.iter_values(self._pr_path(pr_no, 'commits'))]
 
-  @cache
-  def _get_workspace(self):
-    return self.bitbucket.workspaces.get(self.workspace)
+  async def _is_ancestor_commit(self, ancestor: str, head: str) -> bool:
+    try:
+      merge_base = await self.client.get_json(f"{self.repo_path}/merge-base/{ancestor}..{head}")
+    except aiohttp.ClientResponseError as e:
+      if e.status == 404:
+        return False
+      raise
+    # merge-base may answer with an abbreviated hash
+    merge_base_hash = merge_base.get('hash') or ''
+    return bool(merge_base_hash) and ancestor.startswith(merge_base_hash)
+
+  async def _get_pr(self, pr_no: int) -> dict:
+    if pr_no not in self._prs:
+      self._prs[pr_no] = await self.client.get_json(self._pr_path(pr_no))
+    return self._prs[pr_no]
+
+  def _pr_path(self, pr_no: int, sub_path: str | None = None) -> str:
+    path = f"{self.repo_path}/pullrequests/{pr_no}"
+    return f"{path}/{sub_path}" if sub_path else path
 
   async def _get_own_user_id(self) -> str:
     if self._this_user_id:
       return self._this_user_id
-    endpoint = f'{self.bitbucket_base_url}/2.0/user'
-    async with aiohttp.ClientSession() as session:
-      self._attach_auth_header_to_session(session)
-      async with session.get(endpoint) as res:
-        res.raise_for_status()
-        res_json = await res.json()
-        this_user_id = res_json['uuid']
-        self._this_user_id = this_user_id
-        return this_user_id
-
-  def _attach_auth_header_to_session(self, session: aiohttp.ClientSession):
-    session.headers['Authorization'] = f'Bearer {self.access_token}'
-    session.headers['Content-Type'] = 'application/json'
-    return session
+    res_json = await self.client.get_json('/user')
+    this_user_id = res_json['uuid']
+    self._this_user_id = this_user_id
+    return this_user_id
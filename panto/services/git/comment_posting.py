@@ -0,0 +1,75 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from panto.config import (BITBUCKET_COMMENT_POSTING_CONCURRENCY, COMMENT_POSTING_MAX_RETRIES,
+                          COMMENT_POSTING_MAX_RETRY_WAIT, GH_COMMENT_POSTING_CONCURRENCY,
+                          GL_COMMENT_POSTING_CONCURRENCY)
+from panto.logging import log
+from panto.services.git.git_service_types import GitServiceType
+from panto.utils.http import RateLimitedError
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_CONCURRENCY = {
+  GitServiceType.GITHUB: GH_COMMENT_POSTING_CONCURRENCY,
+  GitServiceType.GITLAB: GL_COMMENT_POSTING_CONCURRENCY,
+  GitServiceType.BITBUCKET: BITBUCKET_COMMENT_POSTING_CONCURRENCY,
+}
+
+
+class CommentPostingExecutor:
+  """
+    Posts (or deletes) comments concurrently, capped per provider across all reviews of the
+    worker. A rate limited response pauses every pending call of that provider for the time the
+    server asked for, then the call is retried.
+  """
+  _executors: dict[GitServiceType, 'CommentPostingExecutor'] = {}
+
+  def __init__(self,
+               concurrency: int,
+               max_retries: int = COMMENT_POSTING_MAX_RETRIES,
+               max_retry_wait: float = COMMENT_POSTING_MAX_RETRY_WAIT):
+    self.concurrency = concurrency
+    self.max_retries = max_retries
+    self.max_retry_wait = max_retry_wait
+    self.loop = asyncio.get_running_loop()
+    self.semaphore = asyncio.Semaphore(concurrency)
+    self._resume_at = 0.0
+
+  @staticmethod
+  def get(provider: GitServiceType) -> 'CommentPostingExecutor':
+    executor = CommentPostingExecutor._executors.get(provider)
+    # semaphore is bound to the loop it was created on (cli runs a new loop per command)
+    if executor is None or executor.loop is not asyncio.get_running_loop():
+      executor = CommentPostingExecutor(_CONCURRENCY.get(provider, 1))
+      CommentPostingExecutor._executors[provider] = executor
+    return executor
+
+  async def map(self, func: Callable[[T], Awaitable[R]],
+                items: list[T]) -> list[R | BaseException]:
+    """
+      Runs `func` for every item and returns results (or the raised exception) in input order.
+    """
+    return await asyncio.gather(*[self._run(func, item) for item in items], return_exceptions=True)
+
+  async def _run(self, func: Callable[[T], Awaitable[R]], item: T) -> R:
+    attempt = 0
+    while True:
+      async with self.semaphore:
+        await self._wait_for_cooldown()
+        try:
+          return await func(item)
+        except RateLimitedError as e:
+          attempt += 1
+          wait = e.retry_after if e.retry_after is not None else min(2**attempt, 30)
+          if attempt > self.max_retries or wait > self.max_retry_wait:
+            raise
+          log.warning(f"Rate limited while posting comment. Retrying in {wait:.1f}s")
+          self._resume_at = max(self._resume_at, self.loop.time() + wait)
+
+  async def _wait_for_cooldown(self):
+    wait = self._resume_at - self.loop.time()
+    if wait > 0:
+      await asyncio.sleep(wait)
@@ -0,0 +1,109 @@
+import asyncio
+import re
+
+from panto.config import GIT_CAT_FILE_CACHE_SIZE
+from panto.logging import log
+from panto.utils.cache import LRUCache
+
+_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+
+class GitCatFileReader:
+  """
+    Serves `<ref>:<path>` blob lookups over one long-lived `git cat-file --batch` process per
+    repository instead of spawning `git show` per file. Requests from concurrent coroutines are
+    serialised on the pipe; contents at full commit shas are kept in a bounded LRU.
+  """
+  _readers: dict[str, 'GitCatFileReader'] = {}
+
+  def __init__(self, git_dir: str, cache_size: int = GIT_CAT_FILE_CACHE_SIZE):
+    self.git_dir = git_dir
+    self.loop = asyncio.get_running_loop()
+    self._lock = asyncio.Lock()
+    self._proc: asyncio.subprocess.Process | None = None
+    self._cache: LRUCache[tuple[str, str], str] = LRUCache(maxsize=cache_size)
+
+  @staticmethod
+  def get(git_dir: str) -> 'GitCatFileReader':
+    reader = GitCatFileReader._readers.get(git_dir)
+    # the pipe is bound to the loop it was created on (cli runs a new loop per command)
+    if reader is None or reader.loop is not asyncio.get_running_loop():
+      reader = GitCatFileReader(git_dir)
+      GitCatFileReader._readers[git_dir] = reader
+    return reader
+
+  @staticmethod
+  async def close_all() -> None:
+    readers = list(GitCatFileReader._readers.values())
+    GitCatFileReader._readers.clear()
+    for reader in readers:
+      await reader.close()
+
+  async def read(self, ref: str, path: str) -> str:
+    key = (ref, path)
+    cacheable = bool(_SHA_PATTERN.match(ref))
+    if cacheable and key in self._cache:
+      return self._cache.get(key)  # type: ignore
+
+    async with self._lock:
+      content = (await self._read_blob(f"{ref}:{path}")).decode('utf-8', errors='replace')
+
+    if cacheable:
+      self._cache.put(key, content)
+    return content
+
+  async def close(self) -> None:
+    proc = self._proc
+    self._proc = None
+    if proc and proc.returncode is None:
+      assert proc.stdin
+      proc.stdin.close()
+      await proc.wait()
+
+  async def _discard(self) -> None:
+    # the rest of an answer may still be in the pipe, the process can't be reused
+    proc = self._proc
+    self._proc = None
+    if proc and proc.returncode is None:
+      proc.kill()
+      await proc.wait()
+
+  async def _read_blob(self, object_name: str) -> bytes:
+    proc = await self._ensure_process()
+    assert proc.stdin and proc.stdout
+    data = b''
+    try:
+      proc.stdin.write(f"{object_name}\n".encode())
+      await proc.stdin.drain()
+      header = (await proc.stdout.readline()).decode().split()
+      # "<oid> <type> <size>" or "<object_name> missing"
+      if not header:
+        raise BrokenPipeError("git cat-file exited")
+      if len(header) == 3:
+        data = await proc.stdout.readexactly(int(header[2]) + 1)  # content followed by LF
+    except BaseException as e:
+      # broken, or cancelled (hedged call, job timeout) halfway through an answer: the stream
+      # is out of sync, next read starts a fresh process
+      if not isinstance(e, asyncio.CancelledError):
+        log.error(f"git cat-file failed for {self.git_dir}: {e}")
+      await asyncio.shield(self._discard())
+      raise
+
+    if len(header) != 3:
+      raise FileNotFoundError(f"{object_name} not found in {self.git_dir}")
+    obj_type = header[1]
+    if obj_type != 'blob':
+      raise IsADirectoryError(f"{object_name} is a {obj_type}, not a file")
+    return data[:-1]
+
+  async def _ensure_process(self) -> asyncio.subprocess.Process:
+    if self._proc is None or self._proc.returncode is not None:
+      self._proc = await asyncio.create_subprocess_exec(
+        'git',
+        f'--git-dir={self.git_dir}',
+        'cat-file',
+        '--batch',
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+      )
+    return self._proc
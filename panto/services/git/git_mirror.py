@@ -0,0 +1,200 @@
+import asyncio
+import enum
+import fcntl
+import hashlib
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+
+import git
+
+from panto.config import GIT_MIRROR_CACHE_DIR, LOCAL_GIT_CLONE_STRATEGY
+from panto.data_models.git import GitFetchStats
+from panto.logging import log
+
+_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+_MAX_DEEPEN_ROUNDS = 8
+
+
+class GitCloneStrategy(str, enum.Enum):
+  FULL = "full"
+  BLOBLESS = "blobless"  # all commits and trees, blobs fetched lazily when read
+  TREELESS = "treeless"  # only commits, trees and blobs fetched lazily
+  SHALLOW = "shallow"  # branch tips, deepened until base and feature share a merge base
+
+
+class GitMirror:
+  """
+    One bare repository per remote, shared by every review in the process (and by other processes
+    on the same machine through a file lock). Only the refs a review needs are fetched and all
+    reads (diff, show, log) go against object ids, so there is no working tree to race on.
+  """
+  _mirrors: dict[str, 'GitMirror'] = {}
+
+  def __init__(self, remote_url: str, path: str, strategy: GitCloneStrategy):
+    self.remote_url = remote_url
+    self.path = path
+    self.strategy = strategy
+    self.repo: git.Repo = None  # type: ignore
+    self._lock: asyncio.Lock | None = None
+    self._lock_loop: asyncio.AbstractEventLoop | None = None
+
+  @staticmethod
+  def get(remote_url: str) -> 'GitMirror':
+    if remote_url not in GitMirror._mirrors:
+      strategy = GitCloneStrategy(LOCAL_GIT_CLONE_STRATEGY)
+      path = os.path.join(GIT_MIRROR_CACHE_DIR, _mirror_dir_name(remote_url, strategy))
+      GitMirror._mirrors[remote_url] = GitMirror(remote_url, path, strategy)
+    return GitMirror._mirrors[remote_url]
+
+  async def fetch(self, base: str, head: str) -> tuple[str, str, GitFetchStats]:
+    """
+      Makes sure `base` and `head` (branch names or commit shas) are present and returns their
+      commit shas along with what the fetch cost.
+    """
+    async with self._locked():
+      return await asyncio.to_thread(self._fetch, base, head)
+
+  def _fetch(self, base: str, head: str) -> tuple[str, str, GitFetchStats]:
+    started_at = time.monotonic()
+    if self.repo is None:
+      self.repo = self._open_or_init()
+    size_before = self._objects_size()
+
+    missing = [ref for ref in (base, head) if not self._has_commit(ref)]
+    branches = [ref for ref in missing if not _SHA_PATTERN.match(ref)]
+    refspecs = _refspecs(branches)
+    if branches:
+      log.info(f"Fetching {branches} into mirror {self.path} ({self.strategy.value})")
+      new = [b for b in branches if not self._has_branch(b)]
+      known = [b for b in branches if self._has_branch(b)]
+      if new:
+        self.repo.git.fetch('origin', '--no-tags', *self._fetch_args(), *_refspecs(new))
+      if known:
+        # no --depth for branches fetched before: the new commits attach to the history
+        # earlier reviews deepened instead of cutting it back to the tip
+        self.repo.git.fetch('origin', '--no-tags', *self._filter_args(), *_refspecs(known))
+
+    for ref in missing:
+      if _SHA_PATTERN.match(ref) and not self._has_commit(ref):
+        # detached commit, only reachable when the server allows fetching by sha
+        self.repo.git.fetch('origin', '--no-tags', *self._fetch_args(), ref)
+        refspecs.append(ref)
+
+    base_sha, head_sha = self._rev_parse(base), self._rev_parse(head)
+    if self.strategy == GitCloneStrategy.SHALLOW and refspecs:
+      self._deepen_to_merge_base(base_sha, head_sha, refspecs)
+
+    stats = GitFetchStats(
+      strategy=self.strategy.value,
+      duration_ms=int((time.monotonic() - started_at) * 1000),
+      bytes=max(self._objects_size() - size_before, 0),
+    )
+    return base_sha, head_sha, stats
+
+  def _fetch_args(self) -> list[str]:
+    if self.strategy == GitCloneStrategy.SHALLOW:
+      return ['--depth=1']
+    return self._filter_args()
+
+  def _filter_args(self) -> list[str]:
+    if self.strategy == GitCloneStrategy.BLOBLESS:
+      return ['--filter=blob:none']
+    if self.strategy == GitCloneStrategy.TREELESS:
+      return ['--filter=tree:0']
+    return []
+
+  def _deepen_to_merge_base(self, base_sha: str, head_sha: str, refspecs: list[str]):
+    depth = 32
+    for _ in range(_MAX_DEEPEN_ROUNDS):
+      if self._has_merge_base(base_sha, head_sha):
+        return
+      self.repo.git.fetch('origin', '--no-tags', f'--deepen={depth}', *refspecs)
+      depth *= 2
+    if not self._has_merge_base(base_sha, head_sha):
+      log.warning(f"No merge base within shallow history of {self.path}. Unshallowing")
+      self.repo.git.fetch('origin', '--no-tags', '--unshallow', *refspecs)
+
+  def _has_merge_base(self, base_sha: str, head_sha: str) -> bool:
+    try:
+      self.repo.git.merge_base(base_sha, head_sha)
+      return True
+    except git.GitCommandError:
+      return False
+
+  def _objects_size(self) -> int:
+    stats = dict(
+      line.split(': ', 1) for line in self.repo.git.count_objects('-v').splitlines()
+      if ': ' in line)
+    return (int(stats.get('size', 0)) + int(stats.get('size-pack', 0))) * 1024
+
+  def _open_or_init(self) -> git.Repo:
+    if os.path.exists(os.path.join(self.path, 'HEAD')):
+      repo = git.Repo(self.path)
+    else:
+      log.info(f"Creating mirror for {self.remote_url} at {self.path} ({self.strategy.value})")
+      os.makedirs(self.path, exist_ok=True)
+      repo = git.Repo.init(self.path, bare=True)
+      repo.create_remote('origin', self.remote_url)
+      if self.strategy in (GitCloneStrategy.BLOBLESS, GitCloneStrategy.TREELESS):
+        # same setup `git clone --filter` does, so missing objects are fetched on demand
+        object_filter = self._filter_args()[0].removeprefix('--filter=')
+        with repo.config_writer() as config:
+          config.set_value('core', 'repositoryformatversion', 1)
+          config.set_value('extensions', 'partialclone', 'origin')
+          config.set_value('remote "origin"', 'promisor', 'true')
+          config.set_value('remote "origin"', 'partialclonefilter', object_filter)
+    return repo
+
+  def _has_branch(self, branch: str) -> bool:
+    try:
+      self.repo.git.rev_parse('--verify', '--quiet', f"refs/remotes/origin/{branch}^{{commit}}")
+      return True
+    except git.GitCommandError:
+      return False
+
+  def _has_commit(self, ref: str) -> bool:
+    if not _SHA_PATTERN.match(ref):
+      return False
+    try:
+      self.repo.git.cat_file('-e', f"{ref}^{{commit}}")
+      return True
+    except git.GitCommandError:
+      return False
+
+  def _rev_parse(self, ref: str) -> str:
+    if _SHA_PATTERN.match(ref):
+      return ref
+    return self.repo.git.rev_parse(f"refs/remotes/origin/{ref}^{{commit}}")
+
+  @asynccontextmanager
+  async def _locked(self):
+    loop = asyncio.get_running_loop()
+    # the lock is bound to the loop it was created on (cli runs a new loop per command)
+    if self._lock is None or self._lock_loop is not loop:
+      self._lock = asyncio.Lock()
+      self._lock_loop = loop
+
+    async with self._lock:
+      os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+      with open(f"{self.path}.lock", 'w') as lock_file:
+        # other processes (parallel cli / ci runs) fetching into the same mirror
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+          yield
+        finally:
+          fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _mirror_dir_name(remote_url: str, strategy: GitCloneStrategy) -> str:
+  name = remote_url.rstrip('/').split('/')[-1].split(':')[-1].removesuffix('.git')
+  name = re.sub(r'[^\w.-]', '_', name) or 'repo'
+  digest = hashlib.sha1(remote_url.encode()).hexdigest()[:10]
+  # one mirror per strategy: a mirror set up for another one (missing promisor config,
+  # truncated history) can't serve this one
+  return f"{name}-{digest}-{strategy.value}.git"
+
+
+def _refspecs(branches: list[str]) -> list[str]:
+  return [f"+refs/heads/{b}:refs/remotes/origin/{b}" for b in branches]
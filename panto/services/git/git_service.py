@@ -1,16 +1,24 @@
 import abc
 import json
+import re
 from collections.abc import AsyncGenerator
 
-from panto.data_models.git import GitPatchFile, PostedComment, PRComment, PRPatches
+from panto.data_models.git import GitFetchStats, GitPatchFile, PostedComment, PRComment, PRPatches
 from panto.data_models.pr_review import PRSuggestions
 from panto.data_models.review_config import ReviewConfig
 from panto.logging import log
+from panto.utils.cache import LRUCache
 
 from .git_service_types import GitServiceType
 
+_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+# Ancestry between two commit shas never changes, so it is shared by every review in the worker
+_commit_ancestry_cache: LRUCache[tuple[str, str, str, str], bool] = LRUCache(maxsize=4096)
+
 
 class GitService(abc.ABC):
+  repo_name: str
 
   @abc.abstractmethod
   async def init_service(self, **kvargs):
@@ -41,6 +49,13 @@ class GitService(abc.ABC):
   async def clear_all_my_comment(self, pull_request_no: int) -> None:
     pass
 
+  @abc.abstractmethod
+  async def delete_comments(self, pull_request_no: int, comments: list[PostedComment]) -> None:
+    """
+      Deletes comments we posted earlier (as recorded at review time) without scanning the PR.
+    """
+    pass
+
   @abc.abstractmethod
   async def get_pr_head(self, pull_request_no: int) -> str:
     pass
@@ -76,6 +91,37 @@ class GitService(abc.ABC):
   async def is_valid_pr_commit(self, pr_no: int, commit_id: str):
     pass
 
+  @abc.abstractmethod
+  async def get_pr_commits(self, pr_no: int) -> list[str]:
+    pass
+
+  async def is_ancestor_commit(self, ancestor: str, head: str) -> bool:
+    """
+      Whether `ancestor` is reachable from `head`. Answers for full shas are cached process wide.
+    """
+    if ancestor == head:
+      return True
+
+    cacheable = bool(_SHA_PATTERN.match(ancestor) and _SHA_PATTERN.match(head))
+    key = (self.get_provider().value, self.repo_name, ancestor, head)
+    if cacheable and key in _commit_ancestry_cache:
+      return bool(_commit_ancestry_cache.get(key))
+
+    is_ancestor = await self._is_ancestor_commit(ancestor, head)
+    if cacheable:
+      _commit_ancestry_cache.put(key, is_ancestor)
+    return is_ancestor
+
+  @abc.abstractmethod
+  async def _is_ancestor_commit(self, ancestor: str, head: str) -> bool:
+    pass
+
+  def get_fetch_stats(self) -> GitFetchStats | None:
+    """
+      Cost of bringing the repository locally, for services that fetch it (None for API based).
+    """
+    return None
+
   async def get_review_config(self, ref: str, more_info: str = "") -> ReviewConfig | None:
     try:
       file_content = await self.get_file_content(".panto.json", ref)
@@ -1,10 +1,20 @@
+import asyncio
+import codecs
+import json
+import re
+import urllib.parse
 from collections.abc import AsyncGenerator
-from functools import cache
+from typing import Any
 
+import aiohttp
 import github
 import github.Commit
+import github.ContentFile
 import github.File
+import github.Issue
 import github.IssueComment
+import github.PaginatedList
+import github.PullRequest
 import github.PullRequestComment
 import github.Repository
 
@@ -13,11 +23,23 @@ from panto.data_models.git import (CommentType, GitPatchFile, GitPatchStatus, Po
                                    PRComment, PRPatches)
 from panto.data_models.pr_review import PRSuggestions
 from panto.logging import log
+from panto.services.git.comment_posting import CommentPostingExecutor
 from panto.services.git.git_service_types import GitServiceType
+from panto.services.git.http_cache import http_cache
+from panto.services.git.rate_limit import RequestPriority, rate_limit_governor, rate_limit_key
+from panto.utils.git import DiffStreamParser
+from panto.utils.http import (RateLimitedError, SharedClientSession, get_retry_after,
+                              is_rate_limited)
 from panto.utils.misc import repo_url_to_repo_name
 
 from .git_service import GitService
 
+_GQL_DELETE_REVIEW_COMMENT = "deletePullRequestReviewComment"
+_GQL_DELETE_ISSUE_COMMENT = "deleteIssueComment"
+_GQL_DELETE_BATCH_SIZE = 50
+_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+_DIFF_CHUNK_SIZE = 64 * 1024
+
 
 class GitHubService(GitService):
 
@@ -26,6 +48,10 @@ class GitHubService(GitService):
     self.github: github.Github = None  # type: ignore
     self.repo: github.Repository.Repository = None  # type: ignore
     self.is_app = False
+    self.rate_limit_key = ''
+    self._pulls: dict[int, github.PullRequest.PullRequest] = {}
+    self._issues: dict[int, github.Issue.Issue] = {}
+    self._token_user_id: int | None = None
 
   async def init_service(self, **kvargs):
     installation_id = kvargs.get("installation_id")
@@ -37,19 +63,24 @@ class GitHubService(GitService):
       # integration = github.GithubIntegration(GITHUB_APP_ID, GITHUB_PRIVATE_KEY)
       # token = integration.get_access_token(installation_id).token
       app_auth = github.Auth.AppAuth(GH_APP_ID, GH_APP_PRIVATE_KEY)
-      self.github = github.Github(auth=github.Auth.AppInstallationAuth(app_auth, installation_id))
+      self.github = github.Github(auth=github.Auth.AppInstallationAuth(app_auth, installation_id),
+                                  per_page=100)
       self.is_app = True
+      self.rate_limit_key = rate_limit_key('github', f"installation:{installation_id}")
     else:
-      self.github = github.Github(auth=github.Auth.Token(personal_access_token))
+      self.github = github.Github(auth=github.Auth.Token(personal_access_token), per_page=100)
       self.is_app = False
+      self.rate_limit_key = rate_limit_key('github', personal_access_token)
 
-    self.repo = self.github.get_repo(self.repo_name)
+    self.repo = await self._call(self.github.get_repo, self.repo_name)
+    self._observe_rate_limit()
 
   async def get_comments(self, pull_request_no: int) -> AsyncGenerator[PRComment, None]:
-    pull_request = self._get_pull(pull_request_no)
-    comments = pull_request.get_issue_comments().reversed
-    for comment in comments:
-      is_my_comment = self._is_my_comment(comment)
+    pull_request = await self._get_pull(pull_request_no)
+    comments = await self._list(pull_request.get_issue_comments())
+    user_id = await self._get_token_user_id()
+    for comment in reversed(comments):
+      is_my_comment = self._is_my_comment(comment, user_id)
       yield PRComment(
         id=str(comment.id),
         body=comment.body,
@@ -66,23 +97,34 @@ class GitHubService(GitService):
     comment_id: int | None = None,
   ):
     log.info(f"Adding reaction {reaction} to PR {pull_request_no}. Comment ID: {comment_id}")
-    issue = self._get_issue(pull_request_no)
-    if comment_id:
-      comment = issue.get_comment(comment_id)
-      comment.create_reaction(reaction)
-    else:
-      issue.create_reaction(reaction)
+    try:
+      issue = await self._get_issue(pull_request_no, priority=RequestPriority.OPTIONAL)
+      if comment_id:
+        comment = await self._call(issue.get_comment,
+                                   comment_id,
+                                   priority=RequestPriority.OPTIONAL)
+        await self._call(comment.create_reaction, reaction, priority=RequestPriority.OPTIONAL)
+      else:
+        await self._call(issue.create_reaction, reaction, priority=RequestPriority.OPTIONAL)
+    except RateLimitedError:
+      log.info(f"Skipped reaction on PR {pull_request_no}, rate limit budget is low")
 
   def get_provider(self) -> GitServiceType:
     return GitServiceType.GITHUB
 
   async def is_valid_pr_commit(self, pr_no: int, commit_id: str):
-    pull_request = self._get_pull(pr_no)
-    commits = pull_request.get_commits()
-    for commit in commits:
-      if commit.sha == commit_id:
-        return True
-    return False
+    return commit_id in await self.get_pr_commits(pr_no)
+
+  async def get_pr_commits(self, pr_no: int) -> list[str]:
+    pull_request = await self._get_pull(pr_no)
+    return [commit.sha for commit in await self._list(pull_request.get_commits())]
+
+  async def _is_ancestor_commit(self, ancestor: str, head: str) -> bool:
+    try:
+      compare = await self._call(self.repo.compare, ancestor, head)
+    except github.UnknownObjectException:
+      return False
+    return compare.status in ('ahead', 'identical')
 
   async def add_review(self, pull_request_no: int,
                        suggestions: PRSuggestions) -> list[PostedComment]:
@@ -92,11 +134,13 @@ class GitHubService(GitService):
   async def add_review_comment(self, pull_request_no: int,
                                suggestions: PRSuggestions) -> list[PostedComment]:
     suggestions_dict = _feedback_to_github_review_model(suggestions)
-    return self._add_review_comment(pull_request_no, suggestions_dict)
+    return await self._add_review_comment(pull_request_no, suggestions_dict)
 
   async def add_comment(self, pull_request_no: int, comment: str) -> PostedComment:
-    pr = self._get_pull(pull_request_no)
-    commented = pr.create_issue_comment(comment)
+    pr = await self._get_pull(pull_request_no)
+    commented = await self._call(pr.create_issue_comment,
+                                 comment,
+                                 priority=RequestPriority.POSTING)
     return PostedComment(
       id=str(commented.id),
       type=CommentType.GENERAL,
@@ -104,10 +148,10 @@ class GitHubService(GitService):
     )
 
   async def get_pr_title(self, pr_no: int) -> str:
-    return self._get_pull(pr_no).title
+    return (await self._get_pull(pr_no)).title
 
   async def _add_review(self, pull_request_no: int, review: dict):
-    pull_request = self._get_pull(pull_request_no)
+    pull_request = await self._get_pull(pull_request_no)
     overall_msg = review.get('overall_msg') or ""
     comments = review['comments']
     github_comments = []
@@ -132,10 +176,10 @@ class GitHubService(GitService):
 
     try:
       if github_comments:
-        commented = pull_request.create_review(
-          event="COMMENT",
-          comments=github_comments,
-        )
+        commented = await self._call(pull_request.create_review,
+                                     event="COMMENT",
+                                     comments=github_comments,
+                                     priority=RequestPriority.POSTING)
         gh_comment_id = str(commented.id)
         for comment in comments:
           postedcomments_map[comment['comment_id']] = PostedComment(
@@ -145,8 +189,10 @@ class GitHubService(GitService):
           )
 
       if overall_msg:
-        issue = self._get_issue(pull_request_no)
-        commented = issue.create_comment(overall_msg)
+        issue = await self._get_issue(pull_request_no)
+        commented = await self._call(issue.create_comment,
+                                     overall_msg,
+                                     priority=RequestPriority.POSTING)
         gh_comment_id = str(commented.id)
         postedcomments_map['__overall'] = PostedComment(
           id=gh_comment_id,
@@ -157,49 +203,36 @@ class GitHubService(GitService):
       return list(postedcomments_map.values())
     except Exception as e:
       log.info(f"Error adding review. fallback to adding comments. {e}")
-      return self._add_review_comment(pull_request_no, review)
+      return await self._add_review_comment(pull_request_no, review)
 
-  @cache
-  def _get_last_commit(self, pull_request_no: int) -> github.Commit.Commit:
-    pull_request = self._get_pull(pull_request_no)
-    return pull_request.get_commits().reversed[0]
+  async def _get_last_commit(self, pull_request_no: int) -> github.Commit.Commit:
+    pull_request = await self._get_pull(pull_request_no)
+    return await self._call(self.repo.get_commit, pull_request.head.sha)
 
-  def _add_review_comment(self, pull_request_no: int, review: dict) -> list[PostedComment]:
+  async def _add_review_comment(self, pull_request_no: int, review: dict) -> list[PostedComment]:
     postedcomments_map: dict[str, PostedComment] = {}
-    pull_request = self._get_pull(pull_request_no)
-    commit = self._get_last_commit(pull_request_no)
+    pull_request = await self._get_pull(pull_request_no)
+    commit = await self._get_last_commit(pull_request_no)
     comments = review.get('comments') or []
     overall_msg = review.get('overall_msg') or ""
     overall_msg_ids = review.get('overall_msg_ids') or []
     level2_msg_ids = review.get('level2_msg_ids') or []
 
-    failed_comments: list = []
-    for comment in comments:
-      try:
-        body = comment['body']
-        path = comment['path']
-        start_position = comment['start_position']
-        end_position = comment['end_position']
-        log.info(
-          f"Adding comment to PR {pull_request_no} at {path}:{start_position}:{end_position}")
-        if start_position == end_position:
-          commented = pull_request.create_review_comment(body, commit, path, end_position)
-        else:
-          commented = pull_request.create_review_comment(body,
-                                                         commit,
-                                                         path,
-                                                         start_line=start_position,
-                                                         line=end_position)
-        gh_comment_id = str(commented.id)
-        postedcomments_map[comment['comment_id']] = PostedComment(
-          id=gh_comment_id,
-          type=CommentType.INLINE,
-          cid=comment['comment_id'],
-        )
+    executor = CommentPostingExecutor.get(self.get_provider())
+    results = await executor.map(lambda c: self._create_review_comment(pull_request, commit, c),
+                                 comments)
 
-      except Exception as e:
-        log.info(f"Error adding comment: {e}")
+    failed_comments: list = []
+    for comment, result in zip(comments, results):
+      if isinstance(result, BaseException):
+        log.info(f"Error adding comment: {result}")
         failed_comments.append(comment)
+        continue
+      postedcomments_map[comment['comment_id']] = PostedComment(
+        id=str(result.id),
+        type=CommentType.INLINE,
+        cid=comment['comment_id'],
+      )
 
     if failed_comments:
       if overall_msg:
@@ -209,8 +242,10 @@ class GitHubService(GitService):
       overall_msg += "\n".join([f" - {s['body']}" for s in failed_comments])
 
     if overall_msg:
-      issue = self._get_issue(pull_request_no)
-      commented = issue.create_comment(overall_msg)
+      issue = await self._get_issue(pull_request_no)
+      commented = await self._call(issue.create_comment,
+                                   overall_msg,
+                                   priority=RequestPriority.POSTING)
       gh_comment_id = str(commented.id)
       postedcomments_map['__review_notes'] = PostedComment(
         id=gh_comment_id,
@@ -243,43 +278,212 @@ class GitHubService(GitService):
 
     return list(postedcomments_map.values())
 
-  async def clear_all_my_comment(self, pull_request_no):
-    pull_request = self._get_pull(pull_request_no)
-    comments = pull_request.get_review_comments()
-    # current_user_id = self._get_token_user_id()
+  async def _create_review_comment(self, pull_request: github.PullRequest.PullRequest,
+                                   commit: github.Commit.Commit,
+                                   comment: dict) -> github.PullRequestComment.PullRequestComment:
+    body = comment['body']
+    path = comment['path']
+    start_position = comment['start_position']
+    end_position = comment['end_position']
+    log.info(
+      f"Adding comment to PR {pull_request.number} at {path}:{start_position}:{end_position}")
+    if start_position == end_position:
+      return await self._call(pull_request.create_review_comment,
+                              body,
+                              commit,
+                              path,
+                              end_position,
+                              priority=RequestPriority.POSTING)
+    return await self._call(pull_request.create_review_comment,
+                            body,
+                            commit,
+                            path,
+                            start_line=start_position,
+                            line=end_position,
+                            priority=RequestPriority.POSTING)
 
-    for comment in comments:
-      if self._is_my_comment(comment):
-        comment.delete()
-
-    issues = self._get_issue(pull_request_no)
-    comments = issues.get_comments()
-    for comment in comments:
-      if self._is_my_comment(comment):
-        comment.delete()
+  async def clear_all_my_comment(self, pull_request_no):
+    pull_request = await self._get_pull(pull_request_no)
+    review_comments = await self._list(pull_request.get_review_comments())
+    issue = await self._get_issue(pull_request_no)
+    issue_comments = await self._list(issue.get_comments())
+    user_id = await self._get_token_user_id()
+
+    # listed comments come with node ids, so they can all go through graphql batches
+    node_ids = [(_GQL_DELETE_REVIEW_COMMENT, c.raw_data['node_id']) for c in review_comments
+                if self._is_my_comment(c, user_id)]
+    node_ids += [(_GQL_DELETE_ISSUE_COMMENT, c.raw_data['node_id']) for c in issue_comments
+                 if self._is_my_comment(c, user_id)]
+    await self._delete_by_node_ids(node_ids)
+
+  async def delete_comments(self, pull_request_no: int, comments: list[PostedComment]) -> None:
+    pull_request = await self._get_pull(pull_request_no)
+    review_ids = list(dict.fromkeys(c.id for c in comments if c.type == CommentType.REVIEW))
+    inline_ids = list(dict.fromkeys(c.id for c in comments if c.type == CommentType.INLINE))
+    general_ids = list(dict.fromkeys(c.id for c in comments if c.type == CommentType.GENERAL))
+
+    async def list_review_comments(review_id: str):
+      return await self._list(pull_request.get_single_review_comments(int(review_id)))
+
+    # a submitted review can't be deleted, only its comments (one listing call per review)
+    executor = CommentPostingExecutor.get(self.get_provider())
+    node_ids: list[tuple[str, str]] = []
+    for review_comments in await executor.map(list_review_comments, review_ids):
+      if isinstance(review_comments, BaseException):
+        log.error(f"Failed to list review comments: {review_comments}")
+        continue
+      node_ids += [(_GQL_DELETE_REVIEW_COMMENT, c.raw_data['node_id']) for c in review_comments]
+    await self._delete_by_node_ids(node_ids)
+
+    urls = [f"{self.repo.url}/pulls/comments/{i}" for i in inline_ids]
+    urls += [f"{self.repo.url}/issues/comments/{i}" for i in general_ids]
+    results = await executor.map(self._delete_url, urls)
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+      log.error(f"Failed to delete {len(failed)}/{len(urls)} comments: {failed[0]}")
+
+  async def _delete_url(self, url: str) -> None:
+    try:
+      await self._call(self._requester().requestJsonAndCheck, "DELETE", url)
+    except github.UnknownObjectException:
+      pass  # already deleted
+
+  async def _delete_by_node_ids(self, node_ids: list[tuple[str, str]]) -> None:
+    """
+      Deletes comments by graphql node id, `_GQL_DELETE_BATCH_SIZE` aliased mutations per request.
+    """
+    batches = [
+      node_ids[i:i + _GQL_DELETE_BATCH_SIZE]
+      for i in range(0, len(node_ids), _GQL_DELETE_BATCH_SIZE)
+    ]
+    executor = CommentPostingExecutor.get(self.get_provider())
+    results = await executor.map(self._graphql_delete_batch, batches)
+    for batch, result in zip(batches, results):
+      if isinstance(result, BaseException):
+        log.error(f"Failed to delete {len(batch)} comments: {result}")
+
+  async def _graphql_delete_batch(self, batch: list[tuple[str, str]]) -> None:
+    params = ", ".join(f"$id{i}: ID!" for i in range(len(batch)))
+    fields = "\n".join(f"d{i}: {mutation}(input: {{id: $id{i}}}) {{ clientMutationId }}"
+                       for i, (mutation, _) in enumerate(batch))
+    query = f"mutation({params}) {{\n{fields}\n}}"
+    variables = {f"id{i}": node_id for i, (_, node_id) in enumerate(batch)}
+    requester = self._requester()
+    _, data = await self._call(requester.requestJsonAndCheck,
+                               "POST",
+                               requester.graphql_url,
+                               input={
+                                 "query": query,
+                                 "variables": variables
+                               })
+    # errors are per alias (e.g. already deleted), the rest of the batch is still applied
+    errors = data.get('errors') or []
+    if errors:
+      log.warning(f"{len(errors)}/{len(batch)} comment deletions failed: {errors[0]}")
+
+  def _requester(self):
+    # PyGithub has no public accessor for the authenticated requester
+    return self.repo._requester
+
+  async def _call(self, func, *args, priority: RequestPriority = RequestPriority.NORMAL, **kwargs):
+    """
+      Runs a PyGithub call off the event loop within the rate limit budget of the installation.
+    """
+    await rate_limit_governor.acquire(self.rate_limit_key, priority)
+    try:
+      return await _in_thread(func, *args, **kwargs)
+    except RateLimitedError as e:
+      rate_limit_governor.penalize(self.rate_limit_key, e.retry_after)
+      raise
+    finally:
+      self._observe_rate_limit()
+
+  async def _list(self,
+                  paginated: github.PaginatedList.PaginatedList,
+                  priority: RequestPriority = RequestPriority.NORMAL) -> list:
+    """
+      Items of a PyGithub paginated list, one `_call` per page (iterating the list would fetch
+      the pages on the event loop, outside the rate limit budget).
+    """
+    items: list = []
+    page = 0
+    while True:
+      batch = await self._call(paginated.get_page, page, priority=priority)
+      items += batch
+      if len(batch) < self.github.per_page:
+        return items
+      page += 1
+
+  def _conditional_get(self,
+                       url: str,
+                       params: dict | None = None,
+                       immutable: bool = False) -> tuple[dict[str, str], Any]:
+    """
+      Blocking GET through the conditional request cache, a 304 is answered with the cached
+      body.
+    """
+    cache_key = http_cache.key(self.rate_limit_key, url, params)
+    if immutable and (entry := http_cache.get(cache_key, 'github')):
+      return entry.headers, entry.body
+    requester = self._requester()
+    for validators in (http_cache.conditional_headers(cache_key), {}):
+      status, headers, output = requester.requestJson("GET",
+                                                      url,
+                                                      parameters=params,
+                                                      headers=validators)
+      data = json.loads(output) if output else None
+      if status >= 400:
+        raise requester.createException(status, headers, data)
+      resolved = http_cache.resolve(cache_key, 'github', status, headers, data)
+      if resolved is not None:
+        return resolved
+      # a 304 for an entry evicted meanwhile, asked again without validators
+    raise github.GithubException(304, data, headers, f"Unexpected 304 from {url}")
+
+  def _observe_rate_limit(self) -> None:
+    if self.repo is None:
+      return  # the repo is being fetched, observed right after
+    # the requester keeps the quota headers of the last response, whichever call made it
+    requester = self._requester()
+    remaining, limit = requester.rate_limiting
+    if limit >= 0:
+      rate_limit_governor.record(self.rate_limit_key, remaining, limit,
+                                 requester.rate_limiting_resettime)
 
   async def get_pr_head(self, pull_request_no: int) -> str:
-    pr = self._get_pull(pull_request_no)
+    pr = await self._get_pull(pull_request_no)
     return pr.head.sha
 
   async def get_pr_description(self, pr_no: int) -> str:
-    return self._get_pull(pr_no).body
+    return (await self._get_pull(pr_no)).body
 
-  @cache
   async def get_file_content(self, filename: str, ref: str) -> str:
-    content = self.repo.get_contents(filename, ref)
-    return content.decoded_content.decode('utf-8')  # type: ignore
+    url = f"{self.repo.url}/contents/{urllib.parse.quote(filename)}"
+    # content at a commit sha never changes, at a branch it is revalidated
+    headers, data = await self._call(self._conditional_get,
+                                     url, {'ref': ref},
+                                     immutable=bool(_SHA_PATTERN.match(ref)))
+    content = github.ContentFile.ContentFile(self._requester(), headers, data, completed=True)
+    return content.decoded_content.decode('utf-8')
 
   async def get_diff_two_commits(self, base: str, head: str) -> list[GitPatchFile]:
-    compare = self.repo.compare(base, head)
+    compare = await self._call(self.repo.compare, base, head)
     return _map_github_files_to_patch_files(compare.files)
 
   async def get_pr_patches(self, pr_no: int) -> PRPatches:
-    pr = self._get_pull(pr_no)
+    pr = await self._get_pull(pr_no)
     patch_files: list[GitPatchFile] = []
 
-    github_files = list(pr.get_files())
-    patch_files = _map_github_files_to_patch_files(github_files)
+    try:
+      patch_files = await self._get_pr_diff_files(pr)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+      # e.g. 406 when the diff is over GitHub's size limit
+      log.warning(f"Failed to fetch raw diff of PR {pr_no}, falling back to files api: {e}")
+    if len(patch_files) < pr.changed_files:
+      log.info(f"Raw diff of PR {pr_no} has {len(patch_files)}/{pr.changed_files} files. "
+               "Using files api")
+      github_files = await self._list(pr.get_files())
+      patch_files = _map_github_files_to_patch_files(github_files)
 
     return PRPatches(
       url=pr.diff_url,
@@ -289,24 +493,83 @@ class GitHubService(GitService):
       files=patch_files,
     )
 
-  @cache
-  def _get_pull(self, pr_no: int):
-    return self.repo.get_pull(pr_no)
-
-  @cache
-  def _get_issue(self, issue_no: int):
-    return self.repo.get_issue(issue_no)
+  async def _get_pr_diff_files(self, pr: github.PullRequest.PullRequest) -> list[GitPatchFile]:
+    """
+      Whole PR diff in one request (`application/vnd.github.diff`), parsed while it streams in.
+      Unlike the files api it isn't paged and keeps the patches of large files.
+    """
+    auth = self._requester().auth
+    # installation tokens are refreshed (blocking) when they expire
+    token = await asyncio.to_thread(lambda: auth.token)
+    headers = {
+      'Authorization': f"{auth.token_type} {token}",
+      'Accept': 'application/vnd.github.diff',
+    }
+    await rate_limit_governor.acquire(self.rate_limit_key)
+    parser = DiffStreamParser()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    patch_files: list[GitPatchFile] = []
+    async with SharedClientSession.get().get(pr.url, headers=headers) as res:
+      rate_limit_governor.observe(self.rate_limit_key, res.headers)
+      if is_rate_limited(res.status, res.headers):
+        retry_after = get_retry_after(res.headers)
+        rate_limit_governor.penalize(self.rate_limit_key, retry_after)
+        raise RateLimitedError(f"GitHub rate limit hit on {res.url.path}", retry_after=retry_after)
+      res.raise_for_status()
+      async for chunk in res.content.iter_chunked(_DIFF_CHUNK_SIZE):
+        patch_files += parser.feed(decoder.decode(chunk))
+    patch_files += parser.feed(decoder.decode(b'', final=True))
+    return patch_files + parser.close()
+
+  async def _get_pull(self, pr_no: int) -> github.PullRequest.PullRequest:
+    if pr_no not in self._pulls:
+      headers, data = await self._call(self._conditional_get, f"{self.repo.url}/pulls/{pr_no}")
+      self._pulls[pr_no] = github.PullRequest.PullRequest(self._requester(),
+                                                          headers,
+                                                          data,
+                                                          completed=True)
+    return self._pulls[pr_no]
+
+  async def _get_issue(self,
+                       issue_no: int,
+                       priority: RequestPriority = RequestPriority.NORMAL) -> github.Issue.Issue:
+    if issue_no not in self._issues:
+      self._issues[issue_no] = await self._call(self.repo.get_issue, issue_no, priority=priority)
+    return self._issues[issue_no]
 
   def _is_my_comment(self, comment: github.IssueComment.IssueComment
-                     | github.PullRequestComment.PullRequestComment):
+                     | github.PullRequestComment.PullRequestComment, user_id: int | None) -> bool:
     if self.is_app:
       return comment.user.login.lower() == GH_BOT_NAME.lower()
-    current_user_id = self._get_token_user_id()
-    return comment.user.id == current_user_id
+    return comment.user.id == user_id
 
-  @cache
-  def _get_token_user_id(self):
-    return self.github.get_user().id
+  async def _get_token_user_id(self) -> int | None:
+    """
+      Id of the user of a personal access token, None for an app (its comments are told apart
+      by login).
+    """
+    if self.is_app:
+      return None
+    if self._token_user_id is None:
+      self._token_user_id = await self._call(lambda: self.github.get_user().id)
+    return self._token_user_id
+
+
+async def _in_thread(func, *args, **kwargs):
+  """
+    Runs a blocking PyGithub call off the event loop. Rate limiting is surfaced as
+    `RateLimitedError` so the comment executor can back off.
+  """
+  try:
+    return await asyncio.to_thread(func, *args, **kwargs)
+  except github.RateLimitExceededException as e:
+    raise RateLimitedError(str(e), retry_after=get_retry_after(e.headers or {})) from e
+  except github.GithubException as e:
+    # secondary rate limits come back as 403 with a retry-after header
+    headers = {k.lower(): v for k, v in (e.headers or {}).items()}
+    if e.status in (403, 429) and 'retry-after' in headers:
+      raise RateLimitedError(str(e), retry_after=get_retry_after(headers)) from e
+    raise
 
 
 def _map_github_files_to_patch_files(github_files: list[github.File.File]) -> list[GitPatchFile]:
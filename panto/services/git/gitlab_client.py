@@ -0,0 +1,136 @@
+import json
+from collections.abc import AsyncGenerator
+from typing import Any
+from urllib.parse import quote
+
+from gitlab.exceptions import GitlabHttpError
+from pydantic import BaseModel
+
+from panto.services.git.http_cache import http_cache
+from panto.services.git.rate_limit import RequestPriority, rate_limit_governor, rate_limit_key
+from panto.utils.http import (RateLimitedError, SharedClientSession, get_retry_after,
+                              is_rate_limited)
+
+
+class MergeRequestSnapshot(BaseModel):
+  iid: int
+  title: str
+  description: str
+  web_url: str | None
+  base_sha: str
+  start_sha: str
+  head_sha: str
+
+  @property
+  def diff_refs(self) -> dict[str, str]:
+    return {
+      'base_sha': self.base_sha,
+      'start_sha': self.start_sha,
+      'head_sha': self.head_sha,
+    }
+
+
+class GitLabClient:
+  """
+    Async client for the GitLab REST API v4 on top of the shared pooled session.
+    Errors are raised as python-gitlab's `GitlabHttpError` so callers keep the same handling,
+    except rate limiting which is raised as `RateLimitedError`.
+  """
+
+  def __init__(self, instance_url: str, private_token: str):
+    self.api_base_url = f"{instance_url.rstrip('/')}/api/v4"
+    self.private_token = private_token
+    self.rate_limit_key = rate_limit_key('gitlab', f"{self.api_base_url}:{private_token}")
+
+  async def get_json(self, path: str, params: dict | None = None) -> Any:
+    _, body = await self._get(path, params)
+    return json.loads(body)
+
+  async def get_text(self, path: str, params: dict | None = None) -> str:
+    _, body = await self._get(path, params)
+    return body.decode('utf-8', errors='replace')
+
+  async def post_json(self,
+                      path: str,
+                      payload: dict,
+                      priority: RequestPriority = RequestPriority.POSTING) -> dict:
+    return await self._request('POST', path, json=payload, response_type='json', priority=priority)
+
+  async def delete(self, path: str) -> None:
+    await self._request('DELETE', path)
+
+  async def iter_pages(self, path: str, params: dict | None = None) -> AsyncGenerator[dict, None]:
+    """
+      Streams items of a paginated list endpoint, fetching the next page only when needed.
+    """
+    page: str | None = '1'
+    while page:
+      headers, body = await self._get(path, {**(params or {}), 'per_page': 100, 'page': page})
+      page = headers.get('x-next-page') or None
+      for item in json.loads(body):
+        yield item
+
+  async def _get(self, path: str, params: dict | None = None) -> tuple[dict[str, str], bytes]:
+    """
+      GET through the conditional request cache, returns the (lower cased) headers and body.
+    """
+    url = self._url(path)
+    cache_key = http_cache.key(self.rate_limit_key, url, params)
+    session = SharedClientSession.get()
+    for validators in (http_cache.conditional_headers(cache_key), {}):
+      await rate_limit_governor.acquire(self.rate_limit_key)
+      async with session.get(url, params=params, headers={**self._headers(), **validators}) as res:
+        await self._raise_for_status(res)
+        body = b'' if res.status == 304 else await res.read()
+        resolved = http_cache.resolve(cache_key, 'gitlab', res.status, res.headers, body)
+      if resolved is not None:
+        return resolved
+      # a 304 for an entry evicted meanwhile, asked again without validators
+    raise GitlabHttpError(response_code=304, error_message=f"Unexpected 304 from {url}")
+
+  async def _request(self,
+                     method: str,
+                     path: str,
+                     *,
+                     params: dict | None = None,
+                     json: dict | None = None,
+                     response_type: str | None = None,
+                     priority: RequestPriority = RequestPriority.NORMAL) -> Any:
+    await rate_limit_governor.acquire(self.rate_limit_key, priority)
+    session = SharedClientSession.get()
+    async with session.request(method,
+                               self._url(path),
+                               params=params,
+                               json=json,
+                               headers=self._headers()) as res:
+      await self._raise_for_status(res)
+      if response_type == 'json':
+        return await res.json()
+      if response_type == 'text':
+        return await res.text()
+      return None
+
+  async def _raise_for_status(self, res) -> None:
+    rate_limit_governor.observe(self.rate_limit_key, res.headers)
+    if res.status < 400:
+      return
+    if is_rate_limited(res.status, res.headers):
+      retry_after = get_retry_after(res.headers)
+      rate_limit_governor.penalize(self.rate_limit_key, retry_after)
+      raise RateLimitedError(f"GitLab rate limit hit on {res.url.path}", retry_after=retry_after)
+    body = await res.read()
+    raise GitlabHttpError(
+      error_message=body.decode('utf-8', errors='replace'),
+      response_code=res.status,
+      response_body=body,
+    )
+
+  def _url(self, path: str) -> str:
+    return path if path.startswith('http') else f"{self.api_base_url}{path}"
+
+  def _headers(self) -> dict[str, str]:
+    return {'PRIVATE-TOKEN': self.private_token}
+
+
+def encode_path(path: str) -> str:
+  return quote(path, safe='')
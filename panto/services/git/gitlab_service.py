@@ -1,22 +1,28 @@
 from collections.abc import AsyncGenerator
-from functools import cache
 
-import gitlab
+from gitlab.exceptions import GitlabHttpError
 
 from panto.data_models.git import CommentType, GitPatchFile, PostedComment, PRComment, PRPatches
 from panto.data_models.pr_review import PRSuggestions, Suggestion
 from panto.logging import log
+from panto.services.git.comment_posting import CommentPostingExecutor
 from panto.services.git.git_service import GitService
 from panto.services.git.git_service_types import GitServiceType
+from panto.services.git.gitlab_client import GitLabClient, MergeRequestSnapshot, encode_path
+from panto.services.git.rate_limit import RequestPriority
 from panto.utils.git import gitlab_diff_to_patch_files
+from panto.utils.http import RateLimitedError
 from panto.utils.misc import repo_url_to_repo_name
 
 
 class GitLabService(GitService):
 
   def __init__(self, repo_url: str):
-    self.gitlab: gitlab.Gitlab = None  # type: ignore
+    self.client: GitLabClient = None  # type: ignore
+    self.user: dict = None  # type: ignore
     self.repo_name = repo_url_to_repo_name(repo_url)
+    self.project_path = f"/projects/{encode_path(self.repo_name)}"
+    self._mrs: dict[int, MergeRequestSnapshot] = {}
 
   def get_provider(self) -> GitServiceType:
     return GitServiceType.GITLAB
@@ -26,19 +32,19 @@ class GitLabService(GitService):
     assert 'oauth_token' in kvargs, 'oauth_token is required'
     gitlab_ins_url = kvargs['gitlab_ins_url']
     oauth_token = kvargs['oauth_token']
-    self.gitlab = gitlab.Gitlab(url=gitlab_ins_url, private_token=oauth_token)
-    self.gitlab.auth()
+    self.client = GitLabClient(gitlab_ins_url, oauth_token)
+    self.user = await self.client.get_json('/user')
 
   async def add_reaction(self,
                          pull_request_no: int,
                          reaction: str = 'rocket',
                          comment_id: int | None = None) -> None:
+    path = self._mr_path(pull_request_no, 'award_emoji')
+    if comment_id:
+      path = self._mr_path(pull_request_no, f'notes/{comment_id}/award_emoji')
     try:
-      if not comment_id:
-        self._get_mr(pull_request_no).awardemojis.create({'name': reaction})
-      else:
-        self._get_mr(pull_request_no).notes.get(comment_id).awardemojis.create({'name': reaction})
-    except gitlab.GitlabCreateError:
+      await self.client.post_json(path, {'name': reaction}, priority=RequestPriority.OPTIONAL)
+    except (GitlabHttpError, RateLimitedError):
       pass
 
   async def add_review(self, pull_request_no: int,
@@ -46,8 +52,8 @@ class GitLabService(GitService):
     return await self.add_review_comment(pull_request_no, suggestions)
 
   async def add_comment(self, pull_request_no: int, comment: str) -> PostedComment:
-    res = self._get_mr(pull_request_no).notes.create({'body': comment})
-    return PostedComment(id=str(res.id), type=CommentType.GENERAL)
+    res = await self.client.post_json(self._mr_path(pull_request_no, 'notes'), {'body': comment})
+    return PostedComment(id=str(res['id']), type=CommentType.GENERAL)
 
   async def add_review_comment(self, pull_request_no: int,
                                prsuggestions: PRSuggestions) -> list[PostedComment]:
@@ -67,10 +73,17 @@ class GitLabService(GitService):
         overall_msg += "Overall few points:\n" + "\n".join(
           [f" - {s.suggestion}" for s in overall_comments])
 
-    mr = self._get_mr(pull_request_no)
+    mr = await self._get_mr(pull_request_no)
+    executor = CommentPostingExecutor.get(self.get_provider())
+    results = await executor.map(lambda s: self._create_review_comment(pull_request_no, s, mr),
+                                 comments)
     failed_suggestions: list[Suggestion] = []
-    for s in comments:
-      successful, comment_id = await self._create_review_comment(pull_request_no, s)
+    for s, result in zip(comments, results):
+      if isinstance(result, BaseException):
+        log.error(f"Error while creating comment: {result}")
+        failed_suggestions.append(s)
+        continue
+      successful, comment_id = result
       if successful and comment_id:
         postedcomments_map[s.id] = PostedComment(
           id=comment_id,
@@ -120,8 +133,9 @@ class GitLabService(GitService):
         overall_msg += level2_points
 
     if overall_msg:
-      commented = mr.notes.create({'body': overall_msg})
-      comment_id = str(commented.id)
+      commented = await self.client.post_json(self._mr_path(pull_request_no, 'notes'),
+                                              {'body': overall_msg})
+      comment_id = str(commented['id'])
 
       postedcomments_map['__review_notes'] = PostedComment(
         id=comment_id,
@@ -153,96 +167,161 @@ class GitLabService(GitService):
 
     return list(postedcomments_map.values())
 
-  async def _create_review_comment(self, pull_request_no: int, suggestion: Suggestion):
+  async def _create_review_comment(self, pull_request_no: int, suggestion: Suggestion,
+                                   mr: MergeRequestSnapshot):
     c = suggestion
-    mr = self._get_mr(pull_request_no)
+    discussions_path = self._mr_path(pull_request_no, 'discussions')
     is_multi_line = c.start_line_number != c.end_line_number
     comment_obj = {
       'body': c.suggestion,
       'position': {
-        'base_sha': mr.diff_refs['base_sha'],
-        'start_sha': mr.diff_refs['start_sha'],
-        'head_sha': mr.diff_refs['head_sha'],
+        **mr.diff_refs,
         'position_type': 'text',
         'new_path': c.file_path,
         'new_line': c.start_line_number if not is_multi_line else c.end_line_number,
       }
     }
     try:
-      commented = mr.discussions.create(comment_obj)
-      comment_id = str(commented.id)
+      commented = await self.client.post_json(discussions_path, comment_obj)
+      comment_id = str(commented['id'])
       return True, comment_id
-    except gitlab.GitlabCreateError as e:
+    except GitlabHttpError as e:
       if is_multi_line:
         try:
           comment_obj['position']['new_line'] = c.end_line_number  # type: ignore
-          commented = mr.discussions.create(comment_obj)
-          comment_id = str(commented.id)
+          commented = await self.client.post_json(discussions_path, comment_obj)
+          comment_id = str(commented['id'])
           return True, comment_id
-        except gitlab.GitlabCreateError:
+        except GitlabHttpError:
           pass
       log.error(f"Error while creating comment: {e}")
       return False, None
 
   async def clear_all_my_comment(self, pull_request_no: int) -> None:
-    assert self.gitlab.user, "User not found"
-    own_id = self.gitlab.user.id
-    for note in self._get_mr(pull_request_no).notes.list():
-      if note.author['id'] == own_id:
-        note.delete()
+    own_id = self.user['id']
+    notes_path = self._mr_path(pull_request_no, 'notes')
+    my_note_ids = [
+      str(note['id']) async for note in self.client.iter_pages(notes_path)
+      if note['author']['id'] == own_id
+    ]
+    await self._delete_notes(pull_request_no, my_note_ids)
+
+  async def delete_comments(self, pull_request_no: int, comments: list[PostedComment]) -> None:
+    note_ids = list(dict.fromkeys(c.id for c in comments if c.type != CommentType.INLINE))
+    discussion_ids = list(dict.fromkeys(c.id for c in comments if c.type == CommentType.INLINE))
+
+    # inline comments are recorded by discussion id, the note ids come with the discussion
+    discussions_path = self._mr_path(pull_request_no, 'discussions')
+    executor = CommentPostingExecutor.get(self.get_provider())
+    discussions = await executor.map(
+      lambda discussion_id: self.client.get_json(f"{discussions_path}/{discussion_id}"),
+      discussion_ids)
+    for discussion in discussions:
+      if isinstance(discussion, BaseException):
+        continue
+      note_ids += [str(note['id']) for note in discussion.get('notes', [])]
+
+    await self._delete_notes(pull_request_no, note_ids)
+
+  async def _delete_notes(self, pull_request_no: int, note_ids: list[str]) -> None:
+    notes_path = self._mr_path(pull_request_no, 'notes')
+
+    async def delete(note_id: str):
+      try:
+        await self.client.delete(f"{notes_path}/{note_id}")
+      except GitlabHttpError as e:
+        if e.response_code != 404:  # already deleted
+          raise
+
+    executor = CommentPostingExecutor.get(self.get_provider())
+    results = await executor.map(delete, note_ids)
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+      log.error(f"Failed to delete {len(failed)}/{len(note_ids)} notes: {failed[0]}")
 
   async def get_pr_head(self, pull_request_no: int) -> str:
-    return self._get_mr(pull_request_no).diff_refs['head_sha']
+    return (await self._get_mr(pull_request_no)).head_sha
 
   async def get_pr_description(self, pr_no: int) -> str:
-    return self._get_mr(pr_no).description
+    return (await self._get_mr(pr_no)).description
 
   async def get_pr_title(self, pr_no: int) -> str:
-    return self._get_mr(pr_no).title
+    return (await self._get_mr(pr_no)).title
 
   async def get_diff_two_commits(self, base: str, head: str) -> list[GitPatchFile]:
-    compare = self._get_project().repository_compare(base, head)
+    compare = await self.client.get_json(f"{self.project_path}/repository/compare",
+                                         params={
+                                           'from': base,
+                                           'to': head
+                                         })
     return gitlab_diff_to_patch_files(compare['diffs'])
 
   async def get_file_content(self, filename: str, ref: str) -> str:
-    content = self._get_project().files.get(file_path=filename, ref=ref)
-    return content.decode().decode('utf-8')
+    return await self.client.get_text(
+      f"{self.project_path}/repository/files/{encode_path(filename)}/raw", params={'ref': ref})
 
   async def get_pr_patches(self, pr_no: int) -> PRPatches:
-    mr = self._get_mr(pr_no)
-    changes = mr.changes()
+    mr = await self._get_mr(pr_no)
+    changes = await self.client.get_json(self._mr_path(pr_no, 'changes'))
     patch_files = gitlab_diff_to_patch_files(changes['changes'])
     return PRPatches(
       url=mr.web_url,
       number=mr.iid,
-      base=mr.diff_refs['base_sha'],
-      head=mr.diff_refs['head_sha'],
+      base=mr.base_sha,
+      head=mr.head_sha,
       files=patch_files,
     )
 
   async def get_comments(self, pull_request_no: int) -> AsyncGenerator[PRComment, None]:
-    assert self.gitlab.user, "User not found"
-    for note in self._get_mr(pull_request_no).notes.list():
+    own_id = self.user['id']
+    params = {'order_by': 'created_at', 'sort': 'desc'}
+    async for note in self.client.iter_pages(self._mr_path(pull_request_no, 'notes'), params):
       yield PRComment(
-        id=str(note.id),
-        user=note.author['username'],
-        body=note.body,
-        created_at=note.created_at,
-        updated_at=note.updated_at,
-        is_our_bot=note.author['id'] == self.gitlab.user.id,
+        id=str(note['id']),
+        user=note['author']['username'],
+        body=note['body'],
+        created_at=note['created_at'],
+        updated_at=note['updated_at'],
+        is_our_bot=note['author']['id'] == own_id,
       )
 
   async def is_valid_pr_commit(self, pr_no: int, commit_id: str):
-    commits = self._get_mr(pr_no).commits()
-    for c in commits:
-      if c.id == commit_id:
+    async for c in self.client.iter_pages(self._mr_path(pr_no, 'commits')):
+      if c['id'] == commit_id:
         return True
     return False
 
-  @cache
-  def _get_mr(self, pr_no: int):
-    return self._get_project().mergerequests.get(pr_no)
+  async def get_pr_commits(self, pr_no: int) -> list[str]:
+    return [c['id'] async for c in self.client.iter_pages(self._mr_path(pr_no, 'commits'))]
+
+  async def _is_ancestor_commit(self, ancestor: str, head: str) -> bool:
+    path = f"{self.project_path}/repository/merge_base?refs[]={ancestor}&refs[]={head}"
+    try:
+      merge_base = await self.client.get_json(path)
+    except GitlabHttpError as e:
+      if e.response_code in (400, 404):
+        return False
+      raise
+    return merge_base.get('id') == ancestor
+
+  async def _get_mr(self, pr_no: int) -> MergeRequestSnapshot:
+    """
+      Merge request state is read once per service instance (i.e. once per review).
+    """
+    if pr_no not in self._mrs:
+      mr = await self.client.get_json(self._mr_path(pr_no))
+      diff_refs = mr.get('diff_refs') or {}
+      self._mrs[pr_no] = MergeRequestSnapshot(
+        iid=mr['iid'],
+        title=mr.get('title') or "",
+        description=mr.get('description') or "",
+        web_url=mr.get('web_url'),
+        base_sha=diff_refs.get('base_sha') or "",
+        start_sha=diff_refs.get('start_sha') or "",
+        head_sha=diff_refs.get('head_sha') or mr.get('sha') or "",
+      )
+    return self._mrs[pr_no]
 
-  @cache
-  def _get_project(self):
-    return self.gitlab.projects.get(self.repo_name)
+  def _mr_path(self, pr_no: int, sub_path: str | None = None) -> str:
+    path = f"{self.project_path}/merge_requests/{pr_no}"
+    return f"{path}/{sub_path}" if sub_path else path
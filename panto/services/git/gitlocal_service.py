@@ -1,12 +1,15 @@
-import os
+import asyncio
 from collections.abc import AsyncGenerator
 from datetime import datetime
 
 import git
 
-from panto.data_models.git import CommentType, GitPatchFile, PostedComment, PRComment, PRPatches
+from panto.data_models.git import (CommentType, GitFetchStats, GitPatchFile, PostedComment,
+                                   PRComment, PRPatches)
 from panto.data_models.pr_review import PRSuggestions
 from panto.logging import log
+from panto.services.git.git_cat_file import GitCatFileReader
+from panto.services.git.git_mirror import GitMirror
 from panto.services.git.git_service import GitService
 from panto.services.git.git_service_types import GitServiceType
 from panto.utils.git import diff_str_to_patchfiles
@@ -16,9 +19,13 @@ class GitLocalService(GitService):
 
   def __init__(self, repo_url: str) -> None:
     self.repo_url = repo_url
+    self.repo_name = repo_url
     self.feature_branch: str = None  # type: ignore
     self.base_branch: str = None  # type: ignore
+    self.base_sha: str = None  # type: ignore
+    self.head_sha: str = None  # type: ignore
     self.repo: git.Repo = None  # type: ignore
+    self.fetch_stats: GitFetchStats | None = None
 
   def get_provider(self) -> GitServiceType:
     return GitServiceType.LOCAL
@@ -28,12 +35,18 @@ class GitLocalService(GitService):
     assert 'base_branch' in kvargs, "base_branch is required"
     self.feature_branch = kvargs['feature_branch']
     self.base_branch = kvargs['base_branch']
-    clone_folder_path = _get_clone_folder_path(self.repo_url)
-    self.repo = _git_checkout_repo(self.repo_url, clone_folder_path, self.feature_branch,
-                                   self.base_branch)
+    mirror = GitMirror.get(self.repo_url)
+    self.base_sha, self.head_sha, self.fetch_stats = await mirror.fetch(
+      self.base_branch, self.feature_branch)
+    self.repo = mirror.repo
+    log.info(f"Reviewing {self.base_branch}@{self.base_sha[:8]}.."
+             f"{self.feature_branch}@{self.head_sha[:8]} from {mirror.path}")
+
+  def get_fetch_stats(self) -> GitFetchStats | None:
+    return self.fetch_stats
 
   async def get_diff_two_commits(self, base: str, head: str) -> list[GitPatchFile]:
-    return self._git_diff(base, head)
+    return await self._git_diff(base, head)
 
   async def add_reaction(self,
                          pull_request_no: int,
@@ -42,9 +55,17 @@ class GitLocalService(GitService):
     log.info(f"Adding reaction {reaction} to PR {pull_request_no}. Comment ID: {comment_id}")
 
   async def is_valid_pr_commit(self, pr_no: int, commit_id: str):
-    commits = list(self.repo.iter_commits(f'{self.base_branch}..{self.feature_branch}'))
-    commit_ids = [commit.hexsha for commit in commits]
-    return commit_id in commit_ids
+    return commit_id in await self.get_pr_commits(pr_no)
+
+  async def get_pr_commits(self, pr_no: int) -> list[str]:
+    commits = self.repo.iter_commits(f'{self.base_sha}..{self.head_sha}')
+    return [commit.hexsha for commit in commits]
+
+  async def _is_ancestor_commit(self, ancestor: str, head: str) -> bool:
+    try:
+      return self.repo.is_ancestor(ancestor, head)
+    except git.GitCommandError:
+      return False
 
   async def add_review(self, pull_request_no: int,
                        suggestions: PRSuggestions) -> list[PostedComment]:
@@ -82,8 +103,11 @@ class GitLocalService(GitService):
   async def clear_all_my_comment(self, pull_request_no: int) -> None:
     log.info(f"Clearing all comments on PR {pull_request_no}")
 
+  async def delete_comments(self, pull_request_no: int, comments: list[PostedComment]) -> None:
+    log.info(f"Deleting {len(comments)} comments on PR {pull_request_no}")
+
   async def get_pr_head(self, pull_request_no: int) -> str:
-    return self.feature_branch
+    return self.head_sha
 
   async def get_pr_description(self, pr_no: int) -> str:
     return ""
@@ -92,15 +116,11 @@ class GitLocalService(GitService):
     return ""
 
   async def get_file_content(self, filename: str, ref: str) -> str:
-    return self.repo.git.show(f"{ref}:{filename}")
+    return await GitCatFileReader.get(self.repo.git_dir).read(ref, filename)
 
   async def get_pr_patches(self, pr_no: int) -> PRPatches:
-    files = self._git_diff(self.base_branch, self.feature_branch)
-    pr_patch = PRPatches(url="",
-                         number=pr_no,
-                         base=self.base_branch,
-                         head=self.feature_branch,
-                         files=files)
+    files = await self._git_diff(self.base_sha, self.head_sha)
+    pr_patch = PRPatches(url="", number=pr_no, base=self.base_sha, head=self.head_sha, files=files)
     return pr_patch
 
   async def get_comments(self, pull_request_no: int) -> AsyncGenerator[PRComment, None]:
@@ -121,58 +141,6 @@ class GitLocalService(GitService):
       is_our_bot=False,
     )
 
-  def _git_diff(self, base, head) -> list[GitPatchFile]:
-    diff_str = self.repo.git.diff(base, head)
+  async def _git_diff(self, base: str, head: str) -> list[GitPatchFile]:
+    diff_str = await asyncio.to_thread(self.repo.git.diff, base, head)
     return diff_str_to_patchfiles(diff_str)
-
-
-def _git_checkout_repo(repo_url: str,
-                       folder: str,
-                       feature_branch: str,
-                       base_branch='main') -> git.Repo:
-  log.info(f"Cloning repo {repo_url}:{feature_branch} to {folder}")
-  if not os.path.exists(folder):
-    repo = git.Repo.clone_from(repo_url, folder, branch=feature_branch)
-  else:
-    repo = git.Repo(folder)
-
-  _git_remote_pull(repo)
-  repo.git.checkout(base_branch)
-  _get_pull(repo)
-  repo.git.checkout(feature_branch)
-  _get_pull(repo)
-
-  return repo
-
-
-def _git_remote_pull(repo: git.Repo, raise_exception: bool = False):
-  try:
-    remote_name = _git_remote_name(repo)
-    repo.remotes[remote_name].pull()
-  except Exception as e:
-    if raise_exception:
-      raise e
-
-
-def _get_pull(repo: git.Repo, raise_exception: bool = False):
-  try:
-    return repo.git.pull()
-  except Exception as e:
-    if raise_exception:
-      raise e
-    return None
-
-
-def _git_remote_name(repo: git.Repo):
-  return repo.remotes[0].name
-
-
-def _get_clone_folder_path(repo_url: str):
-  root_clone_path = "tmp"
-  subpath = _get_repo_name_and_owner(repo_url)
-  return os.path.join(root_clone_path, subpath)
-
-
-def _get_repo_name_and_owner(repo_url):
-  repo_name_with_owner = repo_url.split(':')[1].replace('.git', '')
-  return repo_name_with_owner
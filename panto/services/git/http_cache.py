@@ -0,0 +1,108 @@
+import hashlib
+import json
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from panto.config import HTTP_CACHE_MAX_BODY_BYTES, HTTP_CACHE_SIZE
+from panto.services.metrics.runtime_metrics import runtime_metrics
+from panto.utils.cache import LRUCache
+
+
+@dataclass
+class CachedResponse:
+  etag: str | None
+  last_modified: str | None
+  headers: dict[str, str]
+  body: Any
+
+
+class ConditionalRequestCache:
+  """
+    Validators (ETag / Last-Modified) and bodies of provider GET responses, shared by every
+    review of the worker. Cached entries are revalidated with `If-None-Match` /
+    `If-Modified-Since`; a 304 is answered from the cache (and doesn't count against the GitHub
+    quota). Responses that are immutable for the caller (e.g. content at a commit sha) can be
+    served without asking at all.
+  """
+
+  def __init__(self,
+               maxsize: int = HTTP_CACHE_SIZE,
+               max_body_bytes: int = HTTP_CACHE_MAX_BODY_BYTES):
+    self.max_body_bytes = max_body_bytes
+    self._entries: LRUCache[str, CachedResponse] = LRUCache(maxsize=maxsize)
+
+  @staticmethod
+  def key(credential_key: str, url: str, params: dict | None = None, accept: str = '') -> str:
+    """
+      `credential_key` must identify the token (e.g. its rate limit key), responses of one
+      token are never served to another.
+    """
+    query = json.dumps(params or {}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{credential_key}\n{url}\n{query}\n{accept}".encode()).hexdigest()
+
+  def get(self, key: str, provider: str) -> CachedResponse | None:
+    """
+      Serves an entry without revalidating it. Only for responses that can't change.
+    """
+    entry = self._entries.get(key)
+    if entry is not None:
+      _count('hits', provider)
+    return entry
+
+  def conditional_headers(self, key: str) -> dict[str, str]:
+    entry = self._entries.get(key)
+    if entry is None:
+      return {}
+    headers = {}
+    if entry.etag:
+      headers['If-None-Match'] = entry.etag
+    if entry.last_modified:
+      headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+  def resolve(self, key: str, provider: str, status: int, headers: Mapping[str, str],
+              body: Any) -> tuple[dict[str, str], Any] | None:
+    """
+      Returns the headers and body to use for a GET response: the cached ones on a 304, the
+      response itself otherwise (stored when it carries a validator). None for a 304 whose
+      entry was evicted while the request was in flight, the GET has to be sent again without
+      validators.
+    """
+    entry = self._entries.get(key)
+    if status == 304:
+      if entry is None:
+        _count('misses', provider)
+        return None
+      _count('revalidations', provider)
+      _count('hits', provider)
+      return entry.headers, entry.body
+
+    _count('revalidations' if entry is not None else 'misses', provider)
+    headers = {k.lower(): v for k, v in headers.items()}
+    self.store(key, headers, body)
+    return headers, body
+
+  def store(self, key: str, headers: Mapping[str, str], body: Any) -> None:
+    headers = {k.lower(): v for k, v in headers.items()}
+    etag, last_modified = headers.get('etag'), headers.get('last-modified')
+    size = len(body) if isinstance(body, (bytes, str)) else len(json.dumps(body, default=str))
+    if (not etag and not last_modified) or size > self.max_body_bytes:
+      self._entries.pop(key)
+      return
+    self._entries.put(key, CachedResponse(etag, last_modified, headers, body))
+    runtime_metrics.set('panto_http_cache_entries',
+                        len(self._entries),
+                        help='Provider GET responses held by the conditional request cache')
+
+  def clear(self) -> None:
+    self._entries.clear()
+
+
+def _count(outcome: str, provider: str) -> None:
+  runtime_metrics.inc(f'panto_http_cache_{outcome}_total',
+                      help=f'Provider GET {outcome} of the conditional request cache',
+                      provider=provider)
+
+
+http_cache = ConditionalRequestCache()
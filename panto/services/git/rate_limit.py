@@ -0,0 +1,173 @@
+import asyncio
+import enum
+import hashlib
+import math
+import time
+from collections.abc import Mapping
+
+from panto.config import (RATE_LIMIT_MAX_WAIT, RATE_LIMIT_NORMAL_RESERVE,
+                          RATE_LIMIT_OPTIONAL_RESERVE)
+from panto.logging import log
+from panto.services.metrics.runtime_metrics import runtime_metrics
+from panto.utils.http import RateLimitedError
+
+_RECHECK_INTERVAL = 5.0  # seconds, responses of in flight calls may refresh the budget meanwhile
+_NEAR_LIMIT_WINDOW = 60.0  # seconds, Bitbucket only says "near limit" without a reset time
+
+
+class RequestPriority(enum.IntEnum):
+  POSTING = 0  # review and comments, what the user is waiting for
+  NORMAL = 1
+  OPTIONAL = 2  # reactions and other calls the review doesn't depend on
+
+
+_RESERVES = {
+  RequestPriority.POSTING: 0.0,
+  RequestPriority.NORMAL: RATE_LIMIT_NORMAL_RESERVE,
+  RequestPriority.OPTIONAL: RATE_LIMIT_OPTIONAL_RESERVE,
+}
+
+
+class RateLimitBudget:
+  """
+    Last known quota of one installation/token. `remaining` is decremented locally per call so a
+    burst doesn't overshoot before the responses come back with fresh numbers.
+  """
+
+  def __init__(self, key: str):
+    self.key = key
+    self.limit: int | None = None
+    self.remaining: int | None = None
+    self.reset_at = 0.0  # epoch seconds
+    self.blocked_until = 0.0  # epoch seconds, set when the server asked us to back off
+
+  def wait_time(self, priority: RequestPriority, now: float) -> float:
+    if self.blocked_until > now:
+      return self.blocked_until - now
+    if self.remaining is None or self.reset_at <= now:
+      # unknown, or the window was reset since we last heard
+      return 0.0
+    reserve = math.ceil((self.limit or 0) * _RESERVES[priority])
+    if self.remaining > reserve:
+      return 0.0
+    return self.reset_at - now
+
+
+class RateLimitGovernor:
+  """
+    Shared by every git service of the worker. Calls are delayed while the quota of their
+    installation/token is within the reserve of their priority, so lower priority calls stop
+    first and posting a review can use what is left. Budgets are learnt from response headers.
+  """
+
+  def __init__(self):
+    self._budgets: dict[str, RateLimitBudget] = {}
+
+  async def acquire(self, key: str, priority: RequestPriority = RequestPriority.NORMAL) -> None:
+    budget = self._budgets.get(key)
+    if budget is None:
+      return
+
+    # optional calls (the reaction a review starts with) aren't worth holding the caller up
+    max_wait = 0.0 if priority == RequestPriority.OPTIONAL else RATE_LIMIT_MAX_WAIT
+    waited = 0.0
+    while (wait := budget.wait_time(priority, time.time())) > 0:
+      if waited + wait > max_wait:
+        runtime_metrics.inc('panto_git_rate_limit_rejected_total',
+                            help='Calls failed fast because the quota would not reset in time',
+                            key=key,
+                            priority=priority.name.lower())
+        raise RateLimitedError(f"Rate limit budget of {key} exhausted for {priority.name} calls",
+                               retry_after=wait)
+      if not waited:
+        log.info(f"Delaying {priority.name} call on {key} by up to {wait:.1f}s (rate limit)")
+      step = min(wait, _RECHECK_INTERVAL)
+      await asyncio.sleep(step)
+      waited += step
+
+    if waited:
+      runtime_metrics.inc('panto_git_rate_limit_delayed_total',
+                          help='Calls delayed to stay within the rate limit budget',
+                          key=key,
+                          priority=priority.name.lower())
+      runtime_metrics.inc('panto_git_rate_limit_delay_seconds_total',
+                          waited,
+                          help='Time calls spent waiting for rate limit budget',
+                          key=key,
+                          priority=priority.name.lower())
+    if budget.remaining is not None and budget.reset_at > time.time():
+      budget.remaining = max(budget.remaining - 1, 0)
+      self._export(budget)
+
+  def record(self, key: str, remaining: int, limit: int | None, reset_at: float) -> None:
+    budget = self._budget(key)
+    budget.remaining = remaining
+    budget.limit = limit if limit is not None else budget.limit
+    budget.reset_at = reset_at
+    self._export(budget)
+
+  def observe(self, key: str, headers: Mapping[str, str]) -> None:
+    """
+      Updates the budget from `x-ratelimit-*` (GitHub), `ratelimit-*` (GitLab) or
+      `x-ratelimit-nearlimit` (Bitbucket) response headers. Responses without them are ignored.
+    """
+    headers = {k.lower(): v for k, v in headers.items()}
+    remaining = headers.get('x-ratelimit-remaining') or headers.get('ratelimit-remaining')
+    limit = headers.get('x-ratelimit-limit') or headers.get('ratelimit-limit')
+    reset = headers.get('x-ratelimit-reset') or headers.get('ratelimit-reset')
+
+    if remaining and remaining.isdigit():
+      reset_at = float(reset) if reset and reset.isdigit() else time.time() + _NEAR_LIMIT_WINDOW
+      if reset_at < 1_000_000_000:
+        reset_at += time.time()  # delta seconds
+      self.record(key, int(remaining), int(limit) if limit and limit.isdigit() else None, reset_at)
+    elif headers.get('x-ratelimit-nearlimit', '').lower() == 'true' and limit and limit.isdigit():
+      # less than a fifth of the rolling hour quota left
+      self.record(key, int(limit) // 5, int(limit), time.time() + _NEAR_LIMIT_WINDOW)
+
+  def penalize(self, key: str, retry_after: float | None) -> None:
+    """
+      Holds back every call on `key` after the server rate limited one of them.
+    """
+    budget = self._budget(key)
+    wait = retry_after if retry_after is not None else _NEAR_LIMIT_WINDOW
+    budget.blocked_until = max(budget.blocked_until, time.time() + wait)
+    runtime_metrics.inc('panto_git_rate_limited_total',
+                        help='Responses rate limited by the provider',
+                        key=key)
+    self._export(budget)
+
+  def get_budget(self, key: str) -> RateLimitBudget | None:
+    return self._budgets.get(key)
+
+  def _budget(self, key: str) -> RateLimitBudget:
+    if key not in self._budgets:
+      self._budgets[key] = RateLimitBudget(key)
+    return self._budgets[key]
+
+  def _export(self, budget: RateLimitBudget) -> None:
+    if budget.remaining is not None:
+      runtime_metrics.set('panto_git_rate_limit_remaining',
+                          budget.remaining,
+                          help='Last known remaining provider API quota',
+                          key=budget.key)
+    if budget.limit is not None:
+      runtime_metrics.set('panto_git_rate_limit_limit',
+                          budget.limit,
+                          help='Provider API quota per window',
+                          key=budget.key)
+    runtime_metrics.set('panto_git_rate_limit_reset_timestamp',
+                        max(budget.reset_at, budget.blocked_until),
+                        help='Epoch seconds when the quota resets or the back off ends',
+                        key=budget.key)
+
+
+def rate_limit_key(provider: str, credential: str) -> str:
+  """
+    Budget key of an installation/token. Tokens are fingerprinted so they never reach metrics.
+  """
+  fingerprint = hashlib.sha256(credential.encode()).hexdigest()[:12]
+  return f"{provider.lower()}:{fingerprint}"
+
+
+rate_limit_governor = RateLimitGovernor()
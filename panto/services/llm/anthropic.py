@@ -1,73 +1,109 @@
-import time
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
 
 from anthropic import AsyncAnthropic
 
-from .llm_service import LLMService, LLMServiceType, LLMUsage
+from panto.config import LLM_MAX_RETRIES
+from panto.utils.http import SharedLLMHttpClient, llm_timeout, preconnect_llm
+
+from .llm_service import LLMCallTimer, LLMService, LLMServiceType, LLMStream, LLMUsage
+from .token_estimator import get_token_estimator
 
 anthropic_models_max_tokens_map = {
   "claude-3-5-sonnet-latest": 200_000,
+  "claude-3-5-haiku-latest": 200_000,
 }
 
 
 class AnthropicService(LLMService):
+  _tokenizer: Any = None  # loaded once per process
+  token_estimator = get_token_estimator('claude')
 
   def __init__(self, api_key: str, model: str, max_tokens: int | None = None):
     if max_tokens is None:
       max_tokens = anthropic_models_max_tokens_map.get(model)
       assert max_tokens is not None, f"Unknown model max_token: {model}"
     super().__init__(max_tokens=max_tokens)
-    self.client = AsyncAnthropic(api_key=api_key, )
+    self.api_key = api_key
     self.model = model
+    self._client: AsyncAnthropic | None = None
+
+  @property
+  def client(self) -> AsyncAnthropic:
+    # follows the shared http client, which is recreated when the event loop changes
+    http_client = SharedLLMHttpClient.get()
+    if self._client is None or self._client._client is not http_client:
+      self._client = AsyncAnthropic(
+        api_key=self.api_key,
+        http_client=http_client,
+        timeout=llm_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+      )
+    return self._client
+
+  async def warm_up(self) -> None:
+    await super().warm_up()
+    await preconnect_llm(str(self.client.base_url))
 
   async def get_encode(self, text: str) -> list[int]:
-    tokenizer = await self.client.get_tokenizer()
-    encoded_text = tokenizer.encode(text)
+    if AnthropicService._tokenizer is None:
+      AnthropicService._tokenizer = await self.client.get_tokenizer()
+    encoded_text = await asyncio.to_thread(AnthropicService._tokenizer.encode, text)
     return encoded_text.ids
 
   async def ask(self,
                 system_msg: str,
                 user_msgs: str | list[str],
                 temperature: float = 0) -> tuple[str, LLMUsage]:
+    return await self.stream(system_msg, user_msgs, temperature).collect()
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return LLMStream(self._stream_events(system_msg, user_msgs, temperature))
+
+  async def _stream_events(self, system_msg: str, user_msgs: str | list[str],
+                           temperature: float) -> AsyncIterator[str | LLMUsage]:
     if isinstance(user_msgs, str):
       user_msgs = [user_msgs]
 
-    timer_start = time.time()
-
     messages = [{
       "role": "user",
       "content": msg,
     } for msg in user_msgs]
 
-    message = await self.client.messages.create(
-      model=self.model,
-      system=system_msg,
-      messages=messages,
-      temperature=temperature,
-      max_tokens=4096,
-    )
-
-    response = ''.join(c.text for c in message.content)
-
-    system_token = len(await self.get_encode(system_msg))
-    user_token = sum([len(await self.get_encode(msg)) for msg in user_msgs])
+    timer = LLMCallTimer()
+    async with self.client.messages.stream(
+        model=self.model,
+        system=system_msg,
+        messages=messages,  # type: ignore
+        temperature=temperature,
+        max_tokens=4096,
+    ) as stream:
+      async for text in stream.text_stream:
+        timer.token()
+        yield text
+      message = await stream.get_final_message()
 
     input_tokens = message.usage.input_tokens
     output_tokens = message.usage.output_tokens
+    system_token, user_token = await self.split_input_tokens(input_tokens, system_msg, user_msgs)
 
     total_tokens = input_tokens + output_tokens
 
-    timer_end = time.time()
     usages = LLMUsage(
       system_token=system_token,
       user_token=user_token,
       output_token=output_tokens,
       total_input_token=input_tokens,
       total_token=total_tokens,
-      latency=int(timer_end - timer_start),
       llm=self.get_type(),
+      **timer.timings(),
     )
 
-    return response, usages
+    yield usages
 
   def get_type(self) -> LLMServiceType:
     return LLMServiceType.ANTHROPIC
@@ -0,0 +1,495 @@
+import abc
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from panto.config import (LLM_BATCH_BACKEND, LLM_BATCH_MAX_AGE, LLM_BATCH_MAX_POLL_ERRORS,
+                          LLM_BATCH_MAX_REQUESTS, LLM_BATCH_POLL_INTERVAL, LLM_BATCH_WINDOW)
+from panto.logging import log
+from panto.services.metrics.runtime_metrics import runtime_metrics
+
+from .llm_service import LLMCallTimer, LLMService, LLMServiceType, LLMServiceWrapper, LLMUsage
+
+_MAX_OUTPUT_TOKENS = 4096  # as asked by AnthropicService
+
+
+class BatchRequestError(Exception):
+  pass
+
+
+# called with True when a call starts waiting for its batch answer and with False once it's
+# there, so that the job running the review can leave its slot to another one meanwhile
+batch_wait_listener: ContextVar[Callable[[bool], None] | None] = ContextVar('batch_wait_listener',
+                                                                            default=None)
+
+
+@dataclass
+class BatchRequest:
+  custom_id: str
+  system_msg: str
+  user_msgs: list[str]
+  temperature: float
+
+
+@dataclass
+class BatchResult:
+  custom_id: str
+  response: str | None
+  input_tokens: int = 0
+  output_tokens: int = 0
+  error: str | None = None
+
+
+def batch_request_id(llmsrv: LLMService, system_msg: str, user_msgs: list[str],
+                     temperature: float) -> str:
+  """
+    Requests are identified by their prompt, so a review run again after a restart finds the
+    answers of the batches it submitted before.
+  """
+  model = getattr(llmsrv, 'model', '') or ''
+  key = json.dumps([llmsrv.get_type().value, model, system_msg, user_msgs, temperature])
+  return hashlib.sha256(key.encode()).hexdigest()
+
+
+class BatchBackend(abc.ABC):
+
+  @abc.abstractmethod
+  async def submit(self, requests: list[BatchRequest]) -> str:
+    """
+      Submits `requests` as one batch and returns its id.
+    """
+
+  @abc.abstractmethod
+  async def is_done(self, batch_id: str) -> bool:
+    pass
+
+  @abc.abstractmethod
+  async def results(self, batch_id: str) -> list[BatchResult]:
+    pass
+
+
+class OpenAIBatchBackend(BatchBackend):
+  """
+    OpenAI Batch API: requests are uploaded as a jsonl file, answers come back in another one.
+  """
+
+  def __init__(self, llmsrv: Any):  # OpenAIService
+    self.llmsrv = llmsrv
+
+  async def submit(self, requests: list[BatchRequest]) -> str:
+    lines = []
+    for request in requests:
+      messages = [{'role': 'system', 'content': request.system_msg}]
+      messages += [{'role': 'user', 'content': msg} for msg in request.user_msgs]
+      lines.append(
+        json.dumps({
+          'custom_id': request.custom_id,
+          'method': 'POST',
+          'url': '/v1/chat/completions',
+          'body': {
+            'model': self.llmsrv.model,
+            'messages': messages,
+            'temperature': request.temperature,
+          },
+        }))
+    jsonl = '\n'.join(lines).encode()
+    batch_file = await self.llmsrv.openai.files.create(file=('batch.jsonl', jsonl),
+                                                       purpose='batch')
+    batch = await self.llmsrv.openai.batches.create(input_file_id=batch_file.id,
+                                                    endpoint='/v1/chat/completions',
+                                                    completion_window='24h')
+    return batch.id
+
+  async def is_done(self, batch_id: str) -> bool:
+    batch = await self.llmsrv.openai.batches.retrieve(batch_id)
+    return batch.status in ('completed', 'failed', 'expired', 'cancelled')
+
+  async def results(self, batch_id: str) -> list[BatchResult]:
+    batch = await self.llmsrv.openai.batches.retrieve(batch_id)
+    results = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+      if not file_id:
+        continue
+      content = await self.llmsrv.openai.files.content(file_id)
+      for line in content.text.splitlines():
+        if line.strip():
+          results.append(self._parse_result(json.loads(line)))
+    return results
+
+  @staticmethod
+  def _parse_result(line: dict) -> BatchResult:
+    response = line.get('response') or {}
+    body = response.get('body') or {}
+    if line.get('error') or response.get('status_code') != 200:
+      error = line.get('error') or body.get('error') or f"status {response.get('status_code')}"
+      return BatchResult(line['custom_id'], None, error=json.dumps(error))
+    usage = body.get('usage') or {}
+    return BatchResult(
+      line['custom_id'],
+      body['choices'][0]['message']['content'] or '',
+      input_tokens=usage.get('prompt_tokens', 0),
+      output_tokens=usage.get('completion_tokens', 0),
+    )
+
+
+class AnthropicBatchBackend(BatchBackend):
+  """
+    Anthropic Message Batches API.
+  """
+
+  def __init__(self, llmsrv: Any):  # AnthropicService
+    self.llmsrv = llmsrv
+
+  async def submit(self, requests: list[BatchRequest]) -> str:
+    batch = await self.llmsrv.client.beta.messages.batches.create(requests=[{
+      'custom_id': request.custom_id,
+      'params': {
+        'model': self.llmsrv.model,
+        'system': request.system_msg,
+        'messages': [{
+          'role': 'user',
+          'content': msg
+        } for msg in request.user_msgs],
+        'temperature': request.temperature,
+        'max_tokens': _MAX_OUTPUT_TOKENS,
+      },
+    } for request in requests])
+    return batch.id
+
+  async def is_done(self, batch_id: str) -> bool:
+    batch = await self.llmsrv.client.beta.messages.batches.retrieve(batch_id)
+    return batch.processing_status == 'ended'
+
+  async def results(self, batch_id: str) -> list[BatchResult]:
+    results = []
+    async for entry in await self.llmsrv.client.beta.messages.batches.results(batch_id):
+      if entry.result.type != 'succeeded':
+        results.append(BatchResult(entry.custom_id, None, error=entry.result.type))
+        continue
+      message = entry.result.message
+      results.append(
+        BatchResult(
+          entry.custom_id,
+          ''.join(c.text for c in message.content if c.type == 'text'),
+          input_tokens=message.usage.input_tokens,
+          output_tokens=message.usage.output_tokens,
+        ))
+    return results
+
+
+class LocalBatchBackend(BatchBackend):
+  """
+    Stand-in for tests and local runs: a batch is answered in the background by the wrapped
+    service. Batches don't outlive the process.
+  """
+
+  def __init__(self, llmsrv: LLMService):
+    self.llmsrv = llmsrv
+    self._batches: dict[str, asyncio.Task] = {}
+
+  async def submit(self, requests: list[BatchRequest]) -> str:
+    batch_id = f"local-{uuid.uuid4().hex}"
+    self._batches[batch_id] = asyncio.create_task(self._run(requests))
+    return batch_id
+
+  async def is_done(self, batch_id: str) -> bool:
+    task = self._batches.get(batch_id)
+    return task is None or task.done()
+
+  async def results(self, batch_id: str) -> list[BatchResult]:
+    task = self._batches.pop(batch_id, None)
+    return await task if task is not None else []
+
+  async def _run(self, requests: list[BatchRequest]) -> list[BatchResult]:
+
+    async def answer(request: BatchRequest) -> BatchResult:
+      try:
+        response, usage = await self.llmsrv.ask(request.system_msg, request.user_msgs,
+                                                request.temperature)
+      except Exception as e:
+        return BatchResult(request.custom_id, None, error=repr(e))
+      return BatchResult(request.custom_id, response, usage.total_input_token, usage.output_token)
+
+    return await asyncio.gather(*[answer(request) for request in requests])
+
+
+def create_batch_backend(llmsrv: LLMService) -> BatchBackend:
+  if LLM_BATCH_BACKEND == 'local' or llmsrv.get_type() == LLMServiceType.NOOP:
+    return LocalBatchBackend(llmsrv)
+  if llmsrv.get_type() == LLMServiceType.OPENAI:
+    return OpenAIBatchBackend(llmsrv)
+  if llmsrv.get_type() == LLMServiceType.ANTHROPIC:
+    return AnthropicBatchBackend(llmsrv)
+  raise NotImplementedError(f"No batch api for {llmsrv.get_type()}")
+
+
+class LLMBatchStore:
+  """
+    Requests of the submitted batches and their answers, kept in the db (when configured) so
+    a restart doesn't lose them.
+  """
+
+  async def get(self, request_id: str) -> tuple[str | None, BatchResult | None]:
+    """
+      Batch the request was submitted with, and its result when the batch is done.
+    """
+    from panto.models.db import db_manager
+    from panto.repository.llm_batch import LLMBatchRepository
+
+    if not db_manager.scoped_session_factory:
+      return None, None
+    async with db_manager.scoped_session_factory() as db_session:
+      row = await LLMBatchRepository(db_session).get(request_id)
+    if row is None or row.status == 'FAILED':
+      return None, None
+    if row.status == 'SUBMITTED':
+      return row.batch_id, None
+    return row.batch_id, BatchResult(row.id, row.response, row.input_tokens or 0, row.output_tokens
+                                     or 0)
+
+  async def submitted(self, request_ids: list[str], batch_id: str, provider: str,
+                      model: str) -> None:
+    from panto.models.db import db_manager
+    from panto.repository.llm_batch import LLMBatchRepository
+
+    if not db_manager.scoped_session_factory:
+      return
+    async with db_manager.scoped_session_factory() as db_session:
+      await LLMBatchRepository(db_session).mark_submitted(request_ids, batch_id, provider, model)
+
+  async def finished(self, result: BatchResult) -> None:
+    from panto.models.db import db_manager
+    from panto.repository.llm_batch import LLMBatchRepository
+
+    if not db_manager.scoped_session_factory:
+      return
+    async with db_manager.scoped_session_factory() as db_session:
+      await LLMBatchRepository(db_session).mark_finished(
+        result.custom_id,
+        response=result.response,
+        input_tokens=result.input_tokens,
+        output_tokens=result.output_tokens,
+        error=result.error,
+      )
+
+  async def fail_submitted(self, batch_id: str, error: str) -> None:
+    from panto.models.db import db_manager
+    from panto.repository.llm_batch import LLMBatchRepository
+
+    if not db_manager.scoped_session_factory:
+      return
+    async with db_manager.scoped_session_factory() as db_session:
+      await LLMBatchRepository(db_session).fail_submitted(batch_id, error)
+
+  async def submitted_batches(self) -> list[tuple[str, str, str, float | None]]:
+    """
+      (provider, model, batch_id, submission epoch seconds) of the batches still waited for.
+    """
+
+    from panto.models.db import db_manager
+    from panto.repository.llm_batch import LLMBatchRepository
+
+    if not db_manager.scoped_session_factory:
+      return []
+    async with db_manager.scoped_session_factory() as db_session:
+      batches = await LLMBatchRepository(db_session).get_submitted_batches()
+    return [(provider, model, batch_id, submitted_at.timestamp() if submitted_at else None)
+            for provider, model, batch_id, submitted_at in batches]
+
+
+class LLMBatchCoordinator:
+  """
+    Collects the requests of all reviews of the process for one provider/model during
+    `LLM_BATCH_WINDOW` seconds, submits them as one batch and polls the batch until its
+    answers are in.
+  """
+  _coordinators: dict[tuple[str, str], 'LLMBatchCoordinator'] = {}
+
+  def __init__(self, llmsrv: LLMService, backend: BatchBackend):
+    self.provider = llmsrv.get_type().value
+    self.model = getattr(llmsrv, 'model', '') or ''
+    self.backend = backend
+    self.loop = asyncio.get_running_loop()
+    self._queued: dict[str, BatchRequest] = {}
+    self._waiters: dict[str, list[asyncio.Future]] = {}
+    self._members: dict[str, set[str]] = {}  # batch id -> request ids
+    self._flush_handle: asyncio.TimerHandle | None = None
+    self._tasks: set[asyncio.Task] = set()
+
+  @staticmethod
+  def get(llmsrv: LLMService) -> 'LLMBatchCoordinator':
+    key = (llmsrv.get_type().value, getattr(llmsrv, 'model', '') or '')
+    coordinator = LLMBatchCoordinator._coordinators.get(key)
+    # futures are bound to the loop they were created on (cli runs a new loop per command)
+    if coordinator is None or coordinator.loop is not asyncio.get_running_loop():
+      coordinator = LLMBatchCoordinator(llmsrv, create_batch_backend(llmsrv))
+      LLMBatchCoordinator._coordinators[key] = coordinator
+    return coordinator
+
+  async def request(self, request: BatchRequest) -> BatchResult:
+    future = self.loop.create_future()
+    waiters = self._waiters.setdefault(request.custom_id, [])
+    waiters.append(future)
+    if len(waiters) == 1:
+      try:
+        batch_id, result = await llm_batch_store.get(request.custom_id)
+        if result is not None:
+          self._resolve(result)
+        elif batch_id is not None:
+          log.info(f"Resuming batch {batch_id} for a request submitted before")
+          self.watch(batch_id, {request.custom_id})
+        else:
+          self._enqueue(request)
+      except BaseException as e:
+        # nothing would resolve the waiters that joined meanwhile, nor the next requests
+        self._resolve(BatchResult(request.custom_id, None, error=f"lookup failed: {e!r}"))
+        raise
+    return await future
+
+  def watch(self,
+            batch_id: str,
+            request_ids: set[str] | None = None,
+            submitted_at: float | None = None) -> None:
+    """
+      Polls `batch_id` until it is done, or given up on `LLM_BATCH_MAX_AGE` seconds after
+      `submitted_at` (epoch seconds, now when unknown).
+    """
+    if batch_id in self._members:
+      self._members[batch_id] |= request_ids or set()
+      return
+    self._members[batch_id] = set(request_ids or ())
+    self._spawn(self._poll(batch_id, submitted_at or time.time()))
+
+  def _enqueue(self, request: BatchRequest) -> None:
+    self._queued[request.custom_id] = request
+    if len(self._queued) >= LLM_BATCH_MAX_REQUESTS:
+      self._flush()
+    elif self._flush_handle is None:
+      self._flush_handle = self.loop.call_later(LLM_BATCH_WINDOW, self._flush)
+
+  def _flush(self) -> None:
+    if self._flush_handle is not None:
+      self._flush_handle.cancel()
+      self._flush_handle = None
+    requests = list(self._queued.values())
+    self._queued.clear()
+    if requests:
+      self._spawn(self._submit(requests))
+
+  async def _submit(self, requests: list[BatchRequest]) -> None:
+    request_ids = [request.custom_id for request in requests]
+    try:
+      batch_id = await self.backend.submit(requests)
+      await llm_batch_store.submitted(request_ids, batch_id, self.provider, self.model)
+    except Exception as e:
+      log.error(f"Error while submitting a batch of {len(requests)} LLM requests: {e}")
+      for request_id in request_ids:
+        self._resolve(BatchResult(request_id, None, error=f"batch submission failed: {e!r}"))
+      return
+
+    log.info(f"Submitted batch {batch_id} with {len(requests)} LLM requests")
+    runtime_metrics.inc('panto_llm_batch_requests_total',
+                        len(requests),
+                        help='LLM requests submitted through batch apis',
+                        provider=self.provider)
+    self.watch(batch_id, set(request_ids))
+
+  async def _poll(self, batch_id: str, submitted_at: float) -> None:
+    results: list[BatchResult] = []
+    error = f"no answer in batch {batch_id}"
+    errors = 0
+    while True:
+      try:
+        if await self.backend.is_done(batch_id):
+          results = await self.backend.results(batch_id)
+          break
+        errors = 0
+      except Exception as e:
+        errors += 1
+        log.error(f"Error while polling batch {batch_id} ({errors} in a row): {e}")
+        if errors >= LLM_BATCH_MAX_POLL_ERRORS:
+          # expired, deleted, or polled with keys or a backend it doesn't belong to
+          error = f"gave up on batch {batch_id} after {errors} polling errors: {e!r}"
+          break
+      if time.time() - submitted_at > LLM_BATCH_MAX_AGE:
+        error = f"gave up on batch {batch_id}, not done {LLM_BATCH_MAX_AGE:.0f}s after submission"
+        break
+      await asyncio.sleep(LLM_BATCH_POLL_INTERVAL)
+
+    for result in results:
+      await llm_batch_store.finished(result)
+      self._resolve(result)
+    answered = {result.custom_id for result in results}
+    for request_id in self._members.pop(batch_id, set()) - answered:
+      missing = BatchResult(request_id, None, error=error)
+      await llm_batch_store.finished(missing)
+      self._resolve(missing)
+    # requests of the batch nobody in this process waits for (submitted before a restart)
+    await llm_batch_store.fail_submitted(batch_id, error)
+    if results:
+      log.info(f"Batch {batch_id} done with {len(results)} answers")
+    else:
+      log.error(f"Batch {batch_id} failed: {error}")
+
+  def _resolve(self, result: BatchResult) -> None:
+    for future in self._waiters.pop(result.custom_id, []):
+      if not future.done():
+        future.set_result(result)
+
+  def _spawn(self, coro) -> None:
+    task = self.loop.create_task(coro)
+    self._tasks.add(task)
+    task.add_done_callback(self._tasks.discard)
+
+
+class BatchLLMService(LLMServiceWrapper):
+  """
+    Sends `ask` of the wrapped service through the provider's batch api: cheaper and outside
+    the real time rate limits, but answers can take hours. For reviews nobody waits for.
+  """
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    if isinstance(user_msgs, str):
+      user_msgs = [user_msgs]
+
+    timer = LLMCallTimer()
+    request_id = batch_request_id(self.llmsrv, system_msg, user_msgs, temperature)
+    request = BatchRequest(request_id, system_msg, user_msgs, temperature)
+    listener = batch_wait_listener.get()
+    if listener:
+      listener(True)
+    try:
+      result = await LLMBatchCoordinator.get(self.llmsrv).request(request)
+    finally:
+      if listener:
+        listener(False)
+    if result.error is not None or result.response is None:
+      raise BatchRequestError(f"Batch request {request_id} failed: {result.error}")
+
+    input_token, output_token = result.input_tokens, result.output_tokens
+    system_token, user_token = await self.split_input_tokens(input_token, system_msg, user_msgs)
+    usages = LLMUsage(
+      system_token=system_token,
+      user_token=user_token,
+      output_token=output_token,
+      total_input_token=input_token,
+      total_token=input_token + output_token,
+      llm=self.get_type(),
+      **timer.timings(),
+    )
+    return result.response, usages
+
+  # batches don't stream, the answer comes in one piece
+  stream = LLMService.stream
+
+
+llm_batch_store = LLMBatchStore()
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections.abc import AsyncIterator
+
+from panto.logging import log
+
+from .llm_service import LLMService, LLMServiceType, LLMServiceWrapper, LLMStream, LLMUsage
+from .token_estimator import TokenEstimator
+
+_REPLAY_CHUNKS = 20  # deltas a replayed answer is streamed in
+
+
+class CassetteMissError(Exception):
+  pass
+
+
+def cassette_key(system_msg: str, user_msgs: str | list[str], temperature: float) -> str:
+  messages = [user_msgs] if isinstance(user_msgs, str) else user_msgs
+  payload = json.dumps([system_msg, messages, temperature])
+  return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _text_key(text: str) -> str:
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class LLMCassette:
+  """
+    Answers and usages of LLM calls by prompt hash, plus the token counts of the texts that were
+    tokenized, in a json lines file. Also keeps what a replay needs to split prompts the same
+    way: service type, model, context size and token estimator.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    self.meta: dict = {}
+    self.calls: dict[str, dict] = {}
+    self.encodes: dict[str, int] = {}
+
+  @staticmethod
+  def load(path: str) -> 'LLMCassette':
+    cassette = LLMCassette(path)
+    with open(path) as f:
+      for line in f:
+        if line.strip():
+          cassette._apply(json.loads(line))
+    log.info(f"Loaded cassette {path}: {len(cassette.calls)} calls")
+    return cassette
+
+  def record_meta(self, llmsrv: LLMService) -> None:
+    estimator = llmsrv.token_estimator
+    self._append({
+      'kind': 'meta',
+      'llm': llmsrv.get_type().value,
+      'model': getattr(llmsrv, 'model', '') or '',
+      'max_tokens': llmsrv.max_tokens,
+      'bytes_per_token': estimator.bytes_per_token,
+      'relative_error': estimator.relative_error,
+    })
+
+  def record_call(self, key: str, response: str, usage: LLMUsage) -> None:
+    self._append({'kind': 'call', 'key': key, 'response': response, 'usage': usage.model_dump()})
+
+  def record_encode(self, text: str, tokens: int) -> None:
+    key = _text_key(text)
+    if key not in self.encodes:
+      self._append({'kind': 'encode', 'key': key, 'tokens': tokens})
+
+  def _apply(self, entry: dict) -> None:
+    if entry['kind'] == 'meta':
+      self.meta = entry
+    elif entry['kind'] == 'call':
+      # a prompt asked twice keeps its last answer
+      self.calls[entry['key']] = entry
+    elif entry['kind'] == 'encode':
+      self.encodes[entry['key']] = entry['tokens']
+
+  def _append(self, entry: dict) -> None:
+    self._apply(entry)
+    # appended per call: a run that crashes half way keeps what it recorded
+    with open(self.path, 'a') as f:
+      f.write(json.dumps(entry) + '\n')
+
+
+class RecordingLLMService(LLMServiceWrapper):
+  """
+    Records the calls and token counts of the wrapped service to a cassette for
+    `ReplayLLMService`.
+  """
+
+  def __init__(self, llmsrv: LLMService, path: str):
+    super().__init__(llmsrv)
+    if os.path.dirname(path):
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+    self.cassette = LLMCassette(path)
+    self.cassette.record_meta(llmsrv)
+
+  async def get_encode(self, text: str) -> list[int]:
+    encoded = await self.llmsrv.get_encode(text)
+    self.cassette.record_encode(text, len(encoded))
+    return encoded
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    return await self.stream(system_msg, user_msgs, temperature).collect()
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return LLMStream(self._recorded_events(system_msg, user_msgs, temperature))
+
+  async def _recorded_events(self, system_msg: str, user_msgs: str | list[str],
+                             temperature: float) -> AsyncIterator[str | LLMUsage]:
+    stream = self.llmsrv.stream(system_msg, user_msgs, temperature)
+    async for text in stream:
+      yield text
+    assert stream.usage is not None
+    self.cassette.record_call(cassette_key(system_msg, user_msgs, temperature), stream.text,
+                              stream.usage)
+    yield stream.usage
+
+
+class ReplayLLMService(LLMService):
+  """
+    Serves the calls of a cassette back without network access, for deterministic benchmarks
+    and regression runs of full reviews. A prompt that wasn't recorded raises
+    `CassetteMissError`. `latency_scale` replays the recorded timing (time to first token, then
+    the answer streamed over the generation time) scaled by it, 0 answers at once.
+  """
+
+  def __init__(self, path: str, latency_scale: float = 0.0):
+    self.cassette = LLMCassette.load(path)
+    meta = self.cassette.meta
+    super().__init__(max_tokens=meta.get('max_tokens', 4096))
+    self.model: str = meta.get('model', '')
+    self.llm_type = LLMServiceType(meta.get('llm', LLMServiceType.NOOP.value))
+    if 'bytes_per_token' in meta:
+      self.token_estimator = TokenEstimator(meta['bytes_per_token'], meta['relative_error'])
+    self.latency_scale = latency_scale
+
+  async def get_encode(self, text: str) -> list[int]:
+    tokens = self.cassette.encodes.get(_text_key(text))
+    if tokens is None:
+      tokens = self.estimate_tokens(text).tokens
+    return [0] * tokens
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    return await self.stream(system_msg, user_msgs, temperature).collect()
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return LLMStream(self._replayed_events(system_msg, user_msgs, temperature))
+
+  async def _replayed_events(self, system_msg: str, user_msgs: str | list[str],
+                             temperature: float) -> AsyncIterator[str | LLMUsage]:
+    key = cassette_key(system_msg, user_msgs, temperature)
+    call = self.cassette.calls.get(key)
+    if call is None:
+      raise CassetteMissError(f"Prompt {key[:12]} not in cassette {self.cassette.path}")
+    response: str = call['response']
+    usage = LLMUsage(**call['usage'])
+
+    if self.latency_scale > 0:
+      await asyncio.sleep(usage.ttft_ms / 1000 * self.latency_scale)
+    size = max(len(response) // _REPLAY_CHUNKS, 1)
+    chunks = [response[i:i + size] for i in range(0, len(response), size)]
+    for chunk in chunks:
+      yield chunk
+      if self.latency_scale > 0:
+        await asyncio.sleep(usage.generation_ms / 1000 * self.latency_scale / len(chunks))
+    yield usage
+
+  def get_type(self) -> LLMServiceType:
+    return self.llm_type
@@ -1,8 +1,14 @@
 import abc
 import enum
+import time
+from collections.abc import AsyncIterator
 
 from pydantic import BaseModel
 
+from panto.config import LLM_EXACT_TOKEN_SPLIT
+from panto.services.llm.token_estimator import (DEFAULT_TOKEN_ESTIMATOR, TokenEstimate,
+                                                TokenEstimator)
+
 
 class LLMServiceType(str, enum.Enum):
   OPENAI = "OPENAI"
@@ -17,10 +23,107 @@ class LLMUsage(BaseModel):
   total_input_token: int
   output_token: int
   total_token: int
-  latency: int
+  latency: int  # whole seconds, see latency_ms
+  # high resolution timing, summed over the calls of a summed usage
+  calls: int = 1
+  started_at: float | None = None  # unix time the (first) request was sent
+  latency_ms: float = 0.0  # request sent to usage known
+  ttft_ms: float = 0.0  # request sent to first token, the whole answer when not streamed
+  generation_ms: float = 0.0  # first to last token
+  overhead_ms: float = 0.0  # last token to usage known, i.e. local token counting
+  queue_ms: float = 0.0  # waited for rate limit budget before sending
+
+  @property
+  def output_tokens_per_second(self) -> float | None:
+    if self.generation_ms <= 0:
+      return None
+    return self.output_token / (self.generation_ms / 1000)
+
+  @property
+  def mean_ttft_ms(self) -> float:
+    return self.ttft_ms / self.calls if self.calls else 0.0
+
+  def add(self, usage: 'LLMUsage') -> None:
+    self.system_token += usage.system_token
+    self.user_token += usage.user_token
+    self.total_input_token += usage.total_input_token
+    self.output_token += usage.output_token
+    self.total_token += usage.total_token
+    self.latency += usage.latency
+    self.calls += usage.calls
+    if usage.started_at is not None:
+      self.started_at = min(self.started_at or usage.started_at, usage.started_at)
+    self.latency_ms += usage.latency_ms
+    self.ttft_ms += usage.ttft_ms
+    self.generation_ms += usage.generation_ms
+    self.overhead_ms += usage.overhead_ms
+    self.queue_ms += usage.queue_ms
+
+
+class LLMCallTimer:
+  """
+    Timing of one LLM call on the monotonic clock. Created when the request is sent, `token`
+    is called per received delta and `timings` once the usage is known.
+  """
+
+  def __init__(self):
+    self.started_at = time.time()
+    self._start = time.perf_counter()
+    self._first: float | None = None
+    self._last: float | None = None
+
+  def token(self) -> None:
+    now = time.perf_counter()
+    if self._first is None:
+      self._first = now
+    self._last = now
+
+  def timings(self) -> dict:
+    """
+      Timing fields of `LLMUsage`.
+    """
+    end = time.perf_counter()
+    first = self._first if self._first is not None else end
+    last = self._last if self._last is not None else end
+    return {
+      'latency': int(end - self._start),
+      'started_at': self.started_at,
+      'latency_ms': (end - self._start) * 1000,
+      'ttft_ms': (first - self._start) * 1000,
+      'generation_ms': (last - first) * 1000,
+      'overhead_ms': (end - last) * 1000,
+    }
+
+
+class LLMStream:
+  """
+    Answer of an LLM as the provider streams it. Iterating yields the text deltas; `text` and
+    `usage` are complete once the stream is exhausted. `events` yields the deltas, then the
+    usage of the call.
+  """
+
+  def __init__(self, events: AsyncIterator[str | LLMUsage]):
+    self._events = events
+    self.text = ''
+    self.usage: LLMUsage | None = None
+
+  async def __aiter__(self) -> AsyncIterator[str]:
+    async for event in self._events:
+      if isinstance(event, LLMUsage):
+        self.usage = event
+        continue
+      self.text += event
+      yield event
+
+  async def collect(self) -> tuple[str, LLMUsage]:
+    async for _ in self:
+      pass
+    assert self.usage is not None, "LLM stream ended without usage"
+    return self.text, self.usage
 
 
 class LLMService(abc.ABC):
+  token_estimator: TokenEstimator = DEFAULT_TOKEN_ESTIMATOR
 
   def __init__(self, max_tokens: int = 4096):
     self.max_tokens = max_tokens
@@ -28,6 +131,48 @@ class LLMService(abc.ABC):
   async def get_encode_length(self, text: str) -> int:
     return len(await self.get_encode(text))
 
+  def estimate_tokens(self, text: str) -> TokenEstimate:
+    """
+      Cheap token estimate with its error band, for decisions that don't need exact counts.
+    """
+    return self.token_estimator.estimate(text)
+
+  async def split_input_tokens(self, input_tokens: int, system_msg: str,
+                               user_msgs: list[str]) -> tuple[int, int]:
+    """
+      System and user share of the prompt tokens reported by the provider. Estimated from the
+      message lengths, unless `LLM_EXACT_TOKEN_SPLIT` asks for tokenizing them locally.
+    """
+    if LLM_EXACT_TOKEN_SPLIT:
+      system_token = await self.get_encode_length(system_msg)
+      return system_token, sum([await self.get_encode_length(msg) for msg in user_msgs])
+    system_chars = len(system_msg)
+    total_chars = system_chars + sum(len(msg) for msg in user_msgs)
+    system_token = round(input_tokens * system_chars / total_chars) if total_chars else 0
+    return system_token, input_tokens - system_token
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    """
+      Same as `ask`, with the answer available as it is generated. Services that can't stream
+      send it in one piece.
+    """
+
+    async def events() -> AsyncIterator[str | LLMUsage]:
+      response, usage = await self.ask(system_msg, user_msgs, temperature)
+      yield response
+      yield usage
+
+    return LLMStream(events())
+
+  async def warm_up(self) -> None:
+    """
+      Loads the tokenizer and opens a connection to the provider ahead of the first review.
+    """
+    await self.get_encode_length('warm up')
+
   @abc.abstractmethod
   async def get_encode(self, text: str) -> list[int]:
     pass
@@ -44,6 +189,40 @@ class LLMService(abc.ABC):
     pass
 
 
+class LLMServiceWrapper(LLMService):
+  """
+    Base of services adding behaviour around the `ask` of another service (scheduling,
+    retries, ...). Everything else is delegated to the wrapped service.
+  """
+
+  def __init__(self, llmsrv: LLMService):
+    super().__init__(max_tokens=llmsrv.max_tokens)
+    self.llmsrv = llmsrv
+    self.model: str = getattr(llmsrv, 'model', '') or ''
+
+  @property
+  def token_estimator(self) -> TokenEstimator:  # type: ignore[override]
+    return self.llmsrv.token_estimator
+
+  async def get_encode(self, text: str) -> list[int]:
+    return await self.llmsrv.get_encode(text)
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    return await self.llmsrv.ask(system_msg, user_msgs, temperature)
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return self.llmsrv.stream(system_msg, user_msgs, temperature)
+
+  def get_type(self) -> LLMServiceType:
+    return self.llmsrv.get_type()
+
+
 async def create_llm_service(
   *,
   service_name: LLMServiceType,
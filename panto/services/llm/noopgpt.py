@@ -1,22 +1,90 @@
+import asyncio
+import hashlib
+import math
 import random
+import re
+from collections.abc import AsyncIterator
+from functools import cache
 
-from panto.services.llm.llm_service import LLMService, LLMServiceType, LLMUsage
+import httpx
+import openai
+import tiktoken
+
+from panto.config import (LLM_SIM_ENABLED, LLM_SIM_ENCODING, LLM_SIM_ERROR_RATE, LLM_SIM_JITTER,
+                          LLM_SIM_MAX_SUGGESTIONS, LLM_SIM_MAX_TOKENS, LLM_SIM_PREFILL_MS_PER_1K,
+                          LLM_SIM_RATE_LIMIT_RATE, LLM_SIM_TOKEN_MS, LLM_SIM_TTFT_MS)
+from panto.services.llm.llm_service import (LLMCallTimer, LLMService, LLMServiceType, LLMStream,
+                                            LLMUsage)
+from panto.services.llm.token_estimator import get_token_estimator
+
+_NO_ISSUES = "@no_issues_found@"  # no issues answer of the review prompts
+_CHUNK_TOKENS = 8  # output tokens per streamed delta
+# added lines of the prompt diffs (old line no, new line no, operation, content)
+_ADDED_LINE = re.compile(r'^\t(\d+)\t\+ ', re.M)
+# reviews listed by the correction prompt
+_REVIEW_TO_CORRECT = re.compile(r'^(\d+)\. .+ : .+ : ', re.M)
+_SUGGESTIONS = [
+  "Possible None dereference here, check the value before using it.",
+  "This loop does a lookup per item, build a dict once before the loop.",
+  "The error is swallowed silently, log it or let it propagate.",
+  "Magic number, move it to a named constant.",
+  "The function is getting long, consider splitting the parsing out of it.",
+  "Resource is not closed on the error path, use a context manager.",
+]
+
+
+def simulated_answer(prompt: str, rng: random.Random, max_suggestions: int) -> str:
+  """
+    Answer in the format `prompt` asks for: verdicts for the reviews of a correction prompt,
+    `file : line : suggestion` lines on added lines of the diffs of a review prompt, no issues
+    otherwise.
+  """
+  to_correct = _REVIEW_TO_CORRECT.findall(prompt)
+  if to_correct:
+    return '\n'.join(f"{index} : VALID : {rng.randint(80, 99)} : n/a ||||" for index in to_correct)
+
+  added: list[tuple[str, int]] = []
+  for section in prompt.split('### FILE PATH: ')[1:]:
+    filename = section.split('\n', 1)[0].strip()
+    added += [(filename, int(line)) for line in _ADDED_LINE.findall(section)]
+  if not added or max_suggestions <= 0:
+    return _NO_ISSUES
+  picked = rng.sample(added, min(len(added), rng.randint(1, max_suggestions)))
+  return '\n'.join(f"{filename} : {line} : {rng.choice(_SUGGESTIONS)}"
+                   for filename, line in sorted(picked))
 
 
 class NoopGPTService(LLMService):
+  """
+    Stand-in LLM without a provider. Answers "no issues" at once, or with `LLM_SIM_ENABLED`
+    simulates a provider for load tests: token counts of a real tokenizer, suggestions on the
+    lines of the prompt diffs, time to first token (growing with the prompt) and time per output
+    token drawn from lognormal distributions around the configured means, and configured shares
+    of 429 and 500 errors.
+  """
 
-  def __init__(self, max_tokens: int = 4000, **kwargs):
+  def __init__(self, max_tokens: int | None = None, simulate: bool = LLM_SIM_ENABLED, **kwargs):
+    if max_tokens is None:
+      max_tokens = LLM_SIM_MAX_TOKENS if simulate else 4000
     super().__init__(max_tokens=max_tokens)
+    self.simulate = simulate
+    if simulate:
+      self.token_estimator = get_token_estimator(LLM_SIM_ENCODING)
 
   async def get_encode(self, text: str) -> list[int]:
+    if self.simulate:
+      return await asyncio.to_thread(_encoding(LLM_SIM_ENCODING).encode, text)
     return [random.randint(1000, 9999) for _ in text.split(' ')]
 
   async def ask(self,
                 system_msg: str,
                 user_msgs: str | list[str],
                 temperature: float = 0) -> tuple[str, LLMUsage]:
+    if self.simulate:
+      return await self.stream(system_msg, user_msgs, temperature).collect()
     if isinstance(user_msgs, str):
       user_msgs = [user_msgs]
+    timer = LLMCallTimer()
     response = "random_file : -1 : @no_issues_found@"
     system_token = len(await self.get_encode(system_msg))
     user_token = sum([len(await self.get_encode(msg)) for msg in user_msgs])
@@ -28,9 +96,81 @@ class NoopGPTService(LLMService):
       output_token=output_token,
       total_input_token=system_token + user_token,
       total_token=total_token,
-      latency=0,
       llm=self.get_type(),
+      **timer.timings(),
+    )
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    if not self.simulate:
+      return super().stream(system_msg, user_msgs, temperature)
+    return LLMStream(self._simulated_events(system_msg, user_msgs, temperature))
+
+  async def _simulated_events(self, system_msg: str, user_msgs: str | list[str],
+                              temperature: float) -> AsyncIterator[str | LLMUsage]:
+    if isinstance(user_msgs, str):
+      user_msgs = [user_msgs]
+    # counted by the provider in production, not part of the call's time
+    system_token = await self.get_encode_length(system_msg)
+    user_token = sum([await self.get_encode_length(msg) for msg in user_msgs])
+    input_token = system_token + user_token
+
+    timer = LLMCallTimer()
+    ttft = _lognormal(LLM_SIM_TTFT_MS + LLM_SIM_PREFILL_MS_PER_1K * input_token / 1000) / 1000
+    roll = random.random()
+    if roll < LLM_SIM_RATE_LIMIT_RATE:
+      raise _simulated_error(429)
+    if roll < LLM_SIM_RATE_LIMIT_RATE + LLM_SIM_ERROR_RATE:
+      await asyncio.sleep(ttft)
+      raise _simulated_error(500)
+
+    # the same prompt gets the same answer, timings and errors stay random
+    prompt = ''.join(user_msgs)
+    seed = int.from_bytes(hashlib.sha256(prompt.encode('utf-8')).digest()[:8], 'big')
+    response = simulated_answer(prompt, random.Random(seed), LLM_SIM_MAX_SUGGESTIONS)
+    output = await self.get_encode(response)
+    token_time = _lognormal(LLM_SIM_TOKEN_MS) / 1000
+
+    await asyncio.sleep(ttft)
+    encoding = _encoding(LLM_SIM_ENCODING)
+    for i in range(0, len(output), _CHUNK_TOKENS):
+      if i:
+        await asyncio.sleep(token_time * _CHUNK_TOKENS)
+      timer.token()
+      yield encoding.decode(output[i:i + _CHUNK_TOKENS])
+
+    yield LLMUsage(
+      system_token=system_token,
+      user_token=user_token,
+      output_token=len(output),
+      total_input_token=input_token,
+      total_token=input_token + len(output),
+      llm=self.get_type(),
+      **timer.timings(),
     )
 
   def get_type(self) -> LLMServiceType:
     return LLMServiceType.NOOP
+
+
+def _lognormal(mean: float) -> float:
+  if mean <= 0:
+    return 0.0
+  return random.lognormvariate(math.log(mean) - LLM_SIM_JITTER**2 / 2, LLM_SIM_JITTER)
+
+
+def _simulated_error(status: int) -> openai.APIStatusError:
+  # the errors of the openai sdk, so retries and routing treat them like the real ones
+  request = httpx.Request('POST', 'https://noop.llm/v1/chat/completions')
+  if status == 429:
+    response = httpx.Response(status, headers={'retry-after': '1'}, request=request)
+    return openai.RateLimitError('Simulated rate limit', response=response, body=None)
+  response = httpx.Response(status, request=request)
+  return openai.InternalServerError('Simulated server error', response=response, body=None)
+
+
+@cache
+def _encoding(name: str) -> tiktoken.Encoding:
+  return tiktoken.get_encoding(name)
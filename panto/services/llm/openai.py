@@ -1,10 +1,17 @@
-import time
+import asyncio
+from collections.abc import AsyncIterator
+from functools import cache
 
 import tiktoken
 from openai import APIError as OpenAIAPIError
-from openai import OpenAI
+from openai import AsyncOpenAI
+from openai.types import CompletionUsage
 
-from .llm_service import LLMService, LLMServiceType, LLMUsage
+from panto.config import LLM_MAX_RETRIES
+from panto.utils.http import SharedLLMHttpClient, llm_timeout, preconnect_llm
+
+from .llm_service import LLMCallTimer, LLMService, LLMServiceType, LLMStream, LLMUsage
+from .token_estimator import get_token_estimator
 
 openai_models_max_tokens_map = {
   "gpt-4o": 128000,
@@ -22,22 +29,50 @@ class OpenAIService(LLMService):
       max_tokens = openai_models_max_tokens_map.get(model)
       assert max_tokens is not None, f"Unknown model max_token: {model}"
     super().__init__(max_tokens=max_tokens)
-    self.openai = OpenAI(api_key=api_key)
+    self.api_key = api_key
     self.model = model
-    self.encoder = tiktoken.encoding_for_model(model)
+    self.encoder = _encoding_for_model(model)
+    self.token_estimator = get_token_estimator(self.encoder.name)
+    self._openai: AsyncOpenAI | None = None
+
+  @property
+  def openai(self) -> AsyncOpenAI:
+    # follows the shared http client, which is recreated when the event loop changes
+    http_client = SharedLLMHttpClient.get()
+    if self._openai is None or self._openai._client is not http_client:
+      self._openai = AsyncOpenAI(
+        api_key=self.api_key,
+        http_client=http_client,
+        timeout=llm_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+      )
+    return self._openai
+
+  async def warm_up(self) -> None:
+    await super().warm_up()
+    await preconnect_llm(str(self.openai.base_url))
 
   async def get_encode(self, text: str) -> list[int]:
-    return self.encoder.encode(text)
+    # large prompts take a while to tokenize, keep the event loop free meanwhile
+    return await asyncio.to_thread(self.encoder.encode, text)
 
   async def ask(self,
                 system_msg: str,
                 user_msgs: str | list[str],
                 temperature: float = 0) -> tuple[str, LLMUsage]:
+    return await self.stream(system_msg, user_msgs, temperature).collect()
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return LLMStream(self._stream_events(system_msg, user_msgs, temperature))
+
+  async def _stream_events(self, system_msg: str, user_msgs: str | list[str],
+                           temperature: float) -> AsyncIterator[str | LLMUsage]:
     if isinstance(user_msgs, str):
       user_msgs = [user_msgs]
 
-    timer_start = time.time()
-
     messages = [{
       "role": "system",
       "content": system_msg,
@@ -47,36 +82,54 @@ class OpenAIService(LLMService):
     } for msg in user_msgs]]
 
     response = ""
+    usage: CompletionUsage | None = None
+    timer = LLMCallTimer()
     try:
-      stream = self.openai.chat.completions.create(
+      stream = await self.openai.chat.completions.create(
         model=self.model,
         messages=messages,  # type: ignore
         stream=True,
+        stream_options={"include_usage": True},
         temperature=temperature,
       )
-      for chunk in stream:
-        if chunk.choices[0].delta.content is not None:  # type: ignore
-          response += chunk.choices[0].delta.content  # type: ignore
+      async for chunk in stream:
+        if chunk.usage is not None:
+          # last chunk, without choices
+          usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+          timer.token()
+          response += chunk.choices[0].delta.content
+          yield chunk.choices[0].delta.content
     except OpenAIAPIError:
       raise
 
-    system_token = len(await self.get_encode(system_msg))
-    user_token = sum([len(await self.get_encode(msg)) for msg in user_msgs])
-    output_token = len(await self.get_encode(response))
-    total_token = system_token + user_token + output_token
+    if usage is not None:
+      input_token, output_token = usage.prompt_tokens, usage.completion_tokens
+      system_token, user_token = await self.split_input_tokens(input_token, system_msg, user_msgs)
+    else:
+      # openai compatible servers that ignore stream_options
+      system_token = len(await self.get_encode(system_msg))
+      user_token = sum([len(await self.get_encode(msg)) for msg in user_msgs])
+      input_token = system_token + user_token
+      output_token = len(await self.get_encode(response))
 
-    timer_end = time.time()
     usages = LLMUsage(
       system_token=system_token,
       user_token=user_token,
       output_token=output_token,
-      total_input_token=system_token + user_token,
-      total_token=total_token,
-      latency=int(timer_end - timer_start),
+      total_input_token=input_token,
+      total_token=input_token + output_token,
       llm=self.get_type(),
+      **timer.timings(),
     )
 
-    return response, usages
+    yield usages
 
   def get_type(self) -> LLMServiceType:
     return LLMServiceType.OPENAI
+
+
+@cache
+def _encoding_for_model(model: str) -> tiktoken.Encoding:
+  # loading the bpe ranks is expensive, one encoder per model for the process
+  return tiktoken.encoding_for_model(model)
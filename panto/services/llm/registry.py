@@ -0,0 +1,66 @@
+from panto.config import (ANTHROPIC_API_KEY, ANTHROPIC_MODEL, GPT_MAX_TOKENS, OPENAI_API_KEY,
+                          OPENAI_MODEL)
+from panto.logging import log
+
+from .llm_service import LLMService, LLMServiceType, create_llm_service
+
+
+class LLMServiceRegistry:
+  """
+    Process wide LLM services by provider and model. Reviews borrow them instead of building
+    their own, so tokenizers are loaded once and calls share the pooled connections of
+    `SharedLLMHttpClient`. Per review behaviour (scheduling priority, retry budget, ...) lives in
+    the wrappers around them.
+  """
+  _services: dict[tuple[LLMServiceType, str | None], LLMService] = {}
+
+  @staticmethod
+  async def get(llm_type: LLMServiceType, model: str | None = None) -> LLMService:
+    """
+      The service of `llm_type`, for `model` or the configured model of the provider.
+    """
+    key = (llm_type, model)
+    llmsrv = LLMServiceRegistry._services.get(key)
+    if llmsrv is None:
+      llmsrv = await _create_llmsrv(llm_type, model)
+      # two reviews may create the same service at once, the first one is kept
+      llmsrv = LLMServiceRegistry._services.setdefault(key, llmsrv)
+    return llmsrv
+
+  @staticmethod
+  async def warm_up(services: list[tuple[LLMServiceType, str | None]]) -> None:
+    """
+      Creates the (provider, model) `services` with their tokenizers and connections, so the
+      first review doesn't wait for them. Failures are logged, the review will report them.
+    """
+    for llm_type, model in services:
+      name = f"{llm_type.value} {model or ''}".strip()
+      try:
+        llmsrv = await LLMServiceRegistry.get(llm_type, model)
+        await llmsrv.warm_up()
+        log.info(f"LLM service {name} ready")
+      except Exception as e:
+        log.error(f"Can't warm up LLM service {name}: {e}")
+
+  @staticmethod
+  def clear() -> None:
+    LLMServiceRegistry._services.clear()
+
+
+async def _create_llmsrv(llm_type: LLMServiceType, model: str | None) -> LLMService:
+  if llm_type == LLMServiceType.NOOP:
+    return await create_llm_service(service_name=llm_type)
+  if llm_type == LLMServiceType.OPENAI:
+    return await create_llm_service(
+      service_name=llm_type,
+      max_tokens=GPT_MAX_TOKENS if model is None else None,
+      api_key=OPENAI_API_KEY,
+      model=model or OPENAI_MODEL,
+    )
+  if llm_type == LLMServiceType.ANTHROPIC:
+    return await create_llm_service(
+      service_name=llm_type,
+      api_key=ANTHROPIC_API_KEY,
+      model=model or ANTHROPIC_MODEL,
+    )
+  raise NotImplementedError(f"Unsupported llm_type: {llm_type}")
@@ -0,0 +1,240 @@
+import asyncio
+import random
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+
+import anthropic
+import httpx
+import openai
+
+from panto.config import (LLM_HEDGE_ENABLED, LLM_HEDGE_MIN_SAMPLES, LLM_RETRY_BASE_DELAY,
+                          LLM_RETRY_BUDGET, LLM_RETRY_MAX_ATTEMPTS, LLM_RETRY_MAX_DELAY)
+from panto.logging import log
+from panto.services.metrics.runtime_metrics import runtime_metrics
+from panto.utils.http import get_retry_after
+
+from .llm_service import LLMService, LLMServiceWrapper, LLMStream, LLMUsage
+from .scheduler import LLMAdmission, llm_admission
+
+_RETRYABLE_STATUS = {408, 409, 429}  # and every 5xx (incl. 529, anthropic overloaded)
+_LATENCY_SAMPLES = 200  # per prompt size bucket
+
+_LatencyKey = tuple[str, str, int]
+
+
+def is_retryable_llm_error(error: BaseException) -> bool:
+  """
+    Whether an error of `ask` is transient: rate limited, overloaded, server error or a broken
+    connection. Bad requests, auth errors or context overflows fail the same way again.
+  """
+  if isinstance(error, (openai.APIStatusError, anthropic.APIStatusError)):
+    return error.status_code in _RETRYABLE_STATUS or error.status_code >= 500
+  return isinstance(error, (openai.APIConnectionError, anthropic.APIConnectionError,
+                            httpx.TransportError, asyncio.TimeoutError))
+
+
+def _retry_after(error: BaseException) -> float | None:
+  response = getattr(error, 'response', None)
+  if isinstance(response, httpx.Response):
+    return get_retry_after(response.headers)
+  return None
+
+
+class LLMLatencyTracker:
+  """
+    Recent latencies of successful calls per provider, model and prompt size (power of two
+    buckets of 1k tokens), shared by every review of the process.
+  """
+
+  def __init__(self, samples: int = _LATENCY_SAMPLES):
+    self.samples = samples
+    self._latencies: dict[_LatencyKey, deque[float]] = {}
+
+  @staticmethod
+  def key(llmsrv: LLMService, tokens: int) -> _LatencyKey:
+    model = getattr(llmsrv, 'model', '') or ''
+    return (llmsrv.get_type().value, model, (tokens // 1024).bit_length())
+
+  def observe(self, key: _LatencyKey, latency: float) -> None:
+    if key not in self._latencies:
+      self._latencies[key] = deque(maxlen=self.samples)
+    self._latencies[key].append(latency)
+
+  def p95(self, key: _LatencyKey) -> float | None:
+    """
+      None until `LLM_HEDGE_MIN_SAMPLES` calls of this size were seen.
+    """
+    latencies = self._latencies.get(key)
+    if latencies is None or len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+      return None
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+class ResilientLLMService(LLMServiceWrapper):
+  """
+    Retries transient failures of `ask` with jittered exponential backoff, and optionally
+    hedges calls running past the p95 latency of their prompt size with a duplicate call, the
+    first answer wins. Retries and hedges draw from one budget per instance, i.e. per review,
+    so a degraded provider can't multiply the cost of a review.
+  """
+
+  def __init__(self, llmsrv: LLMService, retry_budget: int = LLM_RETRY_BUDGET):
+    super().__init__(llmsrv)
+    self.retry_budget = retry_budget
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    messages = [user_msgs] if isinstance(user_msgs, str) else user_msgs
+    tokens = self.estimate_tokens(system_msg + ''.join(messages)).tokens
+    key = LLMLatencyTracker.key(self.llmsrv, tokens)
+
+    attempt = 1
+    while True:
+      try:
+        return await self._ask_hedged(key, system_msg, user_msgs, temperature)
+      except Exception as e:
+        delay = self._retry_delay(e, attempt)
+        if delay is None:
+          raise
+        await asyncio.sleep(delay)
+        attempt += 1
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    """
+      Retried like `ask` until the first text arrives, a stream failing after that is not
+      (its text was already handed out). Streams are never hedged.
+    """
+    return LLMStream(self._resilient_events(system_msg, user_msgs, temperature))
+
+  async def _resilient_events(self, system_msg: str, user_msgs: str | list[str],
+                              temperature: float) -> AsyncIterator[str | LLMUsage]:
+    attempt = 1
+    while True:
+      stream = self.llmsrv.stream(system_msg, user_msgs, temperature)
+      started = False
+      try:
+        async for text in stream:
+          started = True
+          yield text
+        assert stream.usage is not None
+        yield stream.usage
+        return
+      except Exception as e:
+        delay = None if started else self._retry_delay(e, attempt)
+        if delay is None:
+          raise
+      await asyncio.sleep(delay)
+      attempt += 1
+
+  def _retry_delay(self, error: Exception, attempt: int) -> float | None:
+    """
+      Backoff before retrying a call that failed with `error`, None when it must not be retried.
+    """
+    if not is_retryable_llm_error(error) or attempt >= LLM_RETRY_MAX_ATTEMPTS:
+      return None
+    retry_after = _retry_after(error)
+    if retry_after is not None and retry_after > LLM_RETRY_MAX_DELAY:
+      return None
+    if not self._take_budget():
+      log.warning("LLM retry budget of the review exhausted")
+      return None
+    delay = max(
+      random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2**(attempt - 1))),
+      retry_after or 0)
+    log.warning(f"LLM call failed ({error!r}), retrying in {delay:.1f}s (attempt {attempt})")
+    self._count('panto_llm_retries_total', 'LLM calls retried after a transient error')
+    return delay
+
+  async def _ask_hedged(self, key: _LatencyKey, system_msg: str, user_msgs: str | list[str],
+                        temperature: float) -> tuple[str, LLMUsage]:
+    p95 = llm_latency_tracker.p95(key) if LLM_HEDGE_ENABLED else None
+    if p95 is None:
+      return await self._ask_timed(key, system_msg, user_msgs, temperature)
+
+    admission = LLMAdmission()
+    primary = asyncio.create_task(
+      self._ask_timed(key, system_msg, user_msgs, temperature, admission))
+    tasks = {primary}
+    try:
+      if not await _runs_past(primary, admission, p95) or not self._take_budget():
+        return await primary
+
+      log.info(f"LLM call slower than p95 ({p95:.1f}s), hedging with a duplicate call")
+      self._count('panto_llm_hedges_total', 'Duplicate LLM calls fired for slow calls')
+      hedge = asyncio.create_task(self._ask_timed(key, system_msg, user_msgs, temperature))
+      tasks.add(hedge)
+      pending = set(tasks)
+      while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+          if task.exception() is None:
+            if task is hedge:
+              self._count('panto_llm_hedge_wins_total', 'Hedged LLM calls answered first')
+            return task.result()
+      # both failed, the error of the first call decides about retrying
+      return primary.result()
+    finally:
+      for task in tasks:
+        if not task.done():
+          task.cancel()
+
+  async def _ask_timed(self,
+                       key: _LatencyKey,
+                       system_msg: str,
+                       user_msgs: str | list[str],
+                       temperature: float,
+                       admission: LLMAdmission | None = None) -> tuple[str, LLMUsage]:
+    if admission is not None:
+      # runs as its own task, the context of the caller isn't touched
+      llm_admission.set(admission)
+    started_at = time.monotonic()
+    result = await self.llmsrv.ask(system_msg, user_msgs, temperature)
+    # provider latency: time waiting for rate limit budget isn't what a hedge can save
+    llm_latency_tracker.observe(key, time.monotonic() - started_at - result[1].queue_ms / 1000)
+    return result
+
+  def _take_budget(self) -> bool:
+    if self.retry_budget <= 0:
+      return False
+    self.retry_budget -= 1
+    return True
+
+  def _count(self, name: str, help: str) -> None:
+    runtime_metrics.inc(name, help=help, provider=self.get_type().value, model=self.model)
+
+
+async def _runs_past(call: asyncio.Task, admission: LLMAdmission, p95: float) -> bool:
+  """
+    Whether `call` is still running `p95` seconds after the scheduler admitted it (after it
+    started when it isn't scheduled), and hedging it wouldn't just queue behind other calls.
+  """
+  loop = asyncio.get_running_loop()
+  deadline = loop.time() + p95
+  while True:
+    done, _ = await asyncio.wait({call}, timeout=max(deadline - loop.time(), 0))
+    if done:
+      return False
+    if admission.scheduler is None:
+      return True
+    if not admission.admitted.is_set():
+      admitted = asyncio.create_task(admission.admitted.wait())
+      try:
+        done, _ = await asyncio.wait({call, admitted}, return_when=asyncio.FIRST_COMPLETED)
+      finally:
+        admitted.cancel()
+      if call in done:
+        return False
+    assert admission.admitted_at is not None
+    deadline = admission.admitted_at + p95
+    if deadline <= loop.time():
+      return not admission.scheduler.waiting
+
+
+llm_latency_tracker = LLMLatencyTracker()
@@ -0,0 +1,190 @@
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+
+from panto.config import LLM_ROUTING_COOLDOWN, LLM_ROUTING_ERROR_THRESHOLD, LLM_ROUTING_MIN_SAMPLES
+from panto.logging import log
+from panto.services.metrics.runtime_metrics import runtime_metrics
+
+from .llm_service import LLMService, LLMServiceType, LLMStream, LLMUsage
+from .resilient import is_retryable_llm_error
+from .token_estimator import TokenEstimator
+
+_OUTCOMES = 50  # calls per backend the error rate is computed on
+_LATENCY_DECAY = 0.2  # weight of the last call in the latency average
+_TOLERANCE = 0.25  # how much worse than the best backend a preferred backend may score
+
+
+class BackendHealth:
+  """
+    Rolling error rate and latency (seconds per 1k prompt tokens) of one provider/model, shared
+    by every review of the process. A backend whose error rate crosses
+    `LLM_ROUTING_ERROR_THRESHOLD` is skipped for `LLM_ROUTING_COOLDOWN` seconds.
+  """
+
+  def __init__(self, name: str):
+    self.name = name
+    self.outcomes: deque[bool] = deque(maxlen=_OUTCOMES)
+    self.latency: float | None = None
+    self.unhealthy_until = 0.0
+
+  @property
+  def error_rate(self) -> float:
+    if not self.outcomes:
+      return 0.0
+    return self.outcomes.count(False) / len(self.outcomes)
+
+  @property
+  def score(self) -> float | None:
+    """
+      Lower is better: the latency, inflated by the error rate. None until a call succeeded.
+    """
+    if self.latency is None:
+      return None
+    return self.latency * (1 + 4 * self.error_rate)
+
+  def is_available(self, now: float) -> bool:
+    return self.unhealthy_until <= now
+
+  def record(self, ok: bool, latency: float | None = None, tokens: int = 0) -> None:
+    self.outcomes.append(ok)
+    if ok and latency is not None:
+      per_1k = latency / max(tokens / 1000, 1)
+      self.latency = per_1k if self.latency is None else (_LATENCY_DECAY * per_1k +
+                                                          (1 - _LATENCY_DECAY) * self.latency)
+    if (not ok and len(self.outcomes) >= LLM_ROUTING_MIN_SAMPLES
+        and self.error_rate >= LLM_ROUTING_ERROR_THRESHOLD):
+      log.warning(f"LLM backend {self.name} unhealthy (error rate {self.error_rate:.0%}), "
+                  f"skipping it for {LLM_ROUTING_COOLDOWN}s")
+      self.unhealthy_until = time.time() + LLM_ROUTING_COOLDOWN
+      # a fresh start once the cool down is over
+      self.outcomes.clear()
+
+    runtime_metrics.set('panto_llm_backend_error_rate',
+                        self.error_rate,
+                        help='Error rate of the recent calls of an LLM backend',
+                        backend=self.name)
+    if self.latency is not None:
+      runtime_metrics.set('panto_llm_backend_latency_seconds',
+                          self.latency,
+                          help='Average latency of an LLM backend per 1k prompt tokens',
+                          backend=self.name)
+
+
+_health: dict[str, BackendHealth] = {}
+
+
+def get_backend_health(llmsrv: LLMService) -> BackendHealth:
+  name = f"{llmsrv.get_type().value}:{getattr(llmsrv, 'model', '') or ''}"
+  if name not in _health:
+    _health[name] = BackendHealth(name)
+  return _health[name]
+
+
+class RoutingLLMService(LLMService):
+  """
+    Spreads calls over several backends (e.g. OpenAI and Anthropic). Each call goes to the
+    healthiest backend whose context fits the prompt, counted with that backend's own
+    tokenizer, and fails over to the next one on a transient error. Backends are preferred in
+    the given order until their health tells them apart.
+  """
+
+  def __init__(self, backends: list[LLMService]):
+    assert backends, "routing needs at least one backend"
+    self.backends = backends
+    # prompts are split for the largest context, smaller backends only get what fits them
+    self.largest = max(backends, key=lambda b: b.max_tokens)
+    super().__init__(max_tokens=self.largest.max_tokens)
+
+  @property
+  def token_estimator(self) -> TokenEstimator:  # type: ignore[override]
+    return self.largest.token_estimator
+
+  async def get_encode(self, text: str) -> list[int]:
+    return await self.largest.get_encode(text)
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    return await self.stream(system_msg, user_msgs, temperature).collect()
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return LLMStream(self._routed_events(system_msg, user_msgs, temperature))
+
+  async def _routed_events(self, system_msg: str, user_msgs: str | list[str],
+                           temperature: float) -> AsyncIterator[str | LLMUsage]:
+    prompt = system_msg + ''.join([user_msgs] if isinstance(user_msgs, str) else user_msgs)
+    candidates = await self._candidates(prompt)
+    if not candidates:
+      raise Exception(f"No LLM backend fits a prompt of {len(prompt)} characters")
+
+    for i, (backend, tokens) in enumerate(candidates):
+      health = get_backend_health(backend)
+      stream = backend.stream(system_msg, user_msgs, temperature)
+      started_at = time.monotonic()
+      started = False
+      try:
+        async for text in stream:
+          started = True
+          yield text
+        assert stream.usage is not None
+        health.record(True, time.monotonic() - started_at, tokens)
+        runtime_metrics.inc('panto_llm_routed_total',
+                            help='LLM calls served per backend',
+                            backend=health.name)
+        yield stream.usage
+        return
+      except Exception as e:
+        if not is_retryable_llm_error(e):
+          raise
+        health.record(False)
+        # text already handed out can't be taken back
+        if started or i == len(candidates) - 1:
+          raise
+        log.warning(f"LLM backend {health.name} failed ({e!r}), failing over")
+        runtime_metrics.inc('panto_llm_failovers_total',
+                            help='LLM calls moved to another backend after an error',
+                            backend=health.name)
+
+  async def _candidates(self, prompt: str) -> list[tuple[LLMService, int]]:
+    """
+      Backends fitting `prompt` with its token count on each, healthiest first.
+    """
+    now = time.time()
+    fitting: list[tuple[LLMService, int]] = []
+    for backend in self.backends:
+      estimate = backend.estimate_tokens(prompt)
+      fits = estimate.below(backend.max_tokens)
+      if fits is None:
+        tokens = await backend.get_encode_length(prompt)
+        fits = tokens < backend.max_tokens
+      else:
+        tokens = estimate.tokens
+      if fits:
+        fitting.append((backend, tokens))
+
+    scores = {id(b): get_backend_health(b).score for b, _ in fitting}
+    known: list[float] = [
+      score for b, _ in fitting
+      if (score := scores[id(b)]) is not None and get_backend_health(b).is_available(now)
+    ]
+    best = min(known) if known else None
+
+    def rank(item: tuple[LLMService, int]) -> tuple[bool, bool]:
+      health, score = get_backend_health(item[0]), scores[id(item[0])]
+      # backends close to the best keep the configured order, unhealthy ones are the last resort
+      slower = best is not None and score is not None and score > best * (1 + _TOLERANCE)
+      return (not health.is_available(now), slower)
+
+    return sorted(fitting, key=rank)
+
+  def get_type(self) -> LLMServiceType:
+    now = time.time()
+    for backend in self.backends:
+      if get_backend_health(backend).is_available(now):
+        return backend.get_type()
+    return self.backends[0].get_type()
@@ -0,0 +1,254 @@
+import asyncio
+import enum
+import heapq
+import itertools
+from collections import deque
+from collections.abc import AsyncIterator
+from contextvars import ContextVar
+
+from panto.config import (ANTHROPIC_RPM_LIMIT, ANTHROPIC_TPM_LIMIT, LLM_BUDGET_WORKERS,
+                          LLM_EXPECTED_OUTPUT_TOKENS, OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT)
+from panto.logging import log
+from panto.services.metrics.runtime_metrics import runtime_metrics
+
+from .llm_service import LLMService, LLMServiceType, LLMServiceWrapper, LLMStream, LLMUsage
+
+_WINDOW = 60.0  # seconds, budgets are per minute
+
+_LIMITS: dict[LLMServiceType, tuple[int, int]] = {
+  LLMServiceType.OPENAI: (OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT),
+  LLMServiceType.ANTHROPIC: (ANTHROPIC_RPM_LIMIT, ANTHROPIC_TPM_LIMIT),
+}
+
+
+class LLMRequestPriority(enum.IntEnum):
+  MANUAL = 0  # `/review` asked by a user
+  AUTO = 1  # review started by a PR open
+
+
+class _Reservation:
+
+  def __init__(self, at: float, tokens: int):
+    self.at = at
+    self.tokens = tokens
+
+
+class LLMAdmission:
+  """
+    Whether and since when the call of the current task is through the scheduler, for callers
+    that time the provider only (hedging). Set in `llm_admission` around the call.
+  """
+
+  def __init__(self):
+    self.scheduler: 'LLMScheduler | None' = None
+    self.admitted_at: float | None = None  # loop time
+    self.admitted = asyncio.Event()
+
+  def enter(self, scheduler: 'LLMScheduler') -> None:
+    # a failover to another backend queues again
+    self.scheduler = scheduler
+    self.admitted_at = None
+    self.admitted.clear()
+
+  def admit(self) -> None:
+    self.admitted_at = asyncio.get_running_loop().time()
+    self.admitted.set()
+
+
+llm_admission: ContextVar[LLMAdmission | None] = ContextVar('llm_admission', default=None)
+
+
+class LLMScheduler:
+  """
+    Admission control for LLM calls of one provider/model, shared by every review of the
+    process. A call waits until the requests and tokens sent within the last minute leave room
+    for it; waiting calls are admitted by priority, then in arrival order. Token reservations are
+    estimates until the call reports its usage.
+  """
+  _schedulers: dict[tuple[LLMServiceType, str], 'LLMScheduler'] = {}
+
+  def __init__(self, provider: LLMServiceType, model: str, rpm_limit: int, tpm_limit: int):
+    self.provider = provider
+    self.model = model
+    # budgets are split between the workers of a deployment (LLM_BUDGET_WORKERS)
+    self.rpm_limit = rpm_limit // LLM_BUDGET_WORKERS if rpm_limit else 0
+    self.tpm_limit = tpm_limit // LLM_BUDGET_WORKERS if tpm_limit else 0
+    self.loop = asyncio.get_running_loop()
+    self._window: deque[_Reservation] = deque()
+    self._waiters: list[tuple[int, int, int, asyncio.Future]] = []
+    self._seq = itertools.count()
+    self._timer: asyncio.TimerHandle | None = None
+
+  @staticmethod
+  def get(provider: LLMServiceType, model: str) -> 'LLMScheduler':
+    key = (provider, model)
+    scheduler = LLMScheduler._schedulers.get(key)
+    # futures are bound to the loop they were created on (cli runs a new loop per command)
+    if scheduler is None or scheduler.loop is not asyncio.get_running_loop():
+      rpm_limit, tpm_limit = _LIMITS.get(provider, (0, 0))
+      scheduler = LLMScheduler(provider, model, rpm_limit, tpm_limit)
+      LLMScheduler._schedulers[key] = scheduler
+    return scheduler
+
+  @property
+  def is_limited(self) -> bool:
+    return bool(self.rpm_limit or self.tpm_limit)
+
+  @property
+  def waiting(self) -> int:
+    return sum(1 for w in self._waiters if not w[3].done())
+
+  async def acquire(self, tokens: int, priority: LLMRequestPriority) -> _Reservation:
+    """
+      Waits for budget for a call of about `tokens` tokens. The returned reservation must be
+      settled with the real usage once the call is done.
+    """
+    started_at = self.loop.time()
+    future = self.loop.create_future()
+    heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+    self._export_queue()
+    self._dispatch()
+    try:
+      reservation = await future
+    except asyncio.CancelledError:
+      if future.done() and not future.cancelled() and future.result() in self._window:
+        self._window.remove(future.result())
+      self._waiters = [w for w in self._waiters if w[3] is not future]
+      heapq.heapify(self._waiters)
+      self._export_queue()
+      raise
+
+    waited = self.loop.time() - started_at
+    labels = {'provider': self.provider.value, 'model': self.model, 'priority': priority.name}
+    runtime_metrics.inc('panto_llm_queue_wait_seconds_sum',
+                        waited,
+                        help='Time LLM calls waited for rate limit budget',
+                        **labels)
+    runtime_metrics.inc('panto_llm_queue_wait_seconds_count',
+                        1,
+                        help='LLM calls admitted by the scheduler',
+                        **labels)
+    if waited > 1:
+      log.info(f"LLM call ({priority.name}) waited {waited:.1f}s for {self.provider.value} budget")
+    return reservation
+
+  def settle(self, reservation: _Reservation, tokens: int | None) -> None:
+    """
+      Replaces the estimate with the tokens the call really used (None when it failed before
+      reaching the provider).
+    """
+    reservation.tokens = tokens or 0
+    self._export_usage()
+    self._dispatch()
+
+  def _dispatch(self) -> None:
+    now = self.loop.time()
+    while self._window and self._window[0].at <= now - _WINDOW:
+      self._window.popleft()
+
+    while self._waiters:
+      _, _, tokens, future = self._waiters[0]
+      if future.cancelled():
+        heapq.heappop(self._waiters)
+        continue
+      wait = self._wait_time(tokens, now)
+      if wait > 0:
+        self._schedule(wait)
+        break
+      heapq.heappop(self._waiters)
+      reservation = _Reservation(now, tokens)
+      self._window.append(reservation)
+      future.set_result(reservation)
+
+    self._export_queue()
+    self._export_usage()
+
+  def _wait_time(self, tokens: int, now: float) -> float:
+    if not self._window:
+      # an oversized call still goes through alone
+      return 0.0
+    expires_in = self._window[0].at + _WINDOW - now
+    if self.rpm_limit and len(self._window) >= self.rpm_limit:
+      return expires_in
+    if self.tpm_limit and sum(r.tokens for r in self._window) + tokens > self.tpm_limit:
+      return expires_in
+    return 0.0
+
+  def _schedule(self, wait: float) -> None:
+    if self._timer is not None:
+      self._timer.cancel()
+    self._timer = self.loop.call_later(max(wait, 0.01), self._dispatch)
+
+  def _export_queue(self) -> None:
+    runtime_metrics.set('panto_llm_queue_depth',
+                        self.waiting,
+                        help='LLM calls waiting for rate limit budget',
+                        provider=self.provider.value,
+                        model=self.model)
+
+  def _export_usage(self) -> None:
+    labels = {'provider': self.provider.value, 'model': self.model}
+    runtime_metrics.set('panto_llm_window_requests',
+                        len(self._window),
+                        help='LLM requests sent within the last minute',
+                        **labels)
+    runtime_metrics.set('panto_llm_window_tokens',
+                        sum(r.tokens for r in self._window),
+                        help='LLM tokens used (or reserved) within the last minute',
+                        **labels)
+
+
+class ScheduledLLMService(LLMServiceWrapper):
+  """
+    Routes `ask` of the wrapped service through its provider's `LLMScheduler`.
+  """
+
+  def __init__(self, llmsrv: LLMService, priority: LLMRequestPriority = LLMRequestPriority.MANUAL):
+    super().__init__(llmsrv)
+    self.priority = priority
+
+  async def ask(self,
+                system_msg: str,
+                user_msgs: str | list[str],
+                temperature: float = 0) -> tuple[str, LLMUsage]:
+    scheduler = LLMScheduler.get(self.get_type(), self.model)
+    if not scheduler.is_limited:
+      if admission := llm_admission.get():
+        admission.enter(scheduler)
+        admission.admit()
+      return await self.llmsrv.ask(system_msg, user_msgs, temperature)
+    return await self.stream(system_msg, user_msgs, temperature).collect()
+
+  def stream(self,
+             system_msg: str,
+             user_msgs: str | list[str],
+             temperature: float = 0) -> LLMStream:
+    return LLMStream(self._scheduled_events(system_msg, user_msgs, temperature))
+
+  async def _scheduled_events(self, system_msg: str, user_msgs: str | list[str],
+                              temperature: float) -> AsyncIterator[str | LLMUsage]:
+    scheduler = LLMScheduler.get(self.get_type(), self.model)
+    reservation = None
+    queued_at = scheduler.loop.time()
+    admission = llm_admission.get()
+    if admission is not None:
+      admission.enter(scheduler)
+    if scheduler.is_limited:
+      messages = [user_msgs] if isinstance(user_msgs, str) else user_msgs
+      tokens = self.estimate_tokens(system_msg + ''.join(messages)).tokens
+      reservation = await scheduler.acquire(tokens + LLM_EXPECTED_OUTPUT_TOKENS, self.priority)
+    if admission is not None:
+      admission.admit()
+    queue_ms = (scheduler.loop.time() - queued_at) * 1000
+
+    used: int | None = None
+    try:
+      stream = self.llmsrv.stream(system_msg, user_msgs, temperature)
+      async for text in stream:
+        yield text
+      assert stream.usage is not None
+      used = stream.usage.total_token
+      yield stream.usage.model_copy(update={'queue_ms': stream.usage.queue_ms + queue_ms})
+    finally:
+      if reservation is not None:
+        scheduler.settle(reservation, used)
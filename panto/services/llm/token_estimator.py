@@ -0,0 +1,66 @@
+import math
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class TokenEstimate:
+  """
+    Token count with the band the real count lies in. Exact counts have `low == high`.
+  """
+  tokens: int
+  low: int
+  high: int
+
+  @staticmethod
+  def exactly(tokens: int) -> 'TokenEstimate':
+    return TokenEstimate(tokens, tokens, tokens)
+
+  @property
+  def is_exact(self) -> bool:
+    return self.low == self.high
+
+  def below(self, limit: int) -> bool | None:
+    """
+      Whether the real count is `< limit`, or None when the band straddles `limit` and only an
+      exact count can tell.
+    """
+    if self.high < limit:
+      return True
+    if self.low >= limit:
+      return False
+    return None
+
+  def __add__(self, other: 'TokenEstimate') -> 'TokenEstimate':
+    return TokenEstimate(self.tokens + other.tokens, self.low + other.low, self.high + other.high)
+
+
+@dataclass(frozen=True)
+class TokenEstimator:
+  """
+    Estimates tokens from the utf-8 size of the text, without tokenizing. `relative_error` is
+    the band assumed around the estimate; the upper end is also capped at one token per byte,
+    which holds for byte level BPE tokenizers whatever the text.
+  """
+  bytes_per_token: float
+  relative_error: float
+
+  def estimate(self, text: str) -> TokenEstimate:
+    size = len(text.encode('utf-8'))
+    tokens = math.ceil(size / self.bytes_per_token)
+    low = math.floor(tokens * (1 - self.relative_error))
+    high = min(size, math.ceil(tokens * (1 + self.relative_error)))
+    return TokenEstimate(tokens, low, high)
+
+
+# bytes per token of review prompts (diffs and source code) per tokenizer family. The error
+# bands are wide on purpose: prose, minified code and non latin text drift from the average.
+_ESTIMATORS = {
+  'o200k_base': TokenEstimator(bytes_per_token=3.8, relative_error=0.35),
+  'cl100k_base': TokenEstimator(bytes_per_token=3.6, relative_error=0.35),
+  'claude': TokenEstimator(bytes_per_token=3.4, relative_error=0.4),
+}
+DEFAULT_TOKEN_ESTIMATOR = TokenEstimator(bytes_per_token=3.5, relative_error=0.5)
+
+
+def get_token_estimator(family: str) -> TokenEstimator:
+  return _ESTIMATORS.get(family, DEFAULT_TOKEN_ESTIMATOR)
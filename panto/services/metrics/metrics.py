@@ -5,7 +5,7 @@ from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_scoped_session
 
 from panto.config import DEFAULT_METRICS_COLLECTION_SRV
-from panto.data_models.git import PostedComment, PRStatus, ReviewStatus
+from panto.data_models.git import GitFetchStats, PostedComment, PRStatus, ReviewStatus
 from panto.data_models.pr_review import PRSuggestions
 from panto.logging import log
 from panto.models.pr import PRReviewDataModel, PRReviewModel
@@ -78,6 +78,8 @@ class MetricsCollectionService(abc.ABC):
     reviewed_from: str,
     reviewed_to: str,
     is_soft_review: bool = False,
+    pr_commits: list[str] | None = None,
+    git_fetch: GitFetchStats | None = None,
   ):
     pass
 
@@ -89,6 +91,7 @@ class MetricsCollectionService(abc.ABC):
     provider: GitServiceType,
     posted_comments: list[PostedComment],
     reviewed_id: str | None = None,
+    append: bool = False,
   ):
     pass
 
@@ -228,6 +231,8 @@ class DBMetricsCollectionService(MetricsCollectionService):
     reviewed_from: str,
     reviewed_to: str,
     is_soft_review: bool = False,
+    pr_commits: list[str] | None = None,
+    git_fetch: GitFetchStats | None = None,
   ):
     async with self.get_session() as db_session:
       pr_repository = PRRepository(db_session)
@@ -246,6 +251,7 @@ class DBMetricsCollectionService(MetricsCollectionService):
       last_pr_review.status = review_status
       last_pr_review.reviewed_from = reviewed_from
       last_pr_review.reviewed_to = reviewed_to
+      last_pr_review.pr_commits = pr_commits
       last_pr_review.no_of_files = no_of_files
       last_pr_review.unfiltered_review_count = unfiltered_review_count
       last_pr_review.final_review_count = final_review_count
@@ -255,12 +261,27 @@ class DBMetricsCollectionService(MetricsCollectionService):
       last_pr_review.review_user_token = review_llm_usages.user_token
       last_pr_review.review_output_token = review_llm_usages.output_token
       last_pr_review.review_latency = review_llm_usages.latency
+      last_pr_review.review_latency_ms = int(review_llm_usages.latency_ms)
+      last_pr_review.review_ttft_ms = int(review_llm_usages.mean_ttft_ms)
+      last_pr_review.review_queue_ms = int(review_llm_usages.queue_ms)
+      last_pr_review.review_overhead_ms = int(review_llm_usages.overhead_ms)
+      last_pr_review.review_output_tps = review_llm_usages.output_tokens_per_second
+
+      if git_fetch:
+        last_pr_review.git_fetch_strategy = git_fetch.strategy
+        last_pr_review.git_fetch_ms = git_fetch.duration_ms
+        last_pr_review.git_fetch_bytes = git_fetch.bytes
 
       if correction_llm_usages:
         last_pr_review.correction_system_token = correction_llm_usages.system_token
         last_pr_review.correction_user_token = correction_llm_usages.user_token
         last_pr_review.correction_output_token = correction_llm_usages.output_token
         last_pr_review.correction_latency = correction_llm_usages.latency
+        last_pr_review.correction_latency_ms = int(correction_llm_usages.latency_ms)
+        last_pr_review.correction_ttft_ms = int(correction_llm_usages.mean_ttft_ms)
+        last_pr_review.correction_queue_ms = int(correction_llm_usages.queue_ms)
+        last_pr_review.correction_overhead_ms = int(correction_llm_usages.overhead_ms)
+        last_pr_review.correction_output_tps = correction_llm_usages.output_tokens_per_second
 
       db_session.add(last_pr_review)
 
@@ -280,6 +301,7 @@ class DBMetricsCollectionService(MetricsCollectionService):
     provider: GitServiceType,
     posted_comments: list[PostedComment],
     reviewed_id: str | None = None,
+    append: bool = False,
   ):
     async with self.get_session() as db_session:
       repo_id = str(repo_id)
@@ -291,6 +313,10 @@ class DBMetricsCollectionService(MetricsCollectionService):
         reviewed_id = last_pr_review.id
 
       comments_json = [c.model_dump() for c in posted_comments]
+      if append:
+        stmt = select(PRReviewDataModel.comment_json).filter_by(pr_review_id=reviewed_id)
+        existing = (await db_session.execute(stmt)).scalar()
+        comments_json = (existing or []) + comments_json
       stmt = update(PRReviewDataModel).filter_by(pr_review_id=reviewed_id).values(
         comment_json=comments_json)
       await db_session.execute(stmt)
@@ -380,11 +406,13 @@ class NoopMetricsCollectionService(MetricsCollectionService):
     reviewed_from: str,
     reviewed_to: str,
     is_soft_review: bool = False,
+    pr_commits: list[str] | None = None,
+    git_fetch: GitFetchStats | None = None,
   ):
     log.info(f"[metrics]Review Completed: {repo_id} {provider}"
              f"{pr_no} {no_of_files} {prsuggestions} {unfiltered_review_count}"
              f"{final_review_count} {lvl2_review_count} {review_llm_usages}"
-             f"{correction_llm_usages} {reviewed_from} {reviewed_to}")
+             f"{correction_llm_usages} {reviewed_from} {reviewed_to} {git_fetch}")
 
   async def review_commented(
     self,
@@ -393,6 +421,7 @@ class NoopMetricsCollectionService(MetricsCollectionService):
     provider: GitServiceType,
     posted_comments: list[PostedComment],
     reviewed_id: str | None = None,
+    append: bool = False,
   ):
     log.info(f"[metrics]Review Commented: {repo_id} {provider} {pr_no} {posted_comments}")
 
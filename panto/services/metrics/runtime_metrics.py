@@ -0,0 +1,72 @@
+import threading
+
+_LabelSet = tuple[tuple[str, str], ...]
+
+
+class RuntimeMetrics:
+  """
+    In-process counters and gauges of the worker (rate limit budgets, cache hits, ...) rendered
+    in the Prometheus text format on `/metrics`. Unlike `MetricsCollectionService` nothing is
+    persisted, values reset on restart.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._types: dict[str, tuple[str, str]] = {}
+    self._values: dict[str, dict[_LabelSet, float]] = {}
+
+  def inc(self, name: str, value: float = 1, *, help: str = '', **labels: str) -> None:
+    with self._lock:
+      series = self._series(name, 'counter', help)
+      key = _label_set(labels)
+      series[key] = series.get(key, 0) + value
+
+  def set(self, name: str, value: float, *, help: str = '', **labels: str) -> None:
+    with self._lock:
+      self._series(name, 'gauge', help)[_label_set(labels)] = value
+
+  def value(self, name: str, **labels: str) -> float | None:
+    with self._lock:
+      return self._values.get(name, {}).get(_label_set(labels))
+
+  def clear(self) -> None:
+    with self._lock:
+      self._types.clear()
+      self._values.clear()
+
+  def render(self) -> str:
+    lines = []
+    with self._lock:
+      for name, (metric_type, help_text) in sorted(self._types.items()):
+        if help_text:
+          lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(self._values[name].items()):
+          lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return '\n'.join(lines) + '\n'
+
+  def _series(self, name: str, metric_type: str, help_text: str) -> dict[_LabelSet, float]:
+    if name not in self._types:
+      self._types[name] = (metric_type, help_text)
+      self._values[name] = {}
+    elif help_text and not self._types[name][1]:
+      self._types[name] = (metric_type, help_text)
+    return self._values[name]
+
+
+def _label_set(labels: dict[str, str]) -> _LabelSet:
+  return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: _LabelSet) -> str:
+  if not labels:
+    return ''
+  escaped = (f'{k}="{_escape(v)}"' for k, v in labels)
+  return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+runtime_metrics = RuntimeMetrics()
@@ -46,7 +46,7 @@ class NoopNotificationService(NotificationService):
                         request_id: str | None = None,
                         purpose: str | None = None):
     log.info(
-      f"[NOTIFICATION]📊 Usages: \nSystem Token: {usages.system_token}\nUser Token: {usages.user_token}\nOutput Token: {usages.output_token}\nTotal Token: {usages.total_token}\nLatency: {usages.latency}s\n\nRepo: {repo_url}"  # noqa
+      f"[NOTIFICATION]📊 Usages: \nSystem Token: {usages.system_token}\nUser Token: {usages.user_token}\nOutput Token: {usages.output_token}\nTotal Token: {usages.total_token}\nLatency: {usages.latency_ms / 1000:.2f}s\nTTFT: {usages.mean_ttft_ms:.0f}ms\nQueue: {usages.queue_ms:.0f}ms\nOverhead: {usages.overhead_ms:.0f}ms\nThroughput: {usages.output_tokens_per_second or 0:.0f} tok/s\n\nRepo: {repo_url}"  # noqa
     )
 
   async def emit_suggestions_generated(self,
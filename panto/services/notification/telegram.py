@@ -69,7 +69,7 @@ class TelegramNotificationService(NotificationService):
                         usages: LLMUsage,
                         request_id: str | None = None,
                         purpose: str | None = None):
-    msg = f"📊 Usages: \nSystem Token: {usages.system_token}\nUser Token: {usages.user_token}\nOutput Token: {usages.output_token}\nTotal Token: {usages.total_token}\nLatency: {usages.latency}s\n\nRepo: {repo_url}"  # noqa
+    msg = f"📊 Usages: \nSystem Token: {usages.system_token}\nUser Token: {usages.user_token}\nOutput Token: {usages.output_token}\nTotal Token: {usages.total_token}\nLatency: {usages.latency_ms / 1000:.2f}s\nTTFT: {usages.mean_ttft_ms:.0f}ms\nQueue: {usages.queue_ms:.0f}ms\nOverhead: {usages.overhead_ms:.0f}ms\nThroughput: {usages.output_tokens_per_second or 0:.0f} tok/s\n\nRepo: {repo_url}"  # noqa
     if request_id:
       msg += f"\nRequest ID: {request_id}"
     if purpose:
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class LRUCache(Generic[K, V]):
+  """
+    Small bounded in-process LRU map. Meant for immutable facts (e.g. commit relations) that
+    are safe to share across reviews running in the same worker.
+  """
+
+  def __init__(self, maxsize: int = 1024):
+    assert maxsize > 0, "maxsize must be positive"
+    self.maxsize = maxsize
+    self._data: OrderedDict[K, V] = OrderedDict()
+
+  def get(self, key: K, default: V | None = None) -> V | None:
+    if key not in self._data:
+      return default
+    self._data.move_to_end(key)
+    return self._data[key]
+
+  def put(self, key: K, value: V) -> None:
+    self._data[key] = value
+    self._data.move_to_end(key)
+    while len(self._data) > self.maxsize:
+      self._data.popitem(last=False)
+
+  def pop(self, key: K, default: V | None = None) -> V | None:
+    return self._data.pop(key, default)
+
+  def clear(self) -> None:
+    self._data.clear()
+
+  def __contains__(self, key: K) -> bool:
+    return key in self._data
+
+  def __len__(self) -> int:
+    return len(self._data)
@@ -250,55 +250,115 @@ def parsed_hunk_to_string(hunk: Hunk, add_header=True, add_lineno=True) -> str:
   return diff_content
 
 
-def diff_str_to_patchfiles(diff_str: str) -> list[GitPatchFile]:
-  files: list[GitPatchFile] = []
-  patch = ""
-  for line in diff_str.splitlines():
-    if line.startswith('index ') or line.startswith('--- ') or line.startswith(
-        '+++ ') or line.startswith('similarity index ') or line.startswith(
-          'rename from ') or line.startswith('rename to '):
-      continue
-    if line.startswith('new file mode'):
-      if files:
-        files[-1].status = GitPatchStatus.ADDED
-      continue
-    if line.startswith('deleted file mode'):
-      if files:
-        files[-1].status = GitPatchStatus.REMOVED
-      continue
+_DIFF_HEADER_PREFIXES = (
+  'index ',
+  '--- ',
+  '+++ ',
+  'similarity index ',
+  'dissimilarity index ',
+  'rename from ',
+  'rename to ',
+  'copy from ',
+  'copy to ',
+  'old mode ',
+  'new mode ',
+  'Binary files ',
+)
+
+
+class DiffStreamParser:
+  """
+    Incremental parser of `git diff` output into `GitPatchFile`s. Text can be fed in arbitrary
+    chunks as it arrives, files are handed out as soon as the next `diff --git` line shows they
+    are complete, so a large diff is never split or held as a whole.
+  """
 
+  def __init__(self):
+    self._buffer = ""
+    self._file: GitPatchFile | None = None
+    self._patch_lines: list[str] = []
+    self._in_header = False
+    self._completed: list[GitPatchFile] = []
+
+  def feed(self, chunk: str) -> list[GitPatchFile]:
+    """
+      Parses `chunk` and returns the files completed by it.
+    """
+    self._buffer += chunk
+    *lines, self._buffer = self._buffer.split('\n')
+    for line in lines:
+      self._parse_line(line.removesuffix('\r'))
+    return self._take_completed()
+
+  def close(self) -> list[GitPatchFile]:
+    """
+      Flushes the remaining input and returns the last files.
+    """
+    if self._buffer:
+      self._parse_line(self._buffer.removesuffix('\r'))
+      self._buffer = ""
+    self._finish_file()
+    return self._take_completed()
+
+  def _parse_line(self, line: str) -> None:
     if line.startswith('diff --git'):
-      if files:
-        files[-1].patch = patch
-      splitted = line.split(' ')
-      if len(splitted) == 4:
-        diff_file_1 = splitted[2].replace('a/', '', 1)
-        diff_file_2 = splitted[3].replace('b/', '', 1)
-      else:
-        # This is a special case when file name contains space
-        file_pattern = r"diff --git a/(.+?) b/((.+?)+)"
-        matches = re.match(file_pattern, line)
-        assert matches, f"Failed to match file name from line: {line}"
-        diff_file_1 = matches.group(1)
-        diff_file_2 = matches.group(2)
-
-      patch = ""
-      if diff_file_1 != diff_file_2:
-        files.append(
-          GitPatchFile(filename=diff_file_2,
-                       status=GitPatchStatus.RENAMED,
-                       patch=patch,
-                       old_filename=diff_file_1))
-      else:
-        files.append(
-          GitPatchFile(filename=diff_file_2, status=GitPatchStatus.MODIFIED, patch=patch))
+      self._finish_file()
+      self._start_file(line)
+      return
+    if self._file is None:
+      return
+
+    if self._in_header:
+      if line.startswith('new file mode'):
+        self._file.status = GitPatchStatus.ADDED
+        return
+      if line.startswith('deleted file mode'):
+        self._file.status = GitPatchStatus.REMOVED
+        return
+      if line.startswith(_DIFF_HEADER_PREFIXES):
+        return
+      self._in_header = False
+    self._patch_lines.append(line)
+
+  def _start_file(self, line: str) -> None:
+    splitted = line.split(' ')
+    if len(splitted) == 4:
+      diff_file_1 = splitted[2].replace('a/', '', 1)
+      diff_file_2 = splitted[3].replace('b/', '', 1)
+    else:
+      # This is a special case when file name contains space
+      file_pattern = r"diff --git a/(.+?) b/((.+?)+)"
+      matches = re.match(file_pattern, line)
+      assert matches, f"Failed to match file name from line: {line}"
+      diff_file_1 = matches.group(1)
+      diff_file_2 = matches.group(2)
+
+    if diff_file_1 != diff_file_2:
+      self._file = GitPatchFile(filename=diff_file_2,
+                                status=GitPatchStatus.RENAMED,
+                                patch="",
+                                old_filename=diff_file_1)
     else:
-      patch += line + "\n"
+      self._file = GitPatchFile(filename=diff_file_2, status=GitPatchStatus.MODIFIED, patch="")
+    self._patch_lines = []
+    self._in_header = True
+
+  def _finish_file(self) -> None:
+    if self._file is None:
+      return
+    self._file.patch = "".join(f"{line}\n" for line in self._patch_lines)
+    self._completed.append(self._file)
+    self._file = None
+    self._patch_lines = []
 
-  if patch and files:
-    files[-1].patch = patch
+  def _take_completed(self) -> list[GitPatchFile]:
+    completed, self._completed = self._completed, []
+    return completed
 
-  return files
+
+def diff_str_to_patchfiles(diff_str: str) -> list[GitPatchFile]:
+  parser = DiffStreamParser()
+  return parser.feed(diff_str) + parser.close()
 
 
 def gitlab_diff_to_patch_files(gitlab_files: list) -> list[GitPatchFile]:
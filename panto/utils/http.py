@@ -0,0 +1,151 @@
+import asyncio
+import importlib.util
+import time
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import httpx
+
+from panto.config import (HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_POOL_LIMIT,
+                          HTTP_POOL_LIMIT_PER_HOST, HTTP_REQUEST_TIMEOUT, LLM_CONNECT_TIMEOUT,
+                          LLM_HTTP2, LLM_HTTP_POOL_LIMIT, LLM_READ_TIMEOUT)
+from panto.logging import log
+
+
+class SharedClientSession:
+  """
+    Process wide aiohttp session. Keeps the connection pool, keep-alive sockets and the DNS
+    cache alive across reviews instead of paying a new TLS handshake per API call.
+  """
+  _session: aiohttp.ClientSession | None = None
+  _loop: asyncio.AbstractEventLoop | None = None
+
+  @staticmethod
+  def get() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = SharedClientSession._session
+    # A session is bound to the loop it was created on (cli runs a new loop per command)
+    if session is None or session.closed or SharedClientSession._loop is not loop:
+      connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+      )
+      session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=HTTP_REQUEST_TIMEOUT),
+      )
+      SharedClientSession._session = session
+      SharedClientSession._loop = loop
+    return session
+
+  @staticmethod
+  async def close() -> None:
+    session = SharedClientSession._session
+    SharedClientSession._session = None
+    SharedClientSession._loop = None
+    if session and not session.closed:
+      await session.close()
+
+
+class SharedLLMHttpClient:
+  """
+    Process wide httpx client for the LLM SDKs (built on httpx, not aiohttp). Keeps their
+    connections to the LLM API warm across reviews, multiplexed over HTTP/2 when `h2` is
+    installed.
+  """
+  _client: httpx.AsyncClient | None = None
+  _loop: asyncio.AbstractEventLoop | None = None
+
+  @staticmethod
+  def get() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = SharedLLMHttpClient._client
+    # A client is bound to the loop it was created on (cli runs a new loop per command)
+    if client is None or client.is_closed or SharedLLMHttpClient._loop is not loop:
+      client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=LLM_HTTP_POOL_LIMIT,
+                            max_keepalive_connections=LLM_HTTP_POOL_LIMIT,
+                            keepalive_expiry=HTTP_KEEPALIVE_TIMEOUT),
+        timeout=llm_timeout(),
+        follow_redirects=True,
+        http2=LLM_HTTP2 and importlib.util.find_spec('h2') is not None,
+      )
+      SharedLLMHttpClient._client = client
+      SharedLLMHttpClient._loop = loop
+    return client
+
+  @staticmethod
+  async def close() -> None:
+    client = SharedLLMHttpClient._client
+    SharedLLMHttpClient._client = None
+    SharedLLMHttpClient._loop = None
+    if client and not client.is_closed:
+      await client.aclose()
+
+
+def llm_timeout() -> httpx.Timeout:
+  return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+async def preconnect_llm(url: str) -> None:
+  """
+    Opens a pooled connection to the host of `url` (TCP, TLS and HTTP/2 setup) before the
+    first real call needs it. Whatever the server answers, the connection is kept.
+  """
+  try:
+    await SharedLLMHttpClient.get().head(url)
+  except httpx.HTTPError as e:
+    log.warning(f"Can't preconnect to {url}: {e!r}")
+
+
+class RateLimitedError(Exception):
+  """
+    Raised by provider clients when the API asked us to slow down. `retry_after` is in seconds
+    when the server said how long to wait.
+  """
+
+  def __init__(self, message: str, retry_after: float | None = None):
+    super().__init__(message)
+    self.retry_after = retry_after
+
+
+def is_rate_limited(status: int, headers: Mapping[str, str]) -> bool:
+  if status == 429:
+    return True
+  headers = {k.lower(): v for k, v in headers.items()}
+  remaining = headers.get('ratelimit-remaining') or headers.get('x-ratelimit-remaining')
+  return status == 403 and remaining == '0'
+
+
+def get_retry_after(headers: Mapping[str, str]) -> float | None:
+  """
+    Seconds to wait according to `Retry-After` (delta or http date) or the rate-limit reset
+    headers (epoch timestamp as sent by GitHub/GitLab, or delta seconds).
+  """
+  headers = {k.lower(): v for k, v in headers.items()}
+
+  retry_after = headers.get('retry-after')
+  if retry_after:
+    try:
+      return max(float(retry_after), 0.0)
+    except ValueError:
+      pass
+    try:
+      retry_at = parsedate_to_datetime(retry_after)
+      return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+      pass
+
+  reset = headers.get('ratelimit-reset') or headers.get('x-ratelimit-reset')
+  if reset and reset.isdigit():
+    value = int(reset)
+    if value > 1_000_000_000:
+      return max(value - time.time(), 0.0)
+    return float(value)
+
+  return None
@@ -0,0 +1,54 @@
+from panto.services.git.http_cache import ConditionalRequestCache
+from panto.services.metrics.runtime_metrics import runtime_metrics
+from panto.utils.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+  cache: LRUCache[str, int] = LRUCache(maxsize=2)
+  cache.put("a", 1)
+  cache.put("b", 2)
+  assert cache.get("a") == 1
+  cache.put("c", 3)
+  assert "b" not in cache
+  assert cache.get("a") == 1
+  assert cache.get("c") == 3
+  assert len(cache) == 2
+
+
+def test_lru_cache_get_default():
+  cache: LRUCache[str, bool] = LRUCache(maxsize=1)
+  assert cache.get("missing") is None
+  cache.put("x", False)
+  assert cache.get("x") is False
+  assert cache.pop("x") is False
+  assert len(cache) == 0
+
+
+def test_conditional_request_cache_revalidates():
+  cache = ConditionalRequestCache(maxsize=4, max_body_bytes=100)
+  key = cache.key("token-a", "https://api/x", {"ref": "main"})
+  assert key != cache.key("token-b", "https://api/x", {"ref": "main"})
+  assert cache.conditional_headers(key) == {}
+
+  hits = runtime_metrics.value("panto_http_cache_hits_total", provider="test") or 0
+  assert cache.resolve(key, "test", 200, {"ETag": '"v1"'}, b"body")[1] == b"body"
+  assert cache.conditional_headers(key) == {"If-None-Match": '"v1"'}
+  assert cache.resolve(key, "test", 304, {}, b"")[1] == b"body"
+  assert runtime_metrics.value("panto_http_cache_hits_total", provider="test") == hits + 1
+
+  # no validator or too large to keep
+  cache.resolve(key, "test", 200, {}, b"new")
+  assert cache.get(key, "test") is None
+  cache.resolve(key, "test", 200, {"ETag": '"v2"'}, b"x" * 101)
+  assert cache.conditional_headers(key) == {}
+
+
+def test_not_modified_without_entry_asks_again():
+  cache = ConditionalRequestCache(maxsize=1, max_body_bytes=100)
+  key = cache.key("token-a", "https://api/x")
+  cache.resolve(key, "test", 200, {"ETag": '"v1"'}, b"body")
+  assert cache.conditional_headers(key) == {"If-None-Match": '"v1"'}
+  # evicted by another response while the revalidation was in flight
+  cache.resolve(cache.key("token-a", "https://api/y"), "test", 200, {"ETag": '"y"'}, b"y")
+  assert cache.resolve(key, "test", 304, {"ETag": '"v1"'}, b"") is None
+  assert cache.get(key, "test") is None
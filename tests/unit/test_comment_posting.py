@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from panto.services.git.comment_posting import CommentPostingExecutor
+from panto.utils.http import RateLimitedError, get_retry_after, is_rate_limited
+
+
+def test_get_retry_after():
+  assert get_retry_after({'Retry-After': '7'}) == 7.0
+  assert get_retry_after({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0.0
+  assert get_retry_after({'RateLimit-Reset': '12'}) == 12.0
+  reset_at = str(int(time.time()) + 30)
+  assert 25 < get_retry_after({'X-RateLimit-Reset': reset_at}) <= 30  # type: ignore
+  assert get_retry_after({}) is None
+
+
+def test_is_rate_limited():
+  assert is_rate_limited(429, {})
+  assert is_rate_limited(403, {'x-ratelimit-remaining': '0'})
+  assert not is_rate_limited(403, {'x-ratelimit-remaining': '10'})
+  assert not is_rate_limited(404, {})
+
+
+def test_executor_retries_and_keeps_order():
+  calls: dict[int, int] = {}
+
+  async def post(item: int) -> int:
+    calls[item] = calls.get(item, 0) + 1
+    if item == 2 and calls[item] == 1:
+      raise RateLimitedError("slow down", retry_after=0.01)
+    if item == 3:
+      raise ValueError("bad line")
+    return item * 10
+
+  async def run():
+    executor = CommentPostingExecutor(concurrency=2, max_retries=2)
+    return await executor.map(post, [1, 2, 3, 4])
+
+  results = asyncio.run(run())
+  assert results[0] == 10
+  assert results[1] == 20
+  assert isinstance(results[2], ValueError)
+  assert results[3] == 40
+  assert calls[2] == 2
@@ -0,0 +1,67 @@
+import asyncio
+import subprocess
+
+import pytest
+
+from panto.services.git.git_cat_file import GitCatFileReader
+
+
+def _git(cwd, *args) -> str:
+  return subprocess.check_output(['git', *args], cwd=cwd, text=True).strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+  _git(tmp_path, 'init', '-q')
+  (tmp_path / 'a.txt').write_text("hello\nworld\n")
+  (tmp_path / 'src').mkdir()
+  (tmp_path / 'src' / 'b.py').write_text("print('b')\n")
+  _git(tmp_path, 'add', '.')
+  _git(tmp_path, '-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-qm', 'init')
+  return tmp_path
+
+
+def test_cat_file_reader_reads_blobs(repo):
+  sha = _git(repo, 'rev-parse', 'HEAD')
+
+  async def run():
+    reader = GitCatFileReader.get(str(repo / '.git'))
+    try:
+      contents = await asyncio.gather(
+        reader.read(sha, 'a.txt'),
+        reader.read(sha, 'src/b.py'),
+        reader.read('HEAD', 'a.txt'),
+      )
+      with pytest.raises(FileNotFoundError):
+        await reader.read(sha, 'missing.txt')
+      with pytest.raises(IsADirectoryError):
+        await reader.read(sha, 'src')
+      # the pipe is still usable after failed lookups
+      contents.append(await reader.read('HEAD', 'src/b.py'))
+      return contents
+    finally:
+      await GitCatFileReader.close_all()
+
+  contents = asyncio.run(run())
+  assert contents == ["hello\nworld\n", "print('b')\n", "hello\nworld\n", "print('b')\n"]
+
+
+def test_cancelled_read_does_not_leak_into_the_next_one(repo):
+
+  async def run():
+    reader = GitCatFileReader.get(str(repo / '.git'))
+    try:
+      await reader.read('HEAD', 'src/b.py')
+      stdout = reader._proc.stdout
+
+      async def cancelled(n):
+        raise asyncio.CancelledError()  # as if cancelled between the header and the content
+
+      stdout.readexactly = cancelled
+      with pytest.raises(asyncio.CancelledError):
+        await reader.read('HEAD', 'a.txt')
+      return await reader.read('HEAD', 'src/b.py')
+    finally:
+      await GitCatFileReader.close_all()
+
+  assert asyncio.run(run()) == "print('b')\n"
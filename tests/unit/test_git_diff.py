@@ -0,0 +1,49 @@
+from panto.data_models.git import GitPatchStatus
+from panto.utils.git import DiffStreamParser, diff_str_to_patchfiles
+
+DIFF = """diff --git a/src/app.py b/src/app.py
+index 83db48f..bf269f4 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,2 +1,2 @@
+ import os
+-print(1)
++++counter
+diff --git a/new.txt b/new.txt
+new file mode 100644
+index 0000000..e69de29
+--- /dev/null
++++ b/new.txt
+@@ -0,0 +1 @@
++hello
+diff --git a/old name.md b/new name.md
+similarity index 100%
+rename from old name.md
+rename to new name.md
+diff --git a/logo.png b/logo.png
+deleted file mode 100644
+Binary files a/logo.png and /dev/null differ
+"""
+
+
+def test_diff_str_to_patchfiles():
+  files = diff_str_to_patchfiles(DIFF)
+  assert [(f.filename, f.status) for f in files] == [
+    ('src/app.py', GitPatchStatus.MODIFIED),
+    ('new.txt', GitPatchStatus.ADDED),
+    ('new name.md', GitPatchStatus.RENAMED),
+    ('logo.png', GitPatchStatus.REMOVED),
+  ]
+  # an added line starting with "++" is content, not a file header
+  assert files[0].patch == "@@ -1,2 +1,2 @@\n import os\n-print(1)\n+++counter\n"
+  assert files[2].old_filename == 'old name.md' and files[2].patch == ""
+  assert files[3].patch == ""
+
+
+def test_diff_stream_parser_chunks():
+  parser = DiffStreamParser()
+  files = []
+  for i in range(0, len(DIFF), 7):
+    files += parser.feed(DIFF[i:i + 7])
+  files += parser.close()
+  assert files == diff_str_to_patchfiles(DIFF)
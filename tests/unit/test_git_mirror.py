@@ -0,0 +1,75 @@
+import asyncio
+import subprocess
+
+import git
+import pytest
+
+from panto.services.git.git_mirror import GitCloneStrategy, GitMirror, _mirror_dir_name
+
+
+def _git(cwd, *args) -> str:
+  return subprocess.check_output(['git', *args], cwd=cwd, text=True).strip()
+
+
+def _commit(repo, filename: str, content: str) -> str:
+  (repo / filename).write_text(content)
+  _git(repo, 'add', '.')
+  _git(repo, '-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-qm', filename)
+  return _git(repo, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def remote(tmp_path):
+  repo = tmp_path / 'remote'
+  repo.mkdir()
+  _git(repo, 'init', '-q', '-b', 'main')
+  _git(repo, 'config', 'uploadpack.allowFilter', 'true')
+  for i in range(5):
+    _commit(repo, 'a.txt', f"base {i}\n")
+  _git(repo, 'checkout', '-q', '-b', 'feature')
+  _commit(repo, 'b.txt', "feature\n")
+  return repo
+
+
+def _mirror(tmp_path, remote, strategy: GitCloneStrategy) -> GitMirror:
+  url = f"file://{remote}"
+  return GitMirror(url, str(tmp_path / _mirror_dir_name(url, strategy)), strategy)
+
+
+def test_mirrors_of_other_strategies_are_kept_apart():
+  url = 'https://github.com/org/repo.git'
+  names = {_mirror_dir_name(url, strategy) for strategy in GitCloneStrategy}
+  assert len(names) == len(GitCloneStrategy)
+
+
+@pytest.mark.parametrize('strategy', list(GitCloneStrategy))
+def test_fetch_resolves_branches(tmp_path, remote, strategy):
+  mirror = _mirror(tmp_path, remote, strategy)
+  base_sha, head_sha, stats = asyncio.run(mirror.fetch('main', 'feature'))
+
+  assert base_sha == _git(remote, 'rev-parse', 'main')
+  assert head_sha == _git(remote, 'rev-parse', 'feature')
+  assert stats.strategy == strategy.value and stats.bytes > 0
+  assert mirror.repo.git.diff('--name-only', base_sha, head_sha) == 'b.txt'
+
+
+def test_shallow_refetch_keeps_deepened_history(tmp_path, remote, monkeypatch):
+  mirror = _mirror(tmp_path, remote, GitCloneStrategy.SHALLOW)
+  base_sha, _, _ = asyncio.run(mirror.fetch('main', 'feature'))
+  new_head = _commit(remote, 'c.txt', "more\n")
+
+  fetches = []
+  call_process = git.Git._call_process
+
+  def spy(self, method, *args, **kwargs):
+    if method == 'fetch':
+      fetches.append(args)
+    return call_process(self, method, *args, **kwargs)
+
+  monkeypatch.setattr(git.Git, '_call_process', spy)
+  _, head_sha, _ = asyncio.run(mirror.fetch('main', 'feature'))
+
+  assert head_sha == new_head
+  assert mirror.repo.git.merge_base(base_sha, head_sha) == base_sha
+  # the new commit attaches to the history deepened by the first fetch
+  assert not [args for args in fetches if any(a.startswith(('--depth', '--deepen')) for a in args)]
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import github
+
+from panto.services.git.github_service import GitHubService
+from panto.services.git.http_cache import http_cache
+from panto.services.git.rate_limit import RequestPriority, rate_limit_governor
+
+
+class _Requester:
+  """
+    Answers GETs like the GitHub api would, recording the validators it was sent.
+  """
+
+  def __init__(self, *answers):
+    self.answers = list(answers)
+    self.sent: list[dict] = []
+
+  def requestJson(self, verb, url, parameters=None, headers=None, input=None, cnx=None):
+    self.sent.append(dict(headers or {}))
+    return self.answers.pop(0)
+
+
+def _service(requester: _Requester) -> GitHubService:
+  gitsrv = GitHubService('https://github.com/org/repo')
+  gitsrv.rate_limit_key = 'github:test'
+  gitsrv._requester = lambda: requester  # type: ignore[method-assign]
+  return gitsrv
+
+
+def test_not_modified_for_an_evicted_entry_is_fetched_again(monkeypatch):
+  url = 'https://api.github.com/repos/org/repo/pulls/1'
+  pull = {'number': 1, 'title': 'PR'}
+  requester = _Requester(
+    (304, {'ETag': '"v1"'}, ''),
+    (200, {'ETag': '"v1"'}, json.dumps(pull)),
+  )
+  http_cache.clear()
+  # the entry the validators came from is evicted before the 304 is resolved
+  monkeypatch.setattr(http_cache, 'conditional_headers', lambda key: {'If-None-Match': '"v1"'})
+
+  assert _service(requester)._conditional_get(url)[1] == pull
+  assert requester.sent == [{'If-None-Match': '"v1"'}, {}]
+
+
+class _Paginated:
+
+  def __init__(self, items: list, per_page: int):
+    self.pages = [items[i:i + per_page] for i in range(0, len(items) + 1, per_page)]
+
+  def get_page(self, page: int) -> list:
+    return self.pages[page]
+
+
+def test_listings_take_the_rate_limit_budget_per_page(monkeypatch):
+  gitsrv = _service(_Requester())
+  gitsrv.github = github.Github(per_page=2)
+  acquired = []
+
+  async def acquire(key, priority=RequestPriority.NORMAL):
+    acquired.append(key)
+
+  monkeypatch.setattr(rate_limit_governor, 'acquire', acquire)
+  items = asyncio.run(gitsrv._list(_Paginated([1, 2, 3, 4, 5], per_page=2)))
+  assert items == [1, 2, 3, 4, 5]
+  assert acquired == ['github:test'] * 3
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from panto.services.llm import batch
+from panto.services.llm.batch import BatchLLMService, BatchRequestError, LLMBatchCoordinator
+from panto.services.llm.noopgpt import NoopGPTService
+
+
+def test_requests_of_a_window_share_one_batch(monkeypatch):
+  monkeypatch.setattr(batch, 'LLM_BATCH_WINDOW', 0.01)
+  monkeypatch.setattr(batch, 'LLM_BATCH_POLL_INTERVAL', 0.01)
+  noop = NoopGPTService()
+  llmsrv = BatchLLMService(noop)
+  submitted = []
+
+  async def run():
+    coordinator = LLMBatchCoordinator.get(noop)
+    submit = coordinator.backend.submit
+
+    async def record_submit(requests):
+      submitted.append(len(requests))
+      return await submit(requests)
+
+    monkeypatch.setattr(coordinator.backend, 'submit', record_submit)
+    return await asyncio.gather(llmsrv.ask('system', 'a'), llmsrv.ask('system', 'b'),
+                                llmsrv.ask('system', 'a'))
+
+  answers = asyncio.run(run())
+  assert submitted == [2]  # the same prompt is only sent once
+  assert [answer for answer, _ in answers] == ["random_file : -1 : @no_issues_found@"] * 3
+  assert answers[0][1].total_token > 0
+
+
+def test_batches_that_cant_be_polled_are_given_up(monkeypatch):
+  monkeypatch.setattr(batch, 'LLM_BATCH_WINDOW', 0.01)
+  monkeypatch.setattr(batch, 'LLM_BATCH_POLL_INTERVAL', 0.001)
+  monkeypatch.setattr(batch, 'LLM_BATCH_MAX_POLL_ERRORS', 3)
+  noop = NoopGPTService()
+  polls = []
+
+  async def run():
+    coordinator = LLMBatchCoordinator.get(noop)
+
+    async def is_done(batch_id):
+      polls.append(batch_id)
+      raise Exception('batch not found')
+
+    monkeypatch.setattr(coordinator.backend, 'is_done', is_done)
+    return await BatchLLMService(noop).ask('system', 'expired')
+
+  with pytest.raises(BatchRequestError, match='gave up on batch'):
+    asyncio.run(run())
+  assert len(polls) == 3
+
+
+def test_batches_past_their_completion_window_are_given_up(monkeypatch):
+  monkeypatch.setattr(batch, 'LLM_BATCH_POLL_INTERVAL', 0.001)
+  noop = NoopGPTService()
+
+  async def run():
+    coordinator = LLMBatchCoordinator.get(noop)
+    monkeypatch.setattr(coordinator.backend, 'is_done', lambda batch_id: asyncio.sleep(0, False))
+    future = coordinator.loop.create_future()
+    coordinator._waiters['r1'] = [future]
+    coordinator.watch('local-gone', {'r1'}, submitted_at=time.time() - batch.LLM_BATCH_MAX_AGE - 1)
+    return await future
+
+  result = asyncio.run(run())
+  assert result.response is None and 'not done' in result.error
+
+
+def test_failed_lookup_leaves_no_waiter_behind(monkeypatch):
+  noop = NoopGPTService()
+  lookups = []
+
+  async def get(request_id):
+    lookups.append(request_id)
+    await asyncio.sleep(0)
+    raise ConnectionError('db is down')
+
+  monkeypatch.setattr(batch.llm_batch_store, 'get', get)
+
+  async def run():
+    coordinator = LLMBatchCoordinator.get(noop)
+    llmsrv = BatchLLMService(noop)
+    asks = asyncio.gather(llmsrv.ask('system', 'a'), llmsrv.ask('system', 'a'),
+                          return_exceptions=True)
+    first, joined = await asyncio.wait_for(asks, 1)
+    assert isinstance(first, ConnectionError)
+    assert isinstance(joined, BatchRequestError)
+    assert coordinator._waiters == {}
+    # a retry of the same prompt looks it up again instead of waiting forever
+    with pytest.raises(ConnectionError):
+      await asyncio.wait_for(llmsrv.ask('system', 'a'), 1)
+
+  asyncio.run(run())
+  assert len(lookups) == 2
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from panto.services.llm.cassette import (CassetteMissError, RecordingLLMService,
+                                         ReplayLLMService)
+from panto.services.llm.llm_service import LLMServiceType
+from panto.services.llm.noopgpt import NoopGPTService
+
+
+def test_replays_recorded_review_calls(tmp_path):
+  path = str(tmp_path / 'review.jsonl')
+
+  async def record():
+    recorder = RecordingLLMService(NoopGPTService(max_tokens=1234), path)
+    tokens = await recorder.get_encode_length('some diff to count')
+    return tokens, await recorder.ask('system', ['file a', 'file b'])
+
+  tokens, (answer, usage) = asyncio.run(record())
+
+  async def replay():
+    replayer = ReplayLLMService(path)
+    assert replayer.max_tokens == 1234 and replayer.get_type() == LLMServiceType.NOOP
+    assert await replayer.get_encode_length('some diff to count') == tokens
+    chunks = [text async for text in replayer.stream('system', ['file a', 'file b'])]
+    assert ''.join(chunks) == answer
+    assert (await replayer.ask('system', ['file a', 'file b']))[1] == usage
+    with pytest.raises(CassetteMissError):
+      await replayer.ask('system', 'another prompt')
+
+  asyncio.run(replay())
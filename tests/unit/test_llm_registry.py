@@ -0,0 +1,18 @@
+import asyncio
+
+from panto.services.llm.llm_service import LLMServiceType
+from panto.services.llm.registry import LLMServiceRegistry
+
+
+def test_reviews_borrow_one_service_per_provider():
+
+  async def borrow():
+    first = await LLMServiceRegistry.get(LLMServiceType.NOOP)
+    second = await LLMServiceRegistry.get(LLMServiceType.NOOP)
+    other_model = await LLMServiceRegistry.get(LLMServiceType.NOOP, model='other')
+    return first, second, other_model
+
+  LLMServiceRegistry.clear()
+  first, second, other_model = asyncio.run(borrow())
+  assert first is second and other_model is not first
+  LLMServiceRegistry.clear()
@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import openai
+
+from panto.services.llm import resilient
+from panto.services.llm.llm_service import LLMService, LLMServiceType, LLMUsage
+from panto.services.llm.resilient import ResilientLLMService, is_retryable_llm_error
+from panto.services.llm.scheduler import LLMAdmission, LLMScheduler
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+  response = httpx.Response(status, request=httpx.Request('POST', 'https://api.openai.com'))
+  return openai.APIStatusError('error', response=response, body=None)
+
+
+class FlakyLLMService(LLMService):
+
+  def __init__(self, errors: list[Exception]):
+    super().__init__()
+    self.errors = errors
+    self.calls = 0
+
+  async def get_encode(self, text: str) -> list[int]:
+    return list(range(len(text)))
+
+  async def ask(self, system_msg, user_msgs, temperature=0):
+    self.calls += 1
+    if self.errors:
+      raise self.errors.pop(0)
+    usage = LLMUsage(system_token=0, user_token=0, total_input_token=0, output_token=0,
+                     total_token=0, latency=0)
+    return 'answer', usage
+
+  def get_type(self) -> LLMServiceType:
+    return LLMServiceType.NOOP
+
+
+def test_retryable_errors():
+  assert is_retryable_llm_error(_status_error(429))
+  assert is_retryable_llm_error(_status_error(503))
+  assert not is_retryable_llm_error(_status_error(400))
+  assert not is_retryable_llm_error(ValueError())
+
+
+def test_retries_within_budget(monkeypatch):
+  monkeypatch.setattr(resilient, 'LLM_RETRY_BASE_DELAY', 0)
+  flaky = FlakyLLMService([_status_error(503), _status_error(429)])
+  llmsrv = ResilientLLMService(flaky, retry_budget=3)
+  assert asyncio.run(llmsrv.ask('system', 'user'))[0] == 'answer'
+  assert flaky.calls == 3 and llmsrv.retry_budget == 1
+
+  # the budget is per review, not per call
+  flaky.errors = [_status_error(500), _status_error(500)]
+  try:
+    asyncio.run(llmsrv.ask('system', 'user'))
+    assert False, 'expected the second error once the budget is spent'
+  except openai.APIStatusError:
+    pass
+  assert llmsrv.retry_budget == 0
+
+
+def test_hedge_timer_starts_when_the_scheduler_admits_the_call():
+
+  async def run():
+    scheduler = LLMScheduler(LLMServiceType.OPENAI, 'm', rpm_limit=1, tpm_limit=0)
+    admission = LLMAdmission()
+    admission.enter(scheduler)
+    call = asyncio.create_task(asyncio.sleep(1))
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.2, admission.admit)
+    started_at = loop.time()
+    runs_past = await resilient._runs_past(call, admission, 0.05)
+    call.cancel()
+    return runs_past, loop.time() - started_at
+
+  runs_past, waited = asyncio.run(run())
+  # queued for 0.2s, then p95 of provider time
+  assert runs_past and waited >= 0.24
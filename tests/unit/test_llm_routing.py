@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+import openai
+
+from panto.services.llm.llm_service import LLMService, LLMServiceType, LLMUsage
+from panto.services.llm.routing import RoutingLLMService, get_backend_health
+
+
+class FakeBackend(LLMService):
+
+  def __init__(self, model: str, max_tokens: int, fail: bool = False):
+    super().__init__(max_tokens=max_tokens)
+    self.model = model
+    self.fail = fail
+    self.calls = 0
+
+  async def get_encode(self, text: str) -> list[int]:
+    return list(range(len(text) // 4))
+
+  async def ask(self, system_msg, user_msgs, temperature=0):
+    self.calls += 1
+    if self.fail:
+      response = httpx.Response(503, request=httpx.Request('POST', 'https://llm'))
+      raise openai.APIStatusError('overloaded', response=response, body=None)
+    usage = LLMUsage(system_token=0, user_token=0, total_input_token=0, output_token=0,
+                     total_token=0, latency=0)
+    return self.model, usage
+
+  def get_type(self) -> LLMServiceType:
+    return LLMServiceType.NOOP
+
+
+def test_fails_over_to_next_backend():
+  primary = FakeBackend('routing-primary', 1000, fail=True)
+  secondary = FakeBackend('routing-secondary', 1000)
+  llmsrv = RoutingLLMService([primary, secondary])
+  assert asyncio.run(llmsrv.ask('system', 'user'))[0] == 'routing-secondary'
+  assert primary.calls == 1 and get_backend_health(primary).error_rate == 1
+
+
+def test_only_backends_fitting_the_prompt():
+  small = FakeBackend('routing-small', 100)
+  large = FakeBackend('routing-large', 100_000)
+  llmsrv = RoutingLLMService([small, large])
+  assert llmsrv.max_tokens == 100_000
+  assert asyncio.run(llmsrv.ask('system', 'x' * 2000))[0] == 'routing-large'
+  assert small.calls == 0
+  assert asyncio.run(llmsrv.ask('system', 'user'))[0] == 'routing-small'
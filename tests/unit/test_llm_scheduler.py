@@ -0,0 +1,87 @@
+import asyncio
+
+from panto.services.llm.llm_service import LLMServiceType
+from panto.services.llm.scheduler import LLMRequestPriority, LLMScheduler
+from panto.services.metrics.runtime_metrics import runtime_metrics
+
+
+def _expire_window(scheduler: LLMScheduler) -> None:
+  # as if the minute of the calls in the window had passed
+  for reservation in scheduler._window:
+    reservation.at -= 61
+  scheduler._dispatch()
+
+
+def test_manual_calls_are_admitted_before_auto_ones():
+
+  async def run():
+    scheduler = LLMScheduler(LLMServiceType.OPENAI, 'm', rpm_limit=1, tpm_limit=0)
+    await scheduler.acquire(10, LLMRequestPriority.AUTO)
+    admitted = []
+
+    async def call(name, priority):
+      await scheduler.acquire(10, priority)
+      admitted.append(name)
+
+    tasks = [
+      asyncio.create_task(call('auto', LLMRequestPriority.AUTO)),
+      asyncio.create_task(call('manual', LLMRequestPriority.MANUAL)),
+    ]
+    await asyncio.sleep(0)
+    assert admitted == []
+    _expire_window(scheduler)
+    await asyncio.sleep(0)
+    assert admitted == ['manual']
+    _expire_window(scheduler)
+    await asyncio.gather(*tasks)
+    return admitted
+
+  assert asyncio.run(run()) == ['manual', 'auto']
+
+
+def test_requests_per_minute_window():
+
+  async def run():
+    scheduler = LLMScheduler(LLMServiceType.OPENAI, 'm', rpm_limit=2, tpm_limit=0)
+    await scheduler.acquire(10, LLMRequestPriority.MANUAL)
+    await scheduler.acquire(10, LLMRequestPriority.MANUAL)
+    third = asyncio.create_task(scheduler.acquire(10, LLMRequestPriority.MANUAL))
+    await asyncio.sleep(0)
+    assert not third.done()
+    _expire_window(scheduler)
+    await third
+    return len(scheduler._window)
+
+  assert asyncio.run(run()) == 1
+
+
+def test_tokens_per_minute_window_settles_with_real_usage():
+
+  async def run():
+    scheduler = LLMScheduler(LLMServiceType.OPENAI, 'm', rpm_limit=0, tpm_limit=100)
+    first = await scheduler.acquire(60, LLMRequestPriority.MANUAL)
+    second = asyncio.create_task(scheduler.acquire(50, LLMRequestPriority.MANUAL))
+    await asyncio.sleep(0)
+    assert not second.done()
+    # the first call used less than estimated, the second one fits now
+    scheduler.settle(first, 30)
+    await second
+    return sum(r.tokens for r in scheduler._window)
+
+  assert asyncio.run(run()) == 80
+
+
+def test_cancelled_waiter_leaves_the_queue():
+
+  async def run():
+    scheduler = LLMScheduler(LLMServiceType.ANTHROPIC, 'm', rpm_limit=1, tpm_limit=0)
+    await scheduler.acquire(10, LLMRequestPriority.MANUAL)
+    waiter = asyncio.create_task(scheduler.acquire(10, LLMRequestPriority.AUTO))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    return scheduler._waiters
+
+  assert asyncio.run(run()) == []
+  assert runtime_metrics.value('panto_llm_queue_depth', provider=LLMServiceType.ANTHROPIC.value,
+                               model='m') == 0
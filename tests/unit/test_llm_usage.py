@@ -0,0 +1,32 @@
+from panto.ops.pr_review_actions import sum_llm_usages
+from panto.services.llm.llm_service import LLMCallTimer, LLMUsage
+
+
+def _usage(**timings) -> LLMUsage:
+  return LLMUsage(system_token=10, user_token=20, total_input_token=30, output_token=50,
+                  total_token=80, latency=0, **timings)
+
+
+def test_timer_splits_the_call():
+  timer = LLMCallTimer()
+  timer.token()
+  timer.token()
+  timings = timer.timings()
+  assert timings['latency'] == 0 and timings['started_at'] > 0
+  total = timings['ttft_ms'] + timings['generation_ms'] + timings['overhead_ms']
+  assert abs(total - timings['latency_ms']) < 1e-6
+
+
+def test_sum_keeps_timings():
+  first = _usage(started_at=200.0, latency_ms=1500, ttft_ms=400, generation_ms=1000,
+                 queue_ms=250)
+  second = _usage(started_at=100.0, latency_ms=500, ttft_ms=200, generation_ms=250)
+  net = sum_llm_usages([first, second])
+  assert net.calls == 2 and net.started_at == 100.0
+  assert net.latency_ms == 2000 and net.queue_ms == 250
+  assert net.mean_ttft_ms == 300
+  assert net.output_tokens_per_second == 100 / 1.25
+
+
+def test_unstreamed_answer_has_no_throughput():
+  assert _usage(latency_ms=800, ttft_ms=800).output_tokens_per_second is None
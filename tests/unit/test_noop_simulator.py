@@ -0,0 +1,38 @@
+import random
+
+from panto.ops.pr_review import parse_review_line
+from panto.services.llm.noopgpt import simulated_answer
+
+_REVIEW_PROMPT = """### Git diff attached below:
+
+### FILE PATH: app/models.py
+##CHANGE TYPE: MODIFIED
+## DIFF:
+\t\t@@ -10,3 +10,4 @@
+10\t10\t  def save(self):
+11\t\t- return None
+\t11\t+ return self.db.save(self)
+\t12\t+ # done
+
+### FILE PATH: app/views.py
+##CHANGE TYPE: MODIFIED
+## DIFF:
+\t\t@@ -3,1 +3,2 @@
+3\t3\t  import os
+\t4\t+ import sys
+"""
+
+
+def test_suggests_on_added_lines_of_the_prompt():
+  answer = simulated_answer(_REVIEW_PROMPT, random.Random(1), max_suggestions=3)
+  suggestions = [parse_review_line(line) for line in answer.split('\n')]
+  assert suggestions and all(s is not None for s in suggestions)
+  added = {('app/models.py', 11), ('app/models.py', 12), ('app/views.py', 4)}
+  assert {(s.file_path, s.start_line_number) for s in suggestions} <= added
+
+
+def test_answers_correction_and_unknown_prompts():
+  prompt = "0. app/models.py : 11 : check the value\n1. app/views.py : 4 : unused import\n"
+  lines = simulated_answer(prompt, random.Random(1), max_suggestions=3).split('\n')
+  assert [line.split(' : ')[:2] for line in lines] == [['0', 'VALID'], ['1', 'VALID']]
+  assert simulated_answer('### FILE 0: a.py', random.Random(1), 3) == '@no_issues_found@'
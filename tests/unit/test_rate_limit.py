@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import pytest
+
+from panto.services.git.rate_limit import RateLimitGovernor, RequestPriority
+from panto.services.metrics.runtime_metrics import runtime_metrics
+from panto.utils.http import RateLimitedError
+
+
+def test_observe_headers():
+  governor = RateLimitGovernor()
+  reset_at = int(time.time()) + 600
+  governor.observe('gh', {'X-RateLimit-Remaining': '42', 'X-RateLimit-Limit': '5000',
+                          'X-RateLimit-Reset': str(reset_at)})
+  budget = governor.get_budget('gh')
+  assert budget and budget.remaining == 42 and budget.limit == 5000 and budget.reset_at == reset_at
+
+  governor.observe('bb', {'X-RateLimit-Limit': '1000', 'X-RateLimit-NearLimit': 'true'})
+  assert governor.get_budget('bb').remaining == 200  # type: ignore
+  governor.observe('none', {})
+  assert governor.get_budget('none') is None
+
+
+def test_posting_uses_reserve_of_lower_priorities():
+  governor = RateLimitGovernor()
+  governor.record('gl', remaining=40, limit=1000, reset_at=time.time() + 3600)
+
+  async def run():
+    await governor.acquire('gl', RequestPriority.POSTING)
+    with pytest.raises(RateLimitedError):
+      await governor.acquire('gl', RequestPriority.OPTIONAL)
+    with pytest.raises(RateLimitedError):
+      await governor.acquire('gl', RequestPriority.NORMAL)
+
+  asyncio.run(run())
+  assert governor.get_budget('gl').remaining == 39  # type: ignore
+  assert runtime_metrics.value('panto_git_rate_limit_remaining', key='gl') == 39
+  assert 'panto_git_rate_limit_remaining{key="gl"} 39' in runtime_metrics.render()
+
+
+def test_optional_calls_fail_fast_without_budget():
+  governor = RateLimitGovernor()
+  governor.record('gh', remaining=100, limit=1000, reset_at=time.time() + 5)
+
+  async def run():
+    started_at = time.monotonic()
+    with pytest.raises(RateLimitedError):
+      await governor.acquire('gh', RequestPriority.OPTIONAL)
+    return time.monotonic() - started_at
+
+  assert asyncio.run(run()) < 1
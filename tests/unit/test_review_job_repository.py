@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from panto.models.review_job import ReviewJobModel
+from panto.repository.review_job import ReviewJobRepository
+
+pytest.importorskip('aiosqlite')
+
+
+class _Store:
+
+  def __init__(self, sessions):
+    self.sessions = sessions
+
+  async def __call__(self, method: str, *args):
+    async with self.sessions() as session:
+      return await getattr(ReviewJobRepository(session), method)(*args)
+
+  async def job(self, job_id: str) -> ReviewJobModel:
+    async with self.sessions() as session:
+      return await session.get(ReviewJobModel, job_id)
+
+
+def _with_store(tmp_path, steps):
+
+  async def run():
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'review_jobs.db'}")
+    async with engine.begin() as conn:
+      await conn.run_sync(ReviewJobModel.metadata.create_all, tables=[ReviewJobModel.__table__])
+    try:
+      await steps(_Store(async_sessionmaker(engine, expire_on_commit=False)))
+    finally:
+      await engine.dispose()
+
+  asyncio.run(run())
+
+
+def test_jobs_are_leased_to_one_worker(tmp_path):
+
+  async def steps(store):
+    job_id = await store('enqueue', 'github.pr_open', {'args': [1]})
+    [job] = await store('claim', 'a', 5, 300, 3)
+    assert (job.id, job.leased_by, job.attempts, job.status) == (job_id, 'a', 1, 'RUNNING')
+    assert await store('claim', 'b', 5, 300, 3) == []
+    assert await store('extend_lease', job_id, 'b', 300) is False
+    assert await store('extend_lease', job_id, 'a', 300) is True
+    await store('complete', job_id, 'b')
+    assert (await store.job(job_id)).status == 'RUNNING'
+    await store('complete', job_id, 'a')
+    job = await store.job(job_id)
+    assert (job.status, job.payload) == ('DONE', None)
+
+  _with_store(tmp_path, steps)
+
+
+def test_expired_leases_are_claimed_again(tmp_path):
+
+  async def steps(store):
+    job_id = await store('enqueue', 'github.pr_open', {'args': [1]})
+    await store('claim', 'a', 1, -1, 3)  # as if worker a stopped renewing the lease
+    [job] = await store('claim', 'b', 1, 300, 3)
+    assert (job.id, job.leased_by, job.attempts) == (job_id, 'b', 2)
+    # worker a finds out it lost the job and leaves its row alone
+    assert await store('extend_lease', job_id, 'a', 300) is False
+    await store('fail', job_id, 'a', 'boom', None)
+    job = await store.job(job_id)
+    assert (job.status, job.leased_by, job.error) == ('RUNNING', 'b', None)
+
+  _with_store(tmp_path, steps)
+
+
+def test_failed_jobs_wait_for_their_backoff(tmp_path):
+
+  async def steps(store):
+    later = await store('enqueue', 'github.pr_open', {'args': [1]})
+    await store('claim', 'a', 1, 300, 3)
+    await store('fail', later, 'a', 'boom', 3600)
+    job = await store.job(later)
+    assert (job.status, job.leased_by, job.error) == ('QUEUED', None, 'boom')
+
+    now = await store('enqueue', 'github.pr_open', {'args': [2]})
+    await store('claim', 'a', 1, 300, 3)
+    await store('fail', now, 'a', 'boom', 0)
+    [job] = await store('claim', 'b', 5, 300, 3)
+    assert (job.id, job.attempts) == (now, 2)
+    await store('fail', now, 'b', 'boom again', None)
+    job = await store.job(now)
+    assert (job.status, job.error, job.payload) == ('FAILED', 'boom again', None)
+
+  _with_store(tmp_path, steps)
+
+
+def test_released_jobs_dont_count_the_attempt(tmp_path):
+
+  async def steps(store):
+    job_id = await store('enqueue', 'github.pr_open', {'args': [1]})
+    await store('claim', 'a', 1, 300, 3)
+    await store('release', job_id, 'a')
+    [job] = await store('claim', 'b', 1, 300, 3)
+    assert (job.id, job.leased_by, job.attempts) == (job_id, 'b', 1)
+
+  _with_store(tmp_path, steps)
+
+
+def test_posted_jobs_are_not_run_again(tmp_path):
+
+  async def steps(store):
+    job_id = await store('enqueue', 'github.pr_open', {'args': [1]})
+    await store('claim', 'a', 1, -1, 3)
+    await store('mark_posted', job_id, 'a')
+    assert await store('claim', 'b', 1, 300, 3) == []
+    job = await store.job(job_id)
+    assert (job.status, job.posted, job.attempts) == ('DONE', True, 1)
+
+  _with_store(tmp_path, steps)
+
+
+def test_expired_jobs_out_of_attempts_fail(tmp_path):
+
+  async def steps(store):
+    job_id = await store('enqueue', 'github.pr_open', {'args': [1]})
+    for worker in 'abc':
+      [job] = await store('claim', worker, 1, -1, 3)  # each worker dies while running it
+    assert job.attempts == 3
+    assert await store('claim', 'd', 1, 300, 3) == []
+    job = await store.job(job_id)
+    assert (job.status, job.leased_by, job.error) == ('FAILED', None, 'lease expired')
+    assert job.payload is None
+
+  _with_store(tmp_path, steps)
+
+
+def test_finished_jobs_are_purged_after_retention(tmp_path):
+
+  async def steps(store):
+    done = await store('enqueue', 'github.pr_open', {'args': [1]})
+    await store('claim', 'a', 1, 300, 3)
+    await store('complete', done, 'a')
+    queued = await store('enqueue', 'github.pr_open', {'args': [2]})
+    assert await store('purge_finished', 3600) == 0
+    assert await store('purge_finished', -1) == 1  # as if an hour had passed
+    assert await store.job(done) is None
+    assert (await store.job(queued)).status == 'QUEUED'
+
+  _with_store(tmp_path, steps)
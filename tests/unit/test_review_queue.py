@@ -0,0 +1,81 @@
+import asyncio
+
+from panto.config import REVIEW_QUEUE_MAX_ATTEMPTS, REVIEW_QUEUE_RETRY_DELAY
+from panto.ops import review_queue
+from panto.ops.pr_review import LargeTokenException
+from panto.ops.review_queue import ReviewJobQueue, is_transient_job_error, retry_delay
+from panto.utils.http import RateLimitedError
+
+
+def test_retries_back_off_until_out_of_attempts():
+  assert retry_delay(1) == REVIEW_QUEUE_RETRY_DELAY
+  if REVIEW_QUEUE_MAX_ATTEMPTS > 2:
+    assert retry_delay(2) == 2 * REVIEW_QUEUE_RETRY_DELAY
+  assert retry_delay(REVIEW_QUEUE_MAX_ATTEMPTS) is None
+
+
+def test_jobs_run_in_process_without_store():
+  queue = ReviewJobQueue()
+  done = []
+
+  @queue.job('test.review')
+  async def review(pr_no, repo_url):
+    done.append((pr_no, repo_url))
+
+  async def enqueue():
+    job_id = await queue.enqueue(review, 7, 'https://github.com/org/repo')
+    await asyncio.gather(*queue._inline_tasks)
+    return job_id
+
+  assert asyncio.run(enqueue()) is None
+  assert done == [(7, 'https://github.com/org/repo')]
+
+
+def test_jobs_with_unstorable_args_run_in_process():
+  queue = ReviewJobQueue()
+  queue._db = object()  # type: ignore[assignment]  # a store enqueue must not touch
+  done = []
+
+  @queue.job('test.review')
+  async def review(token):
+    done.append(token)
+
+  async def enqueue():
+    job_id = await queue.enqueue(review, 'secret', in_process=True)
+    await asyncio.gather(*queue._inline_tasks)
+    return job_id
+
+  assert asyncio.run(enqueue()) is None
+  assert done == ['secret']
+
+
+class _HTTPError(Exception):
+
+  def __init__(self, status):
+    super().__init__(f"HTTP {status}")
+    self.status = status
+
+
+def test_only_transient_errors_are_retried():
+  assert is_transient_job_error(TimeoutError())
+  assert is_transient_job_error(RateLimitedError('slow down', retry_after=None))
+  assert is_transient_job_error(_HTTPError(502))
+  assert not is_transient_job_error(_HTTPError(401))
+  assert not is_transient_job_error(LargeTokenException(required_token=10, max_budget_token=5))
+  assert not is_transient_job_error(KeyError('pull_request'))
+
+
+def test_run_time_leaves_out_batch_waits(monkeypatch):
+  now = [100.0]
+  monkeypatch.setattr(review_queue.time, 'monotonic', lambda: now[0])
+  run = review_queue._JobRun('job', started=100.0)
+  now[0] = 110.0
+  run.on_batch_wait(True)
+  run.on_batch_wait(True)  # two calls of the review wait for the same batch
+  now[0] = 5000.0
+  assert run.waiting and run.run_time() == 10.0
+  run.on_batch_wait(False)
+  assert run.waiting
+  run.on_batch_wait(False)
+  now[0] = 5005.0
+  assert not run.waiting and run.run_time() == 15.0
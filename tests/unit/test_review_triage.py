@@ -0,0 +1,54 @@
+from panto.data_models.git import GitPatchFile, GitPatchStatus
+from panto.ops.misc import GitReviewFile
+from panto.ops.review_triage import TriageDecision, heuristic_triage
+
+
+def _review_file(filename: str, patch: str,
+                 status: GitPatchStatus = GitPatchStatus.MODIFIED) -> GitReviewFile:
+  patchfile = GitPatchFile(filename=filename, status=status, patch=patch)
+  return GitReviewFile(filename=filename, content='', patchfile=patchfile)
+
+
+def test_heuristic_triage():
+  trivial = TriageDecision.TRIVIAL
+  assert heuristic_triage(_review_file('README.md', '@@ -1 +1 @@\n-a\n+b')) == (trivial, 'docs')
+  assert heuristic_triage(_review_file('a.py', '', GitPatchStatus.REMOVED)) == (trivial, 'deleted')
+  reindented = '@@ -1,2 +1,2 @@\n-if (x) {\n-  y();\n+if (x) {\n+    y();'
+  assert heuristic_triage(_review_file('a.ts', reindented)) == (trivial, 'whitespace')
+  commented = '@@ -1 +1,2 @@\n-// old note\n+// new note\n+/* more */'
+  assert heuristic_triage(_review_file('a.ts', commented)) == (trivial, 'comments')
+  in_block = '@@ -1,3 +1,4 @@\n /**\n- * old note\n+ * new note\n+ * more\n */'
+  assert heuristic_triage(_review_file('a.ts', in_block)) == (trivial, 'comments')
+  assert heuristic_triage(_review_file('a.py', '@@ -1 +1 @@\n-# a\n+# b')) == (trivial, 'comments')
+
+  include = '@@ -1 +1 @@\n-#include <a.h>\n+#include <b.h>'
+  assert heuristic_triage(_review_file('a.c', include)) is None
+  assert heuristic_triage(_review_file('a.py', '@@ -1 +1 @@\n-x = 1\n+x = 2')) is None
+
+
+def test_whitespace_shortcut_keeps_real_changes():
+  swapped = '@@ -1,2 +1,2 @@\n-lock.acquire();\n write();\n+lock.acquire();'
+  assert heuristic_triage(_review_file('a.c', swapped)) is None
+  dedented = '@@ -1,2 +1,2 @@\n if force:\n-  delete_all()\n+delete_all()'
+  assert heuristic_triage(_review_file('a.py', dedented)) is None
+  in_string = '@@ -1 +1 @@\n-run("rm -rf /tmp/x");\n+run("rm -rf / tmp/x");'
+  assert heuristic_triage(_review_file('a.js', in_string)) is None
+  merged_words = '@@ -1 +1 @@\n-return x;\n+returnx;'
+  assert heuristic_triage(_review_file('a.js', merged_words)) is None
+
+
+def test_txt_files_are_docs_by_name_only():
+  patch = '@@ -1 +1 @@\n-a==1\n+a==2'
+  assert heuristic_triage(_review_file('requirements.txt', patch)) is None
+  assert heuristic_triage(_review_file('CMakeLists.txt', patch)) is None
+  license_txt = heuristic_triage(_review_file('docs/LICENSE.txt', patch))
+  assert license_txt == (TriageDecision.TRIVIAL, 'docs')
+
+
+def test_comment_shortcut_keeps_real_changes():
+  continuation = '@@ -1,2 +1,2 @@\n total = (price\n-    * quantity)\n+    * discount)'
+  assert heuristic_triage(_review_file('a.py', continuation)) is None
+  commented_out = '@@ -1 +1,3 @@\n+/*\n delete_all();\n+*/'
+  assert heuristic_triage(_review_file('a.c', commented_out)) is None
+  code_after_comment = '@@ -1 +1 @@\n-/* x */ a = 1;\n+/* x */ a = 2;'
+  assert heuristic_triage(_review_file('a.c', code_after_comment)) is None
@@ -0,0 +1,103 @@
+import asyncio
+
+from panto.data_models.git import PRPatches
+from panto.data_models.pr_review import Suggestion
+from panto.data_models.review_config import ReviewConfig
+from panto.ops.pr_review import PRReview, SuggestionStreamParser
+from panto.services.llm.noopgpt import NoopGPTService
+from panto.services.notification.noop import NoopNotificationService
+
+
+def test_suggestions_emitted_per_completed_line():
+  parser = SuggestionStreamParser()
+  assert parser.feed("src/a.py : 1") == []
+  emitted = parser.feed("2 : Avoid the global\nsrc/b.py : 3-5 : Close the ")
+  assert [(s.file_path, s.start_line_number, s.suggestion) for s in emitted] == [
+    ('src/a.py', 12, 'Avoid the global'),
+  ]
+  assert parser.feed("file\n@no_issues_found@\n")[0].end_line_number == 5
+  assert parser.feed("src/c.py : - : Add a test") == []
+  [last] = parser.close()
+  assert (last.file_path, last.start_line_number) == ('src/c.py', -1)
+  assert last.suggestion == 'Add a test'
+  assert parser.close() == []
+
+
+def test_stream_falls_back_to_whole_answer():
+  stream = NoopGPTService().stream('system', 'user')
+
+  async def collect():
+    return [text async for text in stream]
+
+  assert asyncio.run(collect()) == ["random_file : -1 : @no_issues_found@"]
+  assert stream.usage is not None and stream.text == "random_file : -1 : @no_issues_found@"
+
+
+def _suggestion(file_path: str, text: str) -> Suggestion:
+  return Suggestion(file_path=file_path, start_line_number=1, end_line_number=1, suggestion=text)
+
+
+def _review() -> PRReview:
+  review = PRReview(repo_name='org/repo',
+                    pr_no=1,
+                    gitsrv=None,
+                    llmsrv=NoopGPTService(),
+                    notification_srv=NoopNotificationService(),
+                    review_config=ReviewConfig())
+  review.pr_patches = PRPatches(url=None, number=1, base='a' * 40, head='b' * 40, files=[])
+  return review
+
+
+def test_chunks_are_corrected_while_the_next_one_streams():
+  review = _review()
+  events = []
+
+  async def stream_suggestions(review_usages):
+    for chunk in ('a.py', 'b.py', 'a.py'):
+      yield [_suggestion(chunk, chunk)], None
+      yield [], {chunk}
+      await asyncio.sleep(0.01)
+      events.append(f"streamed {chunk}")
+
+  async def refine_suggestions(suggestions):
+    events.append(f"correcting {[s.file_path for s in suggestions]}")
+    return (suggestions, [], []), None
+
+  review.stream_suggestions = stream_suggestions
+  review._refine_suggestions = refine_suggestions
+  prsuggestions, unfiltered, _, _ = asyncio.run(review.get_suggetions())
+
+  assert events[:3] == ["correcting ['a.py']", "streamed a.py", "correcting ['b.py']"]
+  # the repeated suggestion is dropped, there is nothing left to correct in the last chunk
+  assert "correcting []" not in events
+  assert [s.file_path for s in prsuggestions.suggestions] == ['a.py', 'b.py']
+  assert len(unfiltered) == 3
+
+
+def test_tool_suggestions_are_corrected_with_their_file():
+  review = _review()
+  corrections = []
+
+  async def stream_suggestions(review_usages):
+    yield [_suggestion('a.py', 'llm a1')], None
+    yield [_suggestion('a.py', 'llm a1'), _suggestion('a.py', 'llm a2')], None
+    yield [], {'a.py', 'b.py'}
+    yield [_suggestion('c.py', 'llm c')], {'c.py'}
+
+  async def timed_suggestions_from_tools():
+    tools = [_suggestion('a.py', 'tool a'), _suggestion('d.py', 'tool d')]
+    return tools, 0.0
+
+  async def refine_suggestions(suggestions):
+    corrections.append([s.suggestion for s in suggestions])
+    return (suggestions, [], []), None
+
+  review.stream_suggestions = stream_suggestions
+  review._timed_suggestions_from_tools = timed_suggestions_from_tools
+  review._refine_suggestions = refine_suggestions
+  prsuggestions, unfiltered, _, _ = asyncio.run(review.get_suggetions())
+
+  # one correction prompt per file sees the llm and the tool suggestions of that file
+  assert corrections == [['llm a1', 'llm a2', 'tool a'], ['llm c'], ['tool d']]
+  assert len(prsuggestions.suggestions) == 5
+  assert len(unfiltered) == 6
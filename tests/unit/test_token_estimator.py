@@ -0,0 +1,58 @@
+import asyncio
+
+from panto.data_models.review_config import ReviewConfig
+from panto.ops.pr_review import PRReview
+from panto.services.llm.noopgpt import NoopGPTService
+from panto.services.llm.token_estimator import TokenEstimate, TokenEstimator, get_token_estimator
+from panto.services.notification.noop import NoopNotificationService
+
+
+def test_estimate_band():
+  estimator = TokenEstimator(bytes_per_token=4, relative_error=0.25)
+  estimate = estimator.estimate("x" * 400)
+  assert (estimate.low, estimate.tokens, estimate.high) == (75, 100, 125)
+  # never more than one token per byte
+  assert estimator.estimate("é").high == 2
+  assert estimator.estimate("").is_exact
+  assert get_token_estimator("unknown-family").relative_error > 0
+
+
+def test_below_only_decides_outside_band():
+  estimate = TokenEstimate(tokens=100, low=80, high=120)
+  assert estimate.below(121) is True
+  assert estimate.below(80) is False
+  assert estimate.below(100) is None
+  assert TokenEstimate.exactly(100).below(100) is False
+  total = estimate + TokenEstimate.exactly(10)
+  assert (total.low, total.tokens, total.high) == (90, 110, 130)
+
+
+def _review(monkeypatch, max_budget_token=None) -> PRReview:
+  review = PRReview(repo_name='org/repo',
+                    pr_no=1,
+                    gitsrv=None,
+                    llmsrv=NoopGPTService(max_tokens=1000, simulate=False),
+                    notification_srv=NoopNotificationService(),
+                    review_config=ReviewConfig(),
+                    max_budget_token=max_budget_token)
+  monkeypatch.setattr(review, '_build_review_prompt', lambda files, config:
+                      ('s' * 100, ''.join(f * 600 for f in files)))
+
+  async def get_encode_length(text):
+    return len(text)
+
+  monkeypatch.setattr(review.llmsrv, 'get_encode_length', get_encode_length)
+  # a band that is off for this text: ten times the real count
+  monkeypatch.setattr(review.llmsrv, 'estimate_tokens',
+                      lambda text: TokenEstimate.exactly(10 * len(text)))
+  return review
+
+
+def test_only_exact_counts_reject_a_pr(monkeypatch):
+  review = _review(monkeypatch, max_budget_token=1000)
+  assert asyncio.run(review._split_review_files(['a'])) == ([['a']], [800])
+
+
+def test_only_exact_counts_skip_a_file(monkeypatch):
+  review = _review(monkeypatch)
+  assert asyncio.run(review._split_review_files(['a', 'b'])) == ([['a'], ['b']], [800, 800])